@@ -91,6 +91,11 @@ PROGMEM prog_uint16_t exp_table_blue[] =
 // The character that indicates new data has been received.
 //  (This is effectively a 'sync' pulse)
 # define CMD_NEW_DATA 1
+// The character that, in place of the first byte of a module's data, means
+//  the module has not changed since the last frame. The module keeps what it
+//  is showing and relays everything after it to the next module.
+//  (The controller never sends 255 as data, it sends 254 instead)
+# define CMD_REPEAT 0xFF
 
 // Module size constants
 
@@ -379,6 +384,11 @@ ISR(USART_RX_vect)
     UDR0=b; 
     return;
   }
+  // If the first byte of our data says that nothing has changed, keep showing
+  //  what we have got, and relay the rest of the frame to the next module
+  else if (pos == BUFFER_SIZE && b == CMD_REPEAT) {
+    pos = 0;
+  }
   // If we are still filling up our buffer, then store the data and keep track of how many
   //  piece of data we have had (so that we know when to stop)
   else {
@@ -97,8 +97,12 @@ import inspect
 
 # Dance Floor library classes
 from lib.layout import DisplayLayout
-from lib.floorcanvas import FloorCanvas
+from lib.calibration import FloorCalibration
+from lib.power import PowerLimiter
+from lib.floorcanvas import FloorCanvas, create_canvas
+from lib.framebuffer import FrameBufferPool, DoubleBuffer
 from lib.output import GuiOutput, SerialOutput, PipeOutput
+from lib.wiretime import check_frame_rate, get_frame_rate
 from lib.playlist import PluginPlaylistModel
 from lib.controllers import ControllerInput
 from lib.menu import Menu
@@ -218,9 +222,18 @@ class DDRPiMaster():
         # Parse the floor layout
         layout = DisplayLayout(config)
         converter = layout.get_converter()
-
-        # Create a suitably sized canvas for the given config
-        canvas = FloorCanvas(layout.size_x, layout.size_y)
+        # Per module colour calibration, if there is any in the config
+        calibration = FloorCalibration.from_config(config, layout)
+
+        # Create a pool of suitably sized canvases for the given config, stored
+        #  however the config asks for (a list of lists unless told otherwise).
+        # Frames are drawn on the back buffer, and sent from the front one
+        canvas_storage = None
+        try:
+            canvas_storage = config["system"]["canvas_storage"]
+        except (KeyError, TypeError):
+            pass
+        frame_buffers = DoubleBuffer(FrameBufferPool(layout.size_x, layout.size_y, canvas_storage))
 
         # Create a menu object to handle user input
         menu = Menu()
@@ -251,7 +264,9 @@ class DDRPiMaster():
                     self.logger.info("Creating a SerialOutput class")
                     serial_output = SerialOutput(details)
                     serial_output.set_name("SerialOutput-#%d" % output_number)
-                    serial_output.set_output_converter(converter)
+                    serial_output.set_layout(layout)
+                    serial_output.set_calibration(calibration)
+                    serial_output.set_power_limiter(PowerLimiter.from_config(config, layout))
                     for output_filter in output_filters:
                         serial_output.append_filter(output_filter)
                     output_devices.append(serial_output)
@@ -267,10 +282,16 @@ class DDRPiMaster():
                     self.logger.info("Creating a PipeOutput class")
                     pipe_output = PipeOutput(details)
                     pipe_output.set_output_converter(converter)
+                    pipe_output.set_calibration(calibration)
+                    pipe_output.set_power_limiter(PowerLimiter.from_config(config, layout))
                     output_devices.append(pipe_output)
                 else:
                     self.logger.warn("I don't know how to handle an output of type '%s'" % (details["type"]))
 
+        # Warn if the serial links can't send frames as fast as they're drawn
+        frame_rate = get_frame_rate(config)
+        check_frame_rate(config, frame_rate, self.logger)
+
         # Initialise any connected joypads/joysticks
         controllers = self.init_joysticks()
 
@@ -394,6 +415,9 @@ class DDRPiMaster():
         # Check for pygame events, primarily coming from
         #  gamepads and the keyboard
 
+        # The canvas the last frame came from, if it wasn't the back buffer
+        last_frame_source = None
+
         running = True
         while running:
 
@@ -437,6 +461,12 @@ class DDRPiMaster():
                     if e is None:
                         continue
 
+            # Draw on the back buffer, which is given a copy of the last frame
+            #  unless the plugin is going to draw over all of it anyway
+            preserve = (menu.is_in_menu() or current_plugin is None or
+                        not getattr(current_plugin.instance, "redraws_whole_frame", False))
+            canvas = frame_buffers.get_back(preserve)
+
             # Ask the framework if it thinks it is displaying something
             # display_frame = self.draw_frame(canvas)
             # Ask the menu if it wants to draw something
@@ -471,12 +501,36 @@ class DDRPiMaster():
                 canvas.set_colour((0, 0, 0))
                 display_frame = canvas
 
+            # Damage is worked out against the last frame on the same canvas
+            #  (the back buffers all share theirs), so when the frame comes
+            #  from a different canvas to last time, e.g. one a plugin keeps
+            #  itself, everything counts as having changed
+            frame_source = None if display_frame is canvas else display_frame
+            if frame_source is not last_frame_source:
+                display_frame.mark_damaged()
+            last_frame_source = frame_source
+
+            # Work out what changed, so the outputs can skip frames, or parts
+            #  of frames, that are the same as last time
+            display_frame.end_frame()
+
+            # Hand the finished frame over to the front buffer, and carry on
+            #  with the next frame on the back buffer
+            if display_frame is canvas:
+                display_frame = frame_buffers.swap()
+
             for output_device in output_devices:
                 output_device.send_data(display_frame)
 
             # Limit the framerate, we need not do it in the plugins - they really shouldn't
-            #  mind that we are running at a max of 25fps
-            self.clock.tick(25)
+            #  mind that we are running at a max of 25fps (unless the config says otherwise)
+            self.clock.tick(frame_rate)
+
+        # Let the outputs finish sending and close their ports, the writer
+        #  threads would otherwise be stopped part way through
+        for output_device in output_devices:
+            if hasattr(output_device, "close"):
+                output_device.close()
 
         pygame.quit()
         exit()
@@ -0,0 +1,81 @@
+import logging
+
+import numpy
+import pygame
+
+from VisualisationPlugin import VisualisationPlugin
+from lib.fields import field_cache
+
+
+class ShaderVisualisationPlugin(VisualisationPlugin):
+    logger = logging.getLogger(__name__)
+
+    """
+    A visualisation plugin where the colour of every cell is a function of
+     where it is and the time, like a pixel shader.
+
+    Rather than looping over the cells, the plugin implements shade(), which
+     is given the x and y coordinates of every cell as (width, height) arrays
+     and returns the colours for all of them at once, which are written to
+     the canvas in one go. Anything the shader can do as whole array
+     operations then costs much the same however big the floor is.
+    """
+
+    # The colour space that shade() returns its colours in, "RGB", "HSV" or
+    #  "HLS", as floats in [0, 1] (or 0-255 ints for RGB)
+    colour_format = "RGB"
+
+    # The frame rate to limit draw_frame() to
+    frame_rate = 25
+
+    # Every cell is shaded every frame
+    redraws_whole_frame = True
+
+    def __init__(self):
+        self.clock = pygame.time.Clock()
+        self.size = None
+
+    def draw_frame(self, canvas):
+        # Limit the frame rate.
+        # This sleeps so that at least 1/frame_rate seconds have passed
+        #  since tick() was last called. It is a no-op if the loop is running slow
+        self.clock.tick(self.frame_rate)
+        return self.draw_surface(canvas, pygame.time.get_ticks())
+
+    def draw_splash(self, canvas):
+        return self.draw_surface(canvas, 0)
+
+    def draw_surface(self, canvas, t):
+        self.size = canvas.get_size()
+        (x, y) = field_cache.grid(*self.size)
+        colours = numpy.asarray(self.shade(x, y, t))
+        # Let shaders return a single colour, or a field that doesn't vary in
+        #  one direction, and spread it over the whole floor
+        if colours.shape != self.size + (3,):
+            colours = numpy.broadcast_to(colours, self.size + (3,))
+        canvas.set_pixels(colours, format=self.colour_format)
+        return canvas
+
+    """
+    Return the colour of every cell at time t (in ms), as a (width, height, 3)
+     array in colour_format, given the x and y coordinates of the cells as
+     (width, height) arrays. The coordinate arrays are shared, so don't
+     change them.
+    """
+
+    def shade(self, x, y, t):
+        raise NotImplementedError()
+
+    """
+    Helpers for shaders, using the shared field cache, so a centre that
+     doesn't move isn't worked out again every frame. A centre that does
+     move should say so, and gets a field that is only good for this frame
+    """
+
+    # The distance of every cell from a point
+    def distance_from(self, centre_x, centre_y, moving=False):
+        return field_cache.distance(self.size[0], self.size[1], centre_x, centre_y, moving)
+
+    # The angle of every cell around a point, in the range [-pi, pi]
+    def angle_around(self, centre_x, centre_y, moving=False):
+        return field_cache.angle(self.size[0], self.size[1], centre_x, centre_y, moving)
@@ -4,6 +4,10 @@ import logging
 class VisualisationPlugin(object):
     logger = logging.getLogger(__name__)
 
+    # Plugins that draw every cell of every frame can set this, so the canvas
+    #  they are given isn't first filled in with a copy of the last frame
+    redraws_whole_frame = False
+
     """
     Called just before starting a plugin
     """
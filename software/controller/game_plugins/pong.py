@@ -6,6 +6,7 @@ import pygame.time
 import random
 from DDRPi import FloorCanvas
 from GamePlugin import GamePlugin
+from lib.sprites import Sprite
 from pygame.locals import *
 
 
@@ -16,26 +17,18 @@ class PongGamePlugin(GamePlugin):
     1: 'player2'
     }
 
+    # Score digits, 3x5 sprites drawn in the colour for the score
     __numbers__ = {
-    0: lambda (x, y): [(x, y), (x, y + 1), (x, y + 2), (x, y + 3), (x, y + 4), (x + 1, y), (x + 1, y + 4), (x + 2, y),
-                       (x + 2, y + 1), (x + 2, y + 2), (x + 2, y + 3), (x + 2, y + 4)],
-    1: lambda (x, y): [(x, y + 1), (x, y + 4), (x + 1, y), (x + 1, y + 1), (x + 1, y + 2), (x + 1, y + 3),
-                       (x + 1, y + 4), (x + 2, y + 4)],
-    2: lambda (x, y): [(x, y), (x, y + 2), (x, y + 3), (x, y + 4), (x + 1, y), (x + 1, y + 2), (x + 1, y + 4),
-                       (x + 2, y), (x + 2, y + 1), (x + 2, y + 2), (x + 2, y + 4)],
-    3: lambda (x, y): [(x, y), (x, y + 4), (x + 1, y), (x + 1, y + 2), (x + 1, y + 4), (x + 2, y), (x + 2, y + 1),
-                       (x + 2, y + 2), (x + 2, y + 3), (x + 2, y + 4)],
-    4: lambda (x, y): [(x, y), (x, y + 1), (x, y + 2), (x + 1, y + 2), (x + 2, y), (x + 2, y + 1), (x + 2, y + 2),
-                       (x + 2, y + 3), (x + 2, y + 4)],
-    5: lambda (x, y): [(x, y), (x, y + 1), (x, y + 2), (x, y + 4), (x + 1, y), (x + 1, y + 2), (x + 1, y + 4),
-                       (x + 2, y), (x + 2, y + 2), (x + 2, y + 3), (x + 2, y + 4)],
-    6: lambda (x, y): [(x, y), (x, y + 1), (x, y + 2), (x, y + 3), (x, y + 4), (x + 1, y), (x + 1, y + 2),
-                       (x + 1, y + 4), (x + 2, y), (x + 2, y + 2), (x + 2, y + 3), (x + 2, y + 4)],
-    7: lambda (x, y): [(x, y), (x + 1, y), (x + 2, y), (x + 2, y + 1), (x + 2, y + 2), (x + 2, y + 3), (x + 2, y + 4)],
-    8: lambda (x, y): [(x, y), (x, y + 1), (x, y + 2), (x, y + 3), (x, y + 4), (x + 1, y), (x + 1, y + 2),
-                       (x + 1, y + 4), (x + 2, y), (x + 2, y + 1), (x + 2, y + 2), (x + 2, y + 3), (x + 2, y + 4)],
-    9: lambda (x, y): [(x, y), (x, y + 1), (x, y + 2), (x + 1, y), (x + 1, y + 2), (x + 2, y), (x + 2, y + 1),
-                       (x + 2, y + 2), (x + 2, y + 3), (x + 2, y + 4)]
+    0: Sprite.from_strings(["###", "#.#", "#.#", "#.#", "###"]),
+    1: Sprite.from_strings([".#.", "##.", ".#.", ".#.", "###"]),
+    2: Sprite.from_strings(["###", "..#", "###", "#..", "###"]),
+    3: Sprite.from_strings(["###", "..#", ".##", "..#", "###"]),
+    4: Sprite.from_strings(["#.#", "#.#", "###", "..#", "..#"]),
+    5: Sprite.from_strings(["###", "#..", "###", "..#", "###"]),
+    6: Sprite.from_strings(["###", "#..", "###", "#.#", "###"]),
+    7: Sprite.from_strings(["###", "..#", "..#", "..#", "..#"]),
+    8: Sprite.from_strings(["###", "#.#", "###", "#.#", "###"]),
+    9: Sprite.from_strings(["###", "#.#", "###", "..#", "..#"])
     }
 
     def configure(self, config):
@@ -470,24 +463,21 @@ class PongGamePlugin(GamePlugin):
         psy = h / 2 - 3
 
         p1_score = self.game_state['player1']['score']
-        p1_score_pixels = PongGamePlugin.__numbers__[p1_score]((p1sx, psy))
         p2_score = self.game_state['player2']['score']
-        p2_score_pixels = PongGamePlugin.__numbers__[p2_score]((p2sx, psy))
 
         white = (255, 255, 255)
         red = (255, 0, 0)
 
-        for (x, y) in p1_score_pixels:
-            if p2_score == 9:
-                canvas.set_pixel(x, y, red)
-            else:
-                canvas.set_pixel(x, y, white)
+        # A score goes red when the other player is about to win
+        p1_colour = white
+        if p2_score == 9:
+            p1_colour = red
+        p2_colour = white
+        if p1_score == 9:
+            p2_colour = red
 
-        for (x, y) in p2_score_pixels:
-            if p1_score == 9:
-                canvas.set_pixel(x, y, red)
-            else:
-                canvas.set_pixel(x, y, white)
+        canvas.blit_sprite(PongGamePlugin.__numbers__[p1_score], p1sx, psy, p1_colour)
+        canvas.blit_sprite(PongGamePlugin.__numbers__[p2_score], p2sx, psy, p2_colour)
 
         return canvas
 
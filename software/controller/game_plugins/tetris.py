@@ -8,6 +8,7 @@ from pygame.locals import *
 
 from DDRPi import FloorCanvas
 from GamePlugin import GamePlugin
+from lib.sprites import Sprite
 
 
 class TetrisGamePlugin(GamePlugin):
@@ -73,6 +74,10 @@ class TetrisGamePlugin(GamePlugin):
 
     __orientations__ = ['N', 'E', 'S', 'W']
 
+    # Every tetromino in every orientation as a sprite, keyed by (shape,
+    #  orientation), for drawing them. Built once, below the class
+    __tetromino_sprites__ = None
+
     # Static map from joystick axis information to direction delta
     __delta__ = {
     1: {
@@ -685,25 +690,20 @@ class TetrisGamePlugin(GamePlugin):
         p2_blocks = self.game_state['player2']['blocks']
         p2_blocks = map(lambda ((x, y), c): ((x + p2xtl, y + p2ytl), c), p2_blocks)
 
-        # Draw the current tetrominos
-        (p1_x, p1_y) = self.game_state['player1']['current_tetromino_pos']
-        p1_o = TetrisGamePlugin.__orientations__[self.game_state['player1']['current_orientation']]
-        (p2_x, p2_y) = self.game_state['player2']['current_tetromino_pos']
-        p2_o = TetrisGamePlugin.__orientations__[self.game_state['player2']['current_orientation']]
-
-        p1_shape = self.game_state['player1']['current_tetromino'](p1_o, p1_x, p1_y)
-        p1_shape_name = self.game_state['player1']['current_tetromino_shape']
-        p1_shape_blocks = map(lambda x: (x, TetrisGamePlugin.__block_colours__[p1_shape_name]), p1_shape)
-        p1_shape_blocks = map(lambda ((x, y), c): ((x + p1xtl, y + p1ytl), c), p1_shape_blocks)
-        p2_shape = self.game_state['player2']['current_tetromino'](p2_o, p2_x, p2_y)
-        p2_shape_name = self.game_state['player2']['current_tetromino_shape']
-        p2_shape_blocks = map(lambda x: (x, TetrisGamePlugin.__block_colours__[p2_shape_name]), p2_shape)
-        p2_shape_blocks = map(lambda ((x, y), c): ((x + p2xtl, y + p2ytl), c), p2_shape_blocks)
-
-        for ((bx, by), c) in p1_blocks + p1_shape_blocks + p2_blocks + p2_shape_blocks:
+        for ((bx, by), c) in p1_blocks + p2_blocks:
             if by >= p1ytl:
                 canvas.set_pixel(bx, by, c)
 
+        # Draw the current tetrominos, clipped to the game areas so that they
+        #  are hidden until they drop in from the top
+        for (player, (xtl, ytl)) in [('player1', p1tl), ('player2', p2tl)]:
+            (x, y) = self.game_state[player]['current_tetromino_pos']
+            orientation = TetrisGamePlugin.__orientations__[self.game_state[player]['current_orientation']]
+            shape_name = self.game_state[player]['current_tetromino_shape']
+            sprite = TetrisGamePlugin.__tetromino_sprites__[(shape_name, orientation)]
+            clip = (xtl, ytl, xtl + self.game_width, ytl + self.game_height)
+            canvas.blit_sprite(sprite, x + xtl, y + ytl, TetrisGamePlugin.__block_colours__[shape_name], clip=clip)
+
         return canvas
 
     def draw_splash(self, canvas):
@@ -719,15 +719,8 @@ class TetrisGamePlugin(GamePlugin):
         p2br = (p2xtl + self.game_width - 1, p2ytl + self.game_height - 1)
         canvas.draw_box(p2tl, p2br, (0, 0, 0))
 
-        p1_shape = TetrisGamePlugin.__tetrominos__['L']('N', 3, 4)
-        p1_blocks = map(lambda x: (x, (255, 255, 255)), p1_shape)
-        p1_blocks = map(lambda ((x, y), c): ((x + p1xtl, y + p1ytl), c), p1_blocks)
-        p2_shape = TetrisGamePlugin.__tetrominos__['I']('W', 2, 8)
-        p2_blocks = map(lambda x: (x, (0, 255, 0)), p2_shape)
-        p2_blocks = map(lambda ((x, y), c): ((x + p2xtl, y + p2ytl), c), p2_blocks)
-
-        for ((bx, by), c) in p1_blocks + p2_blocks:
-            canvas.set_pixel(bx, by, c)
+        canvas.blit_sprite(TetrisGamePlugin.__tetromino_sprites__[('L', 'N')], p1xtl + 3, p1ytl + 4, (255, 255, 255))
+        canvas.blit_sprite(TetrisGamePlugin.__tetromino_sprites__[('I', 'W')], p2xtl + 2, p2ytl + 8, (0, 255, 0))
 
         return canvas
 
@@ -746,3 +739,8 @@ class TetrisGamePlugin(GamePlugin):
                 if not (x, y) in block_positions:
                     new_blocks.append(((x, y), self.__other_colours__["fill_dead"]))
         self.game_state[player]['blocks'] = new_blocks
+
+
+TetrisGamePlugin.__tetromino_sprites__ = dict(
+    ((shape, orientation), Sprite.from_points(TetrisGamePlugin.__tetrominos__[shape](orientation, 0, 0)))
+    for shape in TetrisGamePlugin.__tetrominos__ for orientation in TetrisGamePlugin.__orientations__)
@@ -0,0 +1,49 @@
+__authors__ = ['Andrew Taylor']
+
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    # A dictionary with a maximum size, which forgets the least recently
+    #  used entry when it gets full. Used for things that are expensive to
+    #  work out but are asked for again and again (fields, rendered text)
+
+    def __init__(self, size=64):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def clear(self):
+        self.entries.clear()
+
+    def get(self, key, default=None):
+        if key not in self.entries:
+            self.misses += 1
+            return default
+        self.hits += 1
+        # Move it to the end, as the most recently used
+        value = self.entries.pop(key)
+        self.entries[key] = value
+        return value
+
+    def put(self, key, value):
+        if key in self.entries:
+            del self.entries[key]
+        elif len(self.entries) >= self.size:
+            self.entries.popitem(last=False)
+        self.entries[key] = value
+        return value
+
+    # Return the entry for key, creating it with create() if there isn't one
+    def get_or_create(self, key, create):
+        value = self.get(key, self)
+        if value is self:
+            value = self.put(key, create())
+        return value
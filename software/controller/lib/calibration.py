@@ -0,0 +1,165 @@
+__authors__ = ['Andrew Taylor']
+
+import logging
+
+# numpy lets the whole frame be calibrated in one go, without it the
+#  tables are looked up a pixel at a time
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+CHANNELS = ["red", "green", "blue"]
+
+
+def build_channel_table(gamma=1.0, scale=1.0, curve=None):
+    """
+    Build the 256 entry table of what to send to a module for each value of
+    one channel.
+
+    The value is first put through the gamma and scaled (the white balance),
+    giving how bright it should look on the reference modules. If the module
+    has a measured curve, a list of [value sent, brightness seen] points
+    (with the brightness in 0-255 of what the reference modules show), the
+    value that makes it that bright is found by interpolating the curve
+    backwards, otherwise the brightness is sent as it is.
+    """
+    if curve is not None:
+        curve = sorted([(float(brightness), float(sent)) for (sent, brightness) in curve])
+    table = []
+    for value in range(256):
+        target = 255.0 * ((value / 255.0) ** gamma) * scale
+        if curve is not None:
+            target = _interpolate(curve, target)
+        table.append(min(max(int(round(target)), 0), 255))
+    return table
+
+
+# Linear interpolation of y at x, for a sorted list of (x, y) points,
+#  holding the end values outside them
+def _interpolate(points, x):
+    if x <= points[0][0]:
+        return points[0][1]
+    for ((x0, y0), (x1, y1)) in zip(points, points[1:]):
+        if x <= x1:
+            if x1 == x0:
+                return y1
+            return y0 + (y1 - y0) * (x - x0) / (x1 - x0)
+    return points[-1][1]
+
+
+class ModuleCalibration(object):
+    """
+    The colour calibration of one module, as a table for each of red, green
+    and blue of what value to send for each value the canvas asks for.
+
+    It is set up from the config, which can give a gamma, a white balance
+    scale and a measured curve, either one for all the channels or a list of
+    [red, green, blue] of them, e.g.
+
+        calibration:
+          gamma: 1.1
+          white_balance: [1.0, 0.85, 0.9]
+          curve:
+            green: [[0, 0], [64, 40], [128, 100], [255, 230]]
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, config=None):
+        self.config = config if config is not None else {}
+        self.tables = []
+        for (channel_number, channel) in enumerate(CHANNELS):
+            gamma = self._channel_setting("gamma", channel_number, 1.0)
+            scale = self._channel_setting("white_balance", channel_number, 1.0)
+            curve = None
+            if "curve" in self.config:
+                curve = self.config["curve"]
+                if type(curve) is dict:
+                    curve = curve.get(channel)
+            self.tables.append(build_channel_table(float(gamma), float(scale), curve))
+
+    def _channel_setting(self, name, channel_number, default):
+        if name not in self.config:
+            return default
+        value = self.config[name]
+        if type(value) in (list, tuple):
+            return value[channel_number]
+        return value
+
+    def is_identity(self):
+        return all(table == list(range(256)) for table in self.tables)
+
+    def modify(self, rgb):
+        return ((self.tables[0][(rgb >> 16) & 0xFF] << 16) | (self.tables[1][(rgb >> 8) & 0xFF] << 8) |
+                self.tables[2][rgb & 0xFF])
+
+
+class FloorCalibration(object):
+    """
+    The colour calibration of every module on the floor, so that modules from
+    different batches can be made to match.
+
+    The tables of all the modules are stacked into one array, and each cell
+    of the floor knows which module it is on, so calibrating a whole frame
+    is a single lookup of [module][channel][value].
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, module_map, calibrations):
+        # module_map is an [x][y] array of module names (or None), and
+        #  calibrations a dict of module name -> ModuleCalibration, with
+        #  modules that aren't in it left as they are
+        identity = ModuleCalibration()
+        self.calibrations = [identity]
+        index_of_module = {}
+        for (module, calibration) in sorted(calibrations.items()):
+            index_of_module[module] = len(self.calibrations)
+            self.calibrations.append(calibration)
+        self.module_indexes = [[index_of_module.get(module, 0) for module in column] for column in module_map]
+        if numpy is not None:
+            self.table_array = numpy.array([calibration.tables for calibration in self.calibrations],
+                                           dtype=numpy.uint8)
+            self.index_array = numpy.array(self.module_indexes, dtype=numpy.intp)[..., numpy.newaxis]
+            self.channels = numpy.arange(3)
+
+    def __len__(self):
+        return len(self.calibrations) - 1
+
+    """
+    Calibrate a single packed RGB value at (x, y)
+    """
+    def modify(self, x, y, rgb):
+        return self.calibrations[self.module_indexes[x][y]].modify(rgb)
+
+    """
+    Calibrate a whole (width, height, 3) uint8 numpy array of the floor
+    """
+    def modify_array(self, pixels):
+        return self.table_array[self.index_array, self.channels, pixels]
+
+    @staticmethod
+    def from_config(config, layout):
+        """
+        Build the calibration from the config, with a "calibration" section
+        in the system config applying to every module, and one in a module's
+        config overriding it for that module. Returns None if there's nothing
+        to calibrate
+        """
+        defaults = {}
+        try:
+            defaults = dict(config["system"]["calibration"])
+        except (KeyError, TypeError):
+            pass
+
+        calibrations = {}
+        for (module, module_config) in config["modules"].items():
+            settings = dict(defaults)
+            settings.update(module_config.get("calibration") or {})
+            calibration = ModuleCalibration(settings)
+            if not calibration.is_identity():
+                FloorCalibration.logger.info("Calibrating module %s with %s" % (module, settings))
+                calibrations[module] = calibration
+
+        if len(calibrations) == 0:
+            return None
+        return FloorCalibration(layout.get_module_map(), calibrations)
@@ -0,0 +1,108 @@
+__authors__ = ['Andrew Taylor']
+
+import numpy
+
+from lib.cache import LRUCache
+
+
+class FieldCache(object):
+    """
+    Precomputed per-cell coordinate fields for a canvas size, and for a
+    centre point on it: the x and y of every cell, the offset, distance and
+    angle of every cell from the centre, and the distance as a fraction of
+    the furthest cell.
+
+    Plugins that work out e.g. how far every cell is from a fixed point
+    each frame can ask for the field instead, which is only calculated the
+    first time for a given size and centre, and the least recently used
+    fields are dropped once there are more than size of them. The fields
+    are shared, and so are read only, take a copy to change one.
+
+    A centre that moves every frame would never find its field again, so
+    with moving=True the distance and angle are instead worked out each
+    time, into buffers kept for the size, without allocating anything. What
+    comes back is only good until the next moving field of the same kind
+    and size is asked for.
+    """
+
+    def __init__(self, size=64):
+        self.cache = LRUCache(size)
+        self.buffers = {}
+
+    def clear(self):
+        self.cache.clear()
+        self.buffers.clear()
+
+    # The (width, height) arrays of the given name for the size, reused
+    #  for every moving centre
+    def _buffer(self, name, width, height):
+        key = (name, width, height)
+        if key not in self.buffers:
+            self.buffers[key] = numpy.empty((width, height))
+        return self.buffers[key]
+
+    def _moving_offsets(self, width, height, centre_x, centre_y):
+        (x, y) = self.grid(width, height)
+        x_offset = numpy.subtract(x, centre_x, out=self._buffer("x_offset", width, height))
+        y_offset = numpy.subtract(y, centre_y, out=self._buffer("y_offset", width, height))
+        return (x_offset, y_offset)
+
+    def _field(self, key, create):
+        def create_read_only():
+            field = create()
+            for array in (field if type(field) is tuple else (field,)):
+                array.flags.writeable = False
+            return field
+        return self.cache.get_or_create(key, create_read_only)
+
+    # The x and y coordinates of every cell, as a pair of (width, height) arrays
+    def grid(self, width, height):
+        return self._field(("grid", width, height),
+                           lambda: tuple(numpy.indices((width, height), dtype=float)))
+
+    # How far every cell is from the centre, in x and y
+    def offsets(self, width, height, centre_x, centre_y):
+        (centre_x, centre_y) = (float(centre_x), float(centre_y))
+
+        def create():
+            (x, y) = self.grid(width, height)
+            return (x - centre_x, y - centre_y)
+        return self._field(("offsets", width, height, centre_x, centre_y), create)
+
+    # The straight line distance from every cell to the centre
+    def distance(self, width, height, centre_x, centre_y, moving=False):
+        if moving:
+            return numpy.hypot(*self._moving_offsets(width, height, centre_x, centre_y),
+                               out=self._buffer("distance", width, height))
+        (centre_x, centre_y) = (float(centre_x), float(centre_y))
+        return self._field(("distance", width, height, centre_x, centre_y),
+                           lambda: numpy.hypot(*self.offsets(width, height, centre_x, centre_y)))
+
+    # The angle of every cell around the centre, in the range [-pi, pi],
+    #  measured from the x axis towards the y axis
+    def angle(self, width, height, centre_x, centre_y, moving=False):
+        if moving:
+            (x_offset, y_offset) = self._moving_offsets(width, height, centre_x, centre_y)
+            return numpy.arctan2(y_offset, x_offset, out=self._buffer("angle", width, height))
+        (centre_x, centre_y) = (float(centre_x), float(centre_y))
+
+        def create():
+            (x_offset, y_offset) = self.offsets(width, height, centre_x, centre_y)
+            return numpy.arctan2(y_offset, x_offset)
+        return self._field(("angle", width, height, centre_x, centre_y), create)
+
+    # The distance from the centre scaled so the furthest cell is 1.0
+    def radial(self, width, height, centre_x, centre_y):
+        (centre_x, centre_y) = (float(centre_x), float(centre_y))
+
+        def create():
+            distance = self.distance(width, height, centre_x, centre_y)
+            furthest = distance.max() if distance.size > 0 else 0.0
+            if furthest == 0.0:
+                return numpy.zeros_like(distance)
+            return distance / furthest
+        return self._field(("radial", width, height, centre_x, centre_y), create)
+
+
+# The cache shared by all the plugins
+field_cache = FieldCache()
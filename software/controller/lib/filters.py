@@ -1,5 +1,12 @@
 __author__ = 'Andrew Taylor'
 
+# numpy lets a whole frame be filtered in one go, without it the filters
+#  are applied a pixel at a time
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 class Filter(object):
 
     def __init__(self, config=None):
@@ -12,6 +19,33 @@ class Filter(object):
     def modify(self, rgb):
         return rgb
 
+    """
+    Filters that work on each of red, green and blue separately can also
+     return what they do as a lookup table, a list of three 256 entry lists
+     giving the new value of each possible red, green and blue value. Filters
+     that return None here (the default, as a filter could do anything in
+     modify()) are applied with modify_array() instead
+    """
+    def lookup_table(self):
+        return None
+
+    """
+    Modify a whole (..., 3) uint8 numpy array of RGB values at once.
+    Default here is to apply the lookup table, or modify() to each pixel
+    """
+    def modify_array(self, pixels):
+        table = self.lookup_table()
+        if table is not None:
+            return numpy.asarray(table, dtype=numpy.uint8)[numpy.arange(3), pixels]
+        pixels = numpy.asarray(pixels, dtype=numpy.int64)
+        packed = (pixels[..., 0] << 16) | (pixels[..., 1] << 8) | pixels[..., 2]
+        packed = numpy.vectorize(self.modify, otypes=[numpy.int64])(packed)
+        result = numpy.empty(pixels.shape, dtype=numpy.uint8)
+        result[..., 0] = (packed >> 16) & 0xFF
+        result[..., 1] = (packed >> 8) & 0xFF
+        result[..., 2] = packed & 0xFF
+        return result
+
 class ClearFilter(Filter):
 
     """
@@ -20,6 +54,9 @@ class ClearFilter(Filter):
     def modify(self, rgb):
         return rgb
 
+    def lookup_table(self):
+        return [list(range(256)) for channel in range(3)]
+
 class NegativeFilter(Filter):
 
     """
@@ -28,10 +65,16 @@ class NegativeFilter(Filter):
     def modify(self, rgb):
         return rgb ^ 0xFFFFFF
 
+    def lookup_table(self):
+        return [[value ^ 0xFF for value in range(256)] for channel in range(3)]
+
 class NeutralDensityFilter(Filter):
 
     def __init__(self, config=None):
+        super(NeutralDensityFilter, self).__init__(config)
         self.factor = 1
+        if config is not None and "factor" in config:
+            self.factor = int(config["factor"])
 
     """
     Reduce the intensity of the value by the prescribed factor
@@ -42,10 +85,71 @@ class NeutralDensityFilter(Filter):
         blue = rgb & 0xFF
 
         # scale the values
-        red = red / self.factor
-        green = green / self.factor
-        blue = blue / self.factor
+        red = red // self.factor
+        green = green // self.factor
+        blue = blue // self.factor
 
         # Reconstruct and return the RGB value
         rgb = ((red & 0xFF) << 16) + ((green & 0xFF) << 8) + (blue & 0xFF)
-        return rgb
\ No newline at end of file
+        return rgb
+
+    def lookup_table(self):
+        return [[(value // self.factor) & 0xFF for value in range(256)] for channel in range(3)]
+
+
+class FilterChain(object):
+    """
+    A list of filters, put together once when the output is configured, so
+    that applying them doesn't cost more the more of them there are.
+
+    Each run of filters that have lookup tables is composed into a single
+    table, so a chain of only those (which is all of the filters here) is
+    one lookup per channel, whether there are two filters in it or ten.
+    Any other filter is applied on its own in between.
+    """
+
+    def __init__(self, filters=None):
+        # Each stage is either a list of three 256 entry tables, or a filter
+        self.stages = []
+        for filter in (filters if filters is not None else []):
+            table = filter.lookup_table()
+            if table is None:
+                self.stages.append(filter)
+            elif len(self.stages) > 0 and type(self.stages[-1]) is list:
+                previous = self.stages[-1]
+                self.stages[-1] = [[table[channel][previous[channel][value]] for value in range(256)]
+                                   for channel in range(3)]
+            else:
+                self.stages.append([list(table[channel]) for channel in range(3)])
+        self.arrays = None
+        if numpy is not None:
+            self.arrays = [numpy.asarray(stage, dtype=numpy.uint8) if type(stage) is list else stage
+                           for stage in self.stages]
+
+    def __len__(self):
+        return len(self.stages)
+
+    """
+    Filter a single packed RGB value
+    """
+    def modify(self, rgb):
+        for stage in self.stages:
+            if type(stage) is list:
+                rgb = ((stage[0][(rgb >> 16) & 0xFF] << 16) | (stage[1][(rgb >> 8) & 0xFF] << 8) |
+                       stage[2][rgb & 0xFF])
+            else:
+                rgb = stage.modify(rgb)
+        return rgb
+
+    """
+    Filter a whole (..., 3) uint8 numpy array of RGB values, with one gather
+     per lookup table stage
+    """
+    def modify_array(self, pixels):
+        channels = numpy.arange(3)
+        for stage in self.arrays:
+            if isinstance(stage, Filter):
+                pixels = stage.modify_array(pixels)
+            else:
+                pixels = stage[channels, pixels]
+        return pixels
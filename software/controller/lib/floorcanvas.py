@@ -5,6 +5,21 @@ from lib.text import TextWriter
 import logging
 import math
 import colorsys
+import zlib
+from array import array
+
+# numpy is only needed for the array backed canvas (and the bulk array
+#  methods), so don't insist on it for the plain list canvas
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+if numpy is not None:
+    from lib.fields import field_cache
+
+# The typecode for an unsigned array with 32 bit items, for the packed canvas
+PACKED_TYPECODE = 'I' if array('I').itemsize >= 4 else 'L'
 
 
 class FloorCanvas(object):
@@ -25,6 +40,12 @@ class FloorCanvas(object):
     MAGENTA = 0xFF00FF
     CYAN = 0x00FFFF
 
+    # Whether this kind of canvas can't be created without numpy
+    requires_numpy = False
+
+    # How many samples across each cell to take for antialiasing
+    ANTIALIAS_FACTOR = 4
+
     # Constructor to set up the size and initial colour
     def __init__(self, width=0, height=0, colour=BLACK):
         self.width = 0
@@ -34,8 +55,58 @@ class FloorCanvas(object):
         if (height > 0):
             self.height = height
         self.logger.info("Creating a canvas with width=%d, height=%d" % (width, height))
-        # Create the two dimensional array for the canvas object
-        self.data = [[self.BLACK for y in range(height)] for x in range(width)]
+        self._create_storage()
+        # What the canvas looked like at the end of the last frame, and
+        #  which cells have changed since (see end_frame())
+        self.previous_frame = None
+        self.damage = None
+
+    # Create the two dimensional array for the canvas object.
+    # Subclasses that store their pixels differently override this, along
+    #  with _get_pixel(), _put_pixel() and _fill()
+    def _create_storage(self):
+        self.data = [[self.BLACK for y in range(self.height)] for x in range(self.width)]
+
+    # The raw storage accessors. These take a packed 0xRRGGBB int and do no
+    #  range checking, that is left to the public methods
+    def _get_pixel(self, x, y):
+        return self.data[x][y]
+
+    def _put_pixel(self, x, y, colour):
+        self.data[x][y] = colour
+
+    def _fill(self, colour):
+        for column in self.data:
+            column[:] = [colour] * self.height
+
+    # Fill the rectangle [x0, x1) x [y0, y1), which has already been
+    #  clipped to the canvas, with a packed colour
+    def _fill_block(self, x0, y0, x1, y1, colour):
+        span = [colour] * (y1 - y0)
+        for x in range(x0, x1):
+            self.data[x][y0:y1] = span
+
+    # Write a (w, h, 3) uint8 block, which has already been clipped to the
+    #  canvas, with its top left at (x0, y0). Only the cells where mask is
+    #  True are written if there is a mask
+    def _write_block(self, x0, y0, block, mask=None):
+        packed = pack_pixel_array(block).tolist()
+        if mask is None:
+            (block_width, block_height) = block.shape[:2]
+            for i in range(block_width):
+                self.data[x0 + i][y0:y0 + block_height] = packed[i]
+        else:
+            for (i, j) in zip(*numpy.nonzero(mask)):
+                self.data[x0 + i][y0 + j] = packed[i][j]
+
+    # Make this canvas a copy of another one of the same size, in place, so
+    #  that a buffer can be reused without allocating a new one
+    def copy_from(self, other):
+        if type(other) is type(self):
+            for (column, source) in zip(self.data, other.data):
+                column[:] = source
+        else:
+            self.set_pixels(other.get_pixel_array())
 
     # Return an array data[x][y] of the canvas. This may or may not be
     #  the same as the internal representation, so don't get it directly,
@@ -43,6 +114,83 @@ class FloorCanvas(object):
     def get_canvas_array(self):
         return self.data
 
+    # Return the canvas as a (width, height, 3) uint8 numpy array.
+    # For the list canvas this is a copy, so writing to it won't change
+    #  the canvas
+    def get_pixel_array(self):
+        if numpy is None:
+            raise ImportError("numpy is required for get_pixel_array()")
+        packed = numpy.array(self.data, dtype=numpy.int64).reshape((self.width, self.height))
+        return unpack_pixel_array(packed)
+
+    # Copy the current frame into a (width, height, 3) uint8 array, reusing
+    #  buffer if it is given (and the right size) rather than allocating one
+    def snapshot(self, buffer=None):
+        current = self.get_pixel_array()
+        if buffer is None or buffer.shape != current.shape:
+            return numpy.array(current, dtype=numpy.uint8)
+        numpy.copyto(buffer, current)
+        return buffer
+
+    # A (width, height) boolean array which is True where this canvas is
+    #  different to another canvas, or to a snapshot of one
+    def diff_mask(self, other):
+        if isinstance(other, FloorCanvas):
+            other = other.get_pixel_array()
+        return (self.get_pixel_array() != other).any(axis=2)
+
+    # A checksum of the current frame, which is the same for any two canvases
+    #  showing the same thing however they store it
+    def content_hash(self):
+        pixels = numpy.ascontiguousarray(self.get_pixel_array(), dtype=numpy.uint8)
+        return zlib.crc32(pixels.tobytes(), zlib.crc32(repr(pixels.shape).encode())) & 0xFFFFFFFF
+
+    # Damage tracking.
+    # Once a frame has been drawn, end_frame() compares it with the frame
+    #  before and records which cells changed, so that outputs can skip
+    #  frames that are identical, or only redraw the cells that changed.
+    #  Without numpy everything is assumed to have changed every frame
+    def end_frame(self):
+        if numpy is None:
+            self.damage = None
+            return True
+        if self.previous_frame is None or self.previous_frame.shape != (self.width, self.height, 3):
+            self.damage = numpy.ones((self.width, self.height), dtype=bool)
+            self.previous_frame = self.snapshot()
+        else:
+            self.damage = self.diff_mask(self.previous_frame)
+            # Reuse the same buffer rather than allocating a new one each frame
+            self.snapshot(self.previous_frame)
+        return self.is_damaged()
+
+    # Forget the previous frame, so the next one is treated as all new
+    def mark_damaged(self):
+        self.previous_frame = None
+        self.damage = None
+
+    # Did anything change in the last frame?
+    def is_damaged(self):
+        if self.damage is None:
+            return True
+        return bool(self.damage.any())
+
+    # A (width, height) boolean array which is True for the cells that
+    #  changed in the last frame, or None if that isn't known
+    def get_damage_mask(self):
+        return self.damage
+
+    # The smallest box containing all the changed cells, as
+    #  ((top left x, top left y), (bottom right x, bottom right y)) like
+    #  draw_box() takes, or None if nothing changed
+    def get_damage_rect(self):
+        if self.damage is None:
+            return ((0, 0), (self.width - 1, self.height - 1))
+        columns = numpy.nonzero(self.damage.any(axis=1))[0]
+        if len(columns) == 0:
+            return None
+        rows = numpy.nonzero(self.damage.any(axis=0))[0]
+        return ((int(columns[0]), int(rows[0])), (int(columns[-1]), int(rows[-1])))
+
     # See if the given pixel is on the canvas, and not off the side somewhere
     def is_in_range(self, x, y):
         if x < 0 or y < 0:
@@ -90,9 +238,9 @@ class FloorCanvas(object):
 
                 pixel_colour = self.pack_colour_tuple((new_r, new_g, new_b))
 
-                self.data[x][y] = pixel_colour
+                self._put_pixel(x, y, pixel_colour)
             else:
-                self.data[x][y] = colour
+                self._put_pixel(x, y, colour)
 
     def reformat(self, colour):
         return int(round(colour[0] * 255)) % 256, \
@@ -109,7 +257,7 @@ class FloorCanvas(object):
         x = int(round(x, 0))
         y = int(round(y, 0))
         if self.is_in_range(x, y):
-            self.data[x][y] = self.pack_colour_tuple(colour)
+            self._put_pixel(x, y, self.pack_colour_tuple(colour))
 
     # Set a pixel with a float tuple value
     def set_float_pixel_tuple(self, x, y, colour):
@@ -125,7 +273,7 @@ class FloorCanvas(object):
     # Return the colour as an int (i.e the value of 0xRRGGBB)
     def get_pixel(self, x, y):
         if self.is_in_range(x, y):
-            return self.data[x][y]
+            return self._get_pixel(x, y)
         return None
 
     # Return the colour as (R,G,B) tuple
@@ -157,163 +305,939 @@ class FloorCanvas(object):
         """
         Fill the box from top left to bottom right with the given colour
         """
+        if type(colour) is tuple:
+            colour = self.pack_colour_tuple(colour)
         (tlx, tly) = top_left
         (brx, bry) = bottom_right
         if tlx <= brx and tly <= bry:
-            y = tly
-            while y <= bry:
-                x = tlx
-                while x <= brx:
-                    self.set_pixel(x, y, colour)
-                    x += 1
-                y += 1
+            # The corners are inclusive, so the far edge is one more
+            clipped = self._clip_block(int(round(tlx, 0)), int(round(tly, 0)),
+                                       int(round(brx - tlx, 0)) + 1, int(round(bry - tly, 0)) + 1)
+            if clipped is not None:
+                self._fill_block(*(clipped + (colour,)))
 
-    def draw_line(self, from_x, from_y, to_x, to_y, colour, aliasing=None):
-        # Work out which direction has the most pixels
-        #  so that there are no gaps in the line
-        if (from_x == to_x and from_y == to_y):
-            self.set_pixel(int(from_x), int(from_y), colour)
+    # Work out the part of a width x height block placed at (x_pos, y_pos)
+    #  that lands on the canvas, as (x0, y0, x1, y1), or None if none of it does
+    def _clip_block(self, x_pos, y_pos, width, height):
+        x0 = max(x_pos, 0)
+        y0 = max(y_pos, 0)
+        x1 = min(x_pos + width, self.width)
+        y1 = min(y_pos + height, self.height)
+        if x0 >= x1 or y0 >= y1:
+            return None
+        return (x0, y0, x1, y1)
+
+    def set_pixels(self, pixels, x_pos=0, y_pos=0, mask=None, format="RGB"):
+        """
+        Write a whole (width, height, 3) array of colours onto the canvas in
+        one go, with its top left corner at (x_pos, y_pos). Float arrays are
+        in the range [0, 1], like set_float_pixel_tuple(), anything else is
+        taken to be 0-255. If a (width, height) boolean mask is given, only
+        the pixels where it is True are written. Anything that falls off the
+        edge of the canvas is clipped.
+        The format can also be "HSV" or "HLS", in which case the array holds
+        floats in that colour space, and is converted to RGB in one pass.
+        """
+        if numpy is None:
+            raise ImportError("numpy is required for set_pixels()")
+        pixels = numpy.asarray(pixels)
+        x_pos = int(round(x_pos, 0))
+        y_pos = int(round(y_pos, 0))
+        clipped = self._clip_block(x_pos, y_pos, pixels.shape[0], pixels.shape[1])
+        if clipped is None:
+            return None
+        (x0, y0, x1, y1) = clipped
+        block = pixels[x0 - x_pos:x1 - x_pos, y0 - y_pos:y1 - y_pos]
+        if mask is not None:
+            mask = numpy.asarray(mask, dtype=bool)[x0 - x_pos:x1 - x_pos, y0 - y_pos:y1 - y_pos]
+        if format == "HSV":
+            block = hsv_to_rgb_array(block)
+        elif format == "HLS":
+            block = hls_to_rgb_array(block)
+        self._write_block(x0, y0, to_pixel_array(block), mask)
+
+    def fill_mask(self, mask, colour, x_pos=0, y_pos=0):
+        """
+        Set every pixel where the (width, height) boolean mask is True to the
+        given colour, with the mask's top left corner at (x_pos, y_pos)
+        """
+        if numpy is None:
+            raise ImportError("numpy is required for fill_mask()")
+        if type(colour) is not tuple:
+            colour = self.unpack_colour_tuple(colour)
+        mask = numpy.asarray(mask, dtype=bool)
+        block = numpy.empty(mask.shape + (3,), dtype=numpy.uint8)
+        block[...] = [int(c) for c in colour]
+        self.set_pixels(block, x_pos, y_pos, mask)
+
+    def blit_sprite(self, sprite, x_pos, y_pos, colour=None, rotation=0, flip_x=False, flip_y=False, clip=None):
+        """
+        Draw a Sprite (see lib/sprites.py) with its top left corner at
+        (x_pos, y_pos), turned clockwise by rotation quarter turns and/or
+        flipped. The sprite's transparent pixels are left alone, and it is
+        drawn in its own colours, unless it is given a colour. Anything off
+        the edge of the canvas, or outside the clip rectangle (x0, y0, x1,
+        y1, not including x1 and y1) if there is one, isn't drawn
+        """
+        sprite = sprite.get_variant(rotation, flip_x, flip_y)
+        x_pos = int(round(x_pos, 0))
+        y_pos = int(round(y_pos, 0))
+        clipped = self._clip_block(x_pos, y_pos, sprite.width, sprite.height)
+        if clipped is not None and clip is not None:
+            clipped = (max(clipped[0], clip[0]), max(clipped[1], clip[1]),
+                       min(clipped[2], clip[2]), min(clipped[3], clip[3]))
+        if clipped is None or clipped[0] >= clipped[2] or clipped[1] >= clipped[3]:
             return None
-        #self.logger.verbose("(%d,%d) > (%d,%d)" % (from_x, from_y, to_x, to_y))
-        if (abs(from_x - to_x) > abs(from_y - to_y)):
-            # Make sure that to_x is >= from_x so that the range()
-            #  works properly
-            if to_x < from_x:
-                temp = to_x
-                to_x = from_x
-                from_x = temp
-
-                temp = to_y
-                to_y = from_y
-                from_y = temp
-            #self.logger.verbose("Going from x=%d to x=%d" % (from_x, to_x))
-            gradient = float(to_y - from_y) / float(to_x - from_x)
-            #self.logger.verbose("Gradient=%f, c=%d" % (gradient, from_y))
-            for x in range(to_x - from_x + 1):
-                y = gradient * float(x) + from_y
-                self.set_pixel(int(x + from_x), int(y), colour)
+        (x0, y0, x1, y1) = clipped
+        if colour is None and sprite.pixels is None:
+            raise ValueError("The sprite has no colours of its own, so it needs to be given one")
+        if numpy is None:
+            # A pixel at a time over the mask, for when there is no numpy
+            if colour is not None and type(colour) is tuple:
+                colour = self.pack_colour_tuple(colour)
+            for x in range(x0, x1):
+                for y in range(y0, y1):
+                    if sprite.mask[x - x_pos][y - y_pos]:
+                        if colour is not None:
+                            self._put_pixel(x, y, colour)
+                        else:
+                            self._put_pixel(x, y, self.pack_colour_tuple(sprite.pixels[x - x_pos][y - y_pos]))
+            return None
+        window = (slice(x0 - x_pos, x1 - x_pos), slice(y0 - y_pos, y1 - y_pos))
+        if colour is not None:
+            block = sprite.get_plane(colour)[window]
         else:
-            # Make sure that to_y is >= from_y so that the range()
-            #  works properly
-            if to_y < from_y:
-                temp = to_x
-                to_x = from_x
-                from_x = temp
-
-                temp = to_y
-                to_y = from_y
-                from_y = temp
-            #self.logger.verbose("Going from y=%d to y=%d" % (from_y, to_y))
-            gradient = float(to_x - from_x) / float(to_y - from_y)
-            for y in range(to_y - from_y + 1):
-                x = gradient * float(y) + from_x
-                self.set_pixel(int(x), int(y + from_y), colour)
+            block = sprite.pixels[window]
+        mask = None
+        if not sprite.opaque:
+            mask = sprite.mask[window]
+        self._write_block(x0, y0, block, mask)
+
+    # Fill the cells from (x, y0) to (x, y1) inclusive, clipped to the
+    #  canvas. The canvas is stored in columns, so the shapes are drawn as
+    #  vertical spans, each of which is a single slice assignment
+    def _fill_column_span(self, x, y0, y1, colour):
+        if 0 <= x < self.width:
+            y0 = max(y0, 0)
+            y1 = min(y1, self.height - 1)
+            if y0 <= y1:
+                self._fill_block(x, y0, x + 1, y1 + 1, colour)
+
+    # Draw a line with Bresenham's algorithm, using only integers, filling
+    #  each column's run of cells in one go
+    def draw_line(self, from_x, from_y, to_x, to_y, colour, aliasing=None):
+        if type(colour) is tuple:
+            colour = self.pack_colour_tuple(colour)
+        (x, y) = (int(round(from_x, 0)), int(round(from_y, 0)))
+        (end_x, end_y) = (int(round(to_x, 0)), int(round(to_y, 0)))
+
+        delta_x = abs(end_x - x)
+        delta_y = -abs(end_y - y)
+        step_x = 1 if x < end_x else -1
+        step_y = 1 if y < end_y else -1
+        error = delta_x + delta_y
+        span_start = y
+        while x != end_x or y != end_y:
+            double_error = 2 * error
+            move_x = double_error >= delta_y
+            move_y = double_error <= delta_x
+            if move_x:
+                # Moving on to the next column, so this one's run is complete
+                self._fill_column_span(x, min(span_start, y), max(span_start, y), colour)
+                error += delta_y
+                x += step_x
+            if move_y:
+                error += delta_x
+                y += step_y
+            if move_x:
+                span_start = y
+        self._fill_column_span(x, min(span_start, y), max(span_start, y), colour)
 
     # Set the entire canvas to a single colour
     def set_colour(self, colour):
         if type(colour) is tuple:
             colour = self.pack_colour_tuple(colour)
-        for x in range(self.width):
-            for y in range(self.height):
-                self.data[x][y] = colour
+        self._fill(colour)
 
     # Text methods:
-    def draw_text(self, text, colour, x_pos, y_pos, custom_text=None):
+    # The text is drawn in the 5x7 font, unless a BitmapFont (see lib/fonts.py)
+    #  is given
+    def draw_text(self, text, colour, x_pos, y_pos, custom_text=None, font=None):
         # Returns the text size as a (width, height) tuple for reference
+        if font is not None:
+            return font.draw_text(self, text, colour, x_pos, y_pos)
         text_size = TextWriter.draw_text(self, text, colour, x_pos, y_pos, custom_text)
         return text_size
 
-    def get_text_size(self, text):
+    def get_text_size(self, text, font=None):
         # Returns the text size as a (width, height) tuple for reference,
-        #  but doesn't actually draw anything because it doesn't pass a surface through
-        return TextWriter.draw_text(None, text, (0, 0, 0), 0, 0)
+        #  worked out without drawing anything
+        if font is not None:
+            return font.get_text_size(text)
+        return TextWriter.get_text_size(text)
 
+    # With antialias set, the edge of the circle is smoothed by supersampling
+    #  (antialias can be the number of samples across each cell, or True for
+    #  the default). This needs numpy, without it the circle is drawn aliased
     def draw_circle(self, x_centre, y_centre, radius, colour, fill, antialias=None):
 
-        #radius = int(round(radius, 0))
+        if antialias and numpy is not None:
+            factor = self.ANTIALIAS_FACTOR
+            if antialias is not True and antialias > 1:
+                factor = int(antialias)
+            return self._draw_circle_antialiased(x_centre, y_centre, radius, colour, fill, factor)
 
-        x = 0
-        y = int(math.sqrt(radius ** 2 - 1) + 0.5)
-
-        all_set_pixels = set()
-        while (x <= y):
-            # The outline
-            pixels_to_set = []
-            pixels_to_set.append((x_centre - x, y_centre + y))
-            pixels_to_set.append((x_centre + x, y_centre + y))
-            pixels_to_set.append((x_centre - x, y_centre - y))
-            pixels_to_set.append((x_centre + x, y_centre - y))
-
-            pixels_to_set.append((x_centre - y, y_centre + x))
-            pixels_to_set.append((x_centre + y, y_centre + x))
-            pixels_to_set.append((x_centre - y, y_centre - x))
-            pixels_to_set.append((x_centre + y, y_centre - x))
-
-            all_set_pixels.update(pixels_to_set)
-
-            for pixel in pixels_to_set:
-                (pixel_x, pixel_y) = pixel
-                self.set_pixel(pixel_x, pixel_y, colour)
-
-            # The fill
-            if fill is not None:
-                if y >= 1:
-                    y -= 1
-                    self.draw_line(int(round(x_centre - x, 0)), int(round(y_centre + y, 0)),
-                                   int(round(x_centre - x, 0)), int(round(y_centre + x, 0)), fill)
-                    self.draw_line(int(round(x_centre + x, 0)), int(round(y_centre + y, 0)),
-                                   int(round(x_centre + x, 0)), int(round(y_centre + x, 0)), fill)
-                    self.draw_line(int(round(x_centre - x, 0)), int(round(y_centre - y, 0)),
-                                   int(round(x_centre - x, 0)), int(round(y_centre - x, 0)), fill)
-                    self.draw_line(int(round(x_centre + x, 0)), int(round(y_centre - y, 0)),
-                                   int(round(x_centre + x, 0)), int(round(y_centre - x, 0)), fill)
-
-                    self.draw_line(int(round(x_centre - y, 0)), int(round(y_centre + x, 0)),
-                                   int(round(x_centre - x, 0)), int(round(y_centre + x, 0)), fill)
-                    self.draw_line(int(round(x_centre + y, 0)), int(round(y_centre + x, 0)),
-                                   int(round(x_centre + x, 0)), int(round(y_centre + x, 0)), fill)
-                    self.draw_line(int(round(x_centre - y, 0)), int(round(y_centre - x, 0)),
-                                   int(round(x_centre - x, 0)), int(round(y_centre - x, 0)), fill)
-                    self.draw_line(int(round(x_centre + y, 0)), int(round(y_centre - x, 0)),
-                                   int(round(x_centre + x, 0)), int(round(y_centre - x, 0)), fill)
+        if type(colour) is tuple:
+            colour = self.pack_colour_tuple(colour)
+        if type(fill) is tuple:
+            fill = self.pack_colour_tuple(fill)
+        if radius < 0:
+            return None
 
+        # Work out the outline for one quarter of the circle, as the rows
+        #  (offset from the centre) covered in each column, walking round one
+        #  octant and reflecting it into the other
+        outline = {}
+        x = 0
+        y = int(math.sqrt(max(radius ** 2 - 1, 0)) + 0.5)
+        while x <= y:
+            outline.setdefault(x, set()).add(y)
+            outline.setdefault(y, set()).add(x)
             x += 1
-            if x > radius: break
+            if x > radius:
+                break
             y = int(math.sqrt(radius ** 2 - x ** 2) + 0.5)
 
-        # This doesn't work that well.
-        # Basically, it attempts to see if there are any pixels that should be fractionally illuminated
-        #  by looking to see if any pixels are < 1.0 pixel away, and turn them on a bit
-        if antialias is not None:
-            self.logger.info("Total number of set pixels: %d" % (len(all_set_pixels)))
-
-            surround_pixels = set()
-            for pixel in all_set_pixels:
-                (pixel_x, pixel_y) = pixel
-                surround_pixels.add((pixel_x - 1, pixel_y))
-                surround_pixels.add((pixel_x + 1, pixel_y))
-
-                surround_pixels.add((pixel_x - 1, pixel_y + 1))
-                surround_pixels.add((pixel_x, pixel_y + 1))
-                surround_pixels.add((pixel_x + 1, pixel_y + 1))
-
-                surround_pixels.add((pixel_x - 1, pixel_y - 1))
-                surround_pixels.add((pixel_x, pixel_y - 1))
-                surround_pixels.add((pixel_x + 1, pixel_y - 1))
-
-            self.logger.info("Total number of surrounding pixels: %d" % (len(surround_pixels)))
-            # The pixels that we haven't already set
-            pixels_not_already_set = surround_pixels.difference(all_set_pixels)
-
-            for pixel in pixels_not_already_set:
-                (pixel_x, pixel_y) = pixel
-                distance_away = math.sqrt((pixel_x - x_centre) ** 2 + (pixel_y - y_centre) ** 2)
-                delta = abs(distance_away - radius)
-                #self.logger.info("%d,%d is %f off" % (pixel_x, pixel_y, delta))
-                if delta < 1.0:
-                    delta /= 1.0
-                    self.set_pixel(pixel_x, pixel_y, colour, "RGB", delta)
+        # Then draw it a column at a time, mirrored into all four quarters,
+        #  with the fill in between the top and bottom of the outline
+        centre_x = int(math.floor(x_centre + 0.5))
+        centre_y = int(math.floor(y_centre + 0.5))
+        for (x, rows) in outline.items():
+            (inner, outer) = (min(rows), max(rows))
+            for column in set((centre_x - x, centre_x + x)):
+                self._fill_column_span(column, centre_y - outer, centre_y - inner, colour)
+                self._fill_column_span(column, centre_y + inner, centre_y + outer, colour)
+                if fill is not None:
+                    self._fill_column_span(column, centre_y - inner + 1, centre_y + inner - 1, fill)
+
+        return None
+
+    # Draw the circle with each cell lit in proportion to how much of it the
+    #  outline (a ring one cell wide) and the fill cover. The coverage is
+    #  found by sampling factor x factor points in every cell near the circle
+    def _draw_circle_antialiased(self, x_centre, y_centre, radius, colour, fill, factor):
+        block = self._clip_block(int(math.floor(x_centre - radius - 1)), int(math.floor(y_centre - radius - 1)),
+                                 int(math.ceil(2 * radius + 3)), int(math.ceil(2 * radius + 3)))
+        if block is None:
+            return None
+        (x0, y0, x1, y1) = block
+
+        # The distance of each sample point from the centre of the circle, in
+        #  cells. The samples are a grid factor times finer than the cells,
+        #  so the distances come from the field cache, in samples, and are
+        #  scaled back down. Circles tend to move, so the distances are
+        #  worked out each time rather than cached
+        distance = field_cache.distance((x1 - x0) * factor, (y1 - y0) * factor,
+                                        (x_centre - x0 + 0.5) * factor - 0.5,
+                                        (y_centre - y0 + 0.5) * factor - 0.5, moving=True) / factor
+
+        result = self.get_pixel_array()[x0:x1, y0:y1].astype(float)
+        if fill is not None:
+            coverage = downsample_box(distance < radius - 0.5, factor)
+            result += (numpy.array(unpack_colour(fill), dtype=float) - result) * coverage[..., numpy.newaxis]
+        coverage = downsample_box(abs(distance - radius) <= 0.5, factor)
+        result += (numpy.array(unpack_colour(colour), dtype=float) - result) * coverage[..., numpy.newaxis]
+
+        self.set_pixels(result / 255.0, x0, y0)
+        return None
+
+
+class ArrayFloorCanvas(FloorCanvas):
+    """
+    A FloorCanvas that keeps its pixels in a contiguous (width, height, 3)
+    uint8 numpy array instead of a list of lists of packed ints.
+
+    Everything that works on a FloorCanvas still works here, but clears and
+    fills are a single array operation, and get_pixel_array() returns the
+    live array so that callers can write whole frames into it directly.
+    """
+
+    requires_numpy = True
+
+    def _create_storage(self):
+        if numpy is None:
+            raise ImportError("numpy is required for an ArrayFloorCanvas")
+        self.pixels = numpy.zeros((self.width, self.height, 3), dtype=numpy.uint8)
+
+    def _get_pixel(self, x, y):
+        (red, green, blue) = self.pixels[x, y].tolist()
+        return (red << 16) + (green << 8) + blue
+
+    def _put_pixel(self, x, y, colour):
+        self.pixels[x, y] = ((colour >> 16) & 0xFF, (colour >> 8) & 0xFF, colour & 0xFF)
+
+    def _fill(self, colour):
+        self.pixels[...] = ((colour >> 16) & 0xFF, (colour >> 8) & 0xFF, colour & 0xFF)
+
+    def _fill_block(self, x0, y0, x1, y1, colour):
+        self.pixels[x0:x1, y0:y1] = ((colour >> 16) & 0xFF, (colour >> 8) & 0xFF, colour & 0xFF)
+
+    def _write_block(self, x0, y0, block, mask=None):
+        (block_width, block_height) = block.shape[:2]
+        region = self.pixels[x0:x0 + block_width, y0:y0 + block_height]
+        if mask is None:
+            region[...] = block
+        else:
+            region[mask] = block[mask]
+
+    def copy_from(self, other):
+        if isinstance(other, ArrayFloorCanvas):
+            numpy.copyto(self.pixels, other.pixels)
+        else:
+            self.set_pixels(other.get_pixel_array())
+
+    # The packed values are calculated on demand, so this is a copy of the
+    #  canvas, as lists of ints indexed [x][y] like the list canvas, and
+    #  writing to it won't change the canvas
+    def get_canvas_array(self):
+        return pack_pixel_array(self.pixels).tolist()
+
+    # Not a copy, anything written to the returned array appears on the canvas
+    def get_pixel_array(self):
+        return self.pixels
+
+
+class FlatFloorCanvas(FloorCanvas):
+    """
+    The base for the compact canvases, which keep one value per cell in a
+    flat typed array (indexed x * height + y, so columns are contiguous like
+    the list canvas) rather than a Python int object per cell.
+
+    Subclasses choose the array typecode and how a packed 0xRRGGBB colour
+    is encoded into a cell and decoded back again, both one at a time and
+    (when numpy is available) for whole arrays at once.
+    """
+
+    typecode = None
+
+    def _create_storage(self):
+        self.cells = array(self.typecode, [self._encode(self.BLACK)]) * (self.width * self.height)
+
+    def _encode(self, colour):
+        raise NotImplementedError()
+
+    def _decode(self, value):
+        raise NotImplementedError()
+
+    # The array versions, from a (..., 3) uint8 array, and to one
+    def _encode_array(self, pixels):
+        raise NotImplementedError()
+
+    def _decode_array(self, values):
+        raise NotImplementedError()
+
+    # A (width, height) numpy view of the cells, which shares their memory
+    def _cell_view(self):
+        if numpy is None:
+            raise ImportError("numpy is required for bulk operations on a %s" % type(self).__name__)
+        return numpy.frombuffer(self.cells, dtype=numpy.dtype(self.typecode)).reshape((self.width, self.height))
+
+    def _get_pixel(self, x, y):
+        return self._decode(self.cells[x * self.height + y])
+
+    def _put_pixel(self, x, y, colour):
+        self.cells[x * self.height + y] = self._encode(colour)
+
+    def _fill(self, colour):
+        self.cells[:] = array(self.typecode, [self._encode(colour)]) * len(self.cells)
+
+    def _fill_block(self, x0, y0, x1, y1, colour):
+        span = array(self.typecode, [self._encode(colour)]) * (y1 - y0)
+        for x in range(x0, x1):
+            start = x * self.height
+            self.cells[start + y0:start + y1] = span
+
+    def _write_block(self, x0, y0, block, mask=None):
+        (block_width, block_height) = block.shape[:2]
+        region = self._cell_view()[x0:x0 + block_width, y0:y0 + block_height]
+        if mask is None:
+            region[...] = self._encode_array(block)
+        else:
+            region[mask] = self._encode_array(block[mask])
+
+    def copy_from(self, other):
+        if type(other) is type(self):
+            self.cells[:] = other.cells
+        else:
+            self.set_pixels(other.get_pixel_array())
+
+    def get_canvas_array(self):
+        height = self.height
+        return [[self._decode(value) for value in self.cells[x * height:(x + 1) * height]]
+                for x in range(self.width)]
+
+    # Always a copy, as the cells aren't stored as (r, g, b)
+    def get_pixel_array(self):
+        return self._decode_array(self._cell_view())
+
+
+class PackedFloorCanvas(FlatFloorCanvas):
+    """
+    A canvas of packed 0xRRGGBB values in an unsigned 32 bit array, the same
+    values as the list canvas holds but at 4 bytes a cell.
+    """
+
+    typecode = PACKED_TYPECODE
+
+    def _encode(self, colour):
+        return int(colour) & 0xFFFFFF
+
+    def _decode(self, value):
+        return value
+
+    def _encode_array(self, pixels):
+        return pack_pixel_array(pixels)
+
+    def _decode_array(self, values):
+        return unpack_pixel_array(values)
+
+    def get_canvas_array(self):
+        height = self.height
+        return [self.cells[x * height:(x + 1) * height].tolist() for x in range(self.width)]
+
+
+class Rgb565FloorCanvas(FlatFloorCanvas):
+    """
+    A canvas of 16 bit RGB565 values, 2 bytes a cell. This loses the low
+    bits of each channel (3 of red and blue, 2 of green), which are filled
+    back in from the high bits when the colour is read.
+    """
+
+    typecode = 'H'
+
+    def _encode(self, colour):
+        colour = int(colour)
+        return ((colour >> 8) & 0xF800) | ((colour >> 5) & 0x07E0) | ((colour >> 3) & 0x001F)
+
+    def _decode(self, value):
+        red = (value >> 11) & 0x1F
+        green = (value >> 5) & 0x3F
+        blue = value & 0x1F
+        return (((red << 3) | (red >> 2)) << 16) + (((green << 2) | (green >> 4)) << 8) + ((blue << 3) | (blue >> 2))
+
+    def _encode_array(self, pixels):
+        pixels = pixels.astype(numpy.uint16)
+        return ((pixels[..., 0] >> 3) << 11) | ((pixels[..., 1] >> 2) << 5) | (pixels[..., 2] >> 3)
+
+    def _decode_array(self, values):
+        red = (values >> 11) & 0x1F
+        green = (values >> 5) & 0x3F
+        blue = values & 0x1F
+        pixels = numpy.empty(values.shape + (3,), dtype=numpy.uint8)
+        pixels[..., 0] = (red << 3) | (red >> 2)
+        pixels[..., 1] = (green << 2) | (green >> 4)
+        pixels[..., 2] = (blue << 3) | (blue >> 2)
+        return pixels
+
+
+class PaletteFloorCanvas(FlatFloorCanvas):
+    """
+    A canvas of 8 bit indices into a palette of 256 packed colours, 1 byte a
+    cell, with the palette only applied when the colours are read (i.e. by
+    the outputs).
+
+    Drawing with an RGB colour uses the palette entry that already has that
+    colour, or takes the next unused entry for it. Once all 256 entries are
+    in use the nearest existing colour is used instead, so plugins that
+    redraw everything each frame should reset_palette() first. Plugins that
+    know about the palette can set entries and draw the indices directly.
+
+    Colour effects (hue shifts, fades and flashes) are applied to the
+    palette as it is read, rather than to every cell, so they cost the same
+    however big the floor is. Reading a cell gives its colour with the
+    effects applied.
+    """
+
+    typecode = 'B'
+    PALETTE_SIZE = 256
+
+    def _create_storage(self):
+        self.reset_palette()
+        self.clear_palette_effects()
+        FlatFloorCanvas._create_storage(self)
+
+    def _encode(self, colour):
+        colour = int(colour) & 0xFFFFFF
+        index = self.palette_lookup.get(colour)
+        if index is None:
+            index = self._allocate_palette_entry(colour)
+            if index is None:
+                index = self._nearest_palette_entry(colour)
+                self.palette_lookup[colour] = index
+        return index
+
+    # Give a colour the next unused palette entry, if there is one
+    def _allocate_palette_entry(self, colour):
+        if self.palette_used >= self.PALETTE_SIZE:
+            return None
+        index = self.palette_used
+        self.palette_used += 1
+        self.set_palette_entry(index, colour)
+        return index
+
+    def _nearest_palette_entry(self, colour):
+        (red, green, blue) = ((colour >> 16) & 0xFF, (colour >> 8) & 0xFF, colour & 0xFF)
+        best_index = 0
+        best_distance = None
+        for (index, entry) in enumerate(self.palette):
+            distance = (((entry >> 16) & 0xFF) - red) ** 2 + \
+                       (((entry >> 8) & 0xFF) - green) ** 2 + \
+                       ((entry & 0xFF) - blue) ** 2
+            if best_distance is None or distance < best_distance:
+                best_index = index
+                best_distance = distance
+        return best_index
+
+    def _decode(self, value):
+        return self._resolve_palette()[value]
+
+    def _encode_array(self, pixels):
+        # Look up each distinct colour once, rather than every pixel
+        (colours, inverse) = numpy.unique(pack_pixel_array(pixels), return_inverse=True)
+        indices = numpy.zeros(len(colours), dtype=numpy.uint8)
+        unmatched = []
+        for (i, colour) in enumerate(colours.tolist()):
+            index = self.palette_lookup.get(colour)
+            if index is None:
+                index = self._allocate_palette_entry(colour)
+            if index is None:
+                unmatched.append(i)
+            else:
+                indices[i] = index
+        # Match whatever didn't fit in the palette against all of it at once
+        if len(unmatched) > 0:
+            palette = unpack_pixel_array(numpy.array(self.palette, dtype=numpy.uint32)).astype(int)
+            wanted = unpack_pixel_array(colours[unmatched]).astype(int)
+            distances = ((wanted[:, numpy.newaxis, :] - palette[numpy.newaxis, :, :]) ** 2).sum(axis=2)
+            nearest = distances.argmin(axis=1)
+            indices[unmatched] = nearest
+            for (colour, index) in zip(colours[unmatched].tolist(), nearest.tolist()):
+                self.palette_lookup[colour] = index
+        return indices[inverse.reshape(-1)].reshape(pixels.shape[:-1])
+
+    def _decode_array(self, values):
+        return self.get_palette_array()[values]
+
+    def copy_from(self, other):
+        if type(other) is type(self):
+            self.palette[:] = other.palette
+            self.palette_used = other.palette_used
+            self.palette_lookup = dict(other.palette_lookup)
+            self.palette_hue_shift = other.palette_hue_shift
+            self.palette_fade = other.palette_fade
+            self.palette_flash = other.palette_flash
+            self._palette_changed()
+        FlatFloorCanvas.copy_from(self, other)
 
+    # Forget all the colours that have been drawn, leaving just black in
+    #  entry 0. Anything already on the canvas needs to be redrawn
+    def reset_palette(self):
+        self.palette = [self.BLACK] * self.PALETTE_SIZE
+        # The number of palette entries handed out so far
+        self.palette_used = 1
+        # colour -> index, for the colours that have been drawn
+        self.palette_lookup = {self.BLACK: 0}
+        self._palette_changed()
+
+    # Set a palette entry to a packed colour or (r, g, b) tuple. Everything
+    #  drawn with that index changes colour
+    def set_palette_entry(self, index, colour):
+        if type(colour) is tuple:
+            colour = self.pack_colour_tuple(colour)
+        old_colour = self.palette[index]
+        if self.palette_lookup.get(old_colour) == index:
+            del self.palette_lookup[old_colour]
+        self.palette[index] = colour
+        self.palette_lookup.setdefault(colour, index)
+        self._palette_changed()
+
+    # The colour of a palette entry, before any effects are applied
+    def get_palette_entry(self, index):
+        return self.palette[index]
+
+    # Palette effects, which build up until clear_palette_effects() is called.
+    # Rotate the hue of every colour by amount [0, 1]
+    def shift_palette_hue(self, amount):
+        self.palette_hue_shift = (self.palette_hue_shift + amount) % 1.0
+        self._palette_changed()
+
+    # Scale the brightness of every colour by factor [0, 1]
+    def fade_palette(self, factor):
+        self.palette_fade *= factor
+        self._palette_changed()
+
+    # Mix every colour towards the given colour (e.g. white for a flash on
+    #  the beat), by amount [0, 1]
+    def flash_palette(self, colour, amount):
+        if type(colour) is not tuple:
+            colour = self.unpack_colour_tuple(colour)
+        self.palette_flash = (self.normalize(colour), amount)
+        self._palette_changed()
+
+    def clear_palette_effects(self):
+        self.palette_hue_shift = 0.0
+        self.palette_fade = 1.0
+        self.palette_flash = None
+        self._palette_changed()
+
+    def _palette_changed(self):
+        self.resolved_palette = None
+        self.palette_array = None
+
+    # The palette with the effects applied, as packed colours. This is only
+    #  worked out again when the palette or the effects change
+    def _resolve_palette(self):
+        if self.resolved_palette is None:
+            if self.palette_hue_shift == 0.0 and self.palette_fade == 1.0 and self.palette_flash is None:
+                self.resolved_palette = list(self.palette)
+            else:
+                self.resolved_palette = [self._apply_palette_effects(colour) for colour in self.palette]
+        return self.resolved_palette
+
+    def _apply_palette_effects(self, colour):
+        (red, green, blue) = self.normalize(self.unpack_colour_tuple(colour))
+        if self.palette_hue_shift != 0.0:
+            (hue, lightness, saturation) = colorsys.rgb_to_hls(red, green, blue)
+            hue = (hue + self.palette_hue_shift) % 1.0
+            (red, green, blue) = colorsys.hls_to_rgb(hue, lightness, saturation)
+        fade = self.palette_fade
+        (red, green, blue) = (red * fade, green * fade, blue * fade)
+        if self.palette_flash is not None:
+            ((flash_red, flash_green, flash_blue), amount) = self.palette_flash
+            red += (flash_red - red) * amount
+            green += (flash_green - green) * amount
+            blue += (flash_blue - blue) * amount
+        return self.pack_colour_tuple(self.reformat((min(max(red, 0.0), 1.0),
+                                                     min(max(green, 0.0), 1.0),
+                                                     min(max(blue, 0.0), 1.0))))
+
+    # The palette, with the effects applied, as a (256, 3) uint8 array
+    def get_palette_array(self):
+        if self.palette_array is None:
+            self.palette_array = unpack_pixel_array(numpy.array(self._resolve_palette(), dtype=numpy.uint32))
+        return self.palette_array
+
+    # Draw with a palette index rather than a colour
+    def set_pixel_index(self, x, y, index):
+        x = int(round(x, 0))
+        y = int(round(y, 0))
+        if self.is_in_range(x, y):
+            self.cells[x * self.height + y] = index
+
+    def get_pixel_index(self, x, y):
+        if self.is_in_range(x, y):
+            return self.cells[x * self.height + y]
         return None
 
+    # A (width, height) uint8 array of the indices, which shares the
+    #  canvas' memory, so writing to it draws on the canvas
+    def get_index_array(self):
+        return self._cell_view()
+
+
+class PlanarFloorCanvas(FloorCanvas):
+    """
+    A canvas stored as three planes of 8 bit values, all the red values,
+    then all the green, then all the blue, in one unsigned byte array (3
+    bytes a cell).
+    """
+
+    def _create_storage(self):
+        self.size = self.width * self.height
+        self.planes = array('B', [0]) * (3 * self.size)
+
+    # A (width, height, 3) numpy view of the planes, which shares their memory
+    def _plane_view(self):
+        if numpy is None:
+            raise ImportError("numpy is required for bulk operations on a PlanarFloorCanvas")
+        planes = numpy.frombuffer(self.planes, dtype=numpy.uint8)
+        return planes.reshape((3, self.width, self.height)).transpose((1, 2, 0))
+
+    def _get_pixel(self, x, y):
+        i = x * self.height + y
+        return (self.planes[i] << 16) + (self.planes[self.size + i] << 8) + self.planes[2 * self.size + i]
+
+    def _put_pixel(self, x, y, colour):
+        i = x * self.height + y
+        self.planes[i] = (colour >> 16) & 0xFF
+        self.planes[self.size + i] = (colour >> 8) & 0xFF
+        self.planes[2 * self.size + i] = colour & 0xFF
+
+    def _fill(self, colour):
+        for (plane, value) in enumerate(((colour >> 16) & 0xFF, (colour >> 8) & 0xFF, colour & 0xFF)):
+            self.planes[plane * self.size:(plane + 1) * self.size] = array('B', [value]) * self.size
+
+    def _fill_block(self, x0, y0, x1, y1, colour):
+        for (plane, value) in enumerate(((colour >> 16) & 0xFF, (colour >> 8) & 0xFF, colour & 0xFF)):
+            span = array('B', [value]) * (y1 - y0)
+            for x in range(x0, x1):
+                start = plane * self.size + x * self.height
+                self.planes[start + y0:start + y1] = span
+
+    def _write_block(self, x0, y0, block, mask=None):
+        (block_width, block_height) = block.shape[:2]
+        region = self._plane_view()[x0:x0 + block_width, y0:y0 + block_height]
+        if mask is None:
+            region[...] = block
+        else:
+            region[mask] = block[mask]
+
+    def copy_from(self, other):
+        if isinstance(other, PlanarFloorCanvas):
+            self.planes[:] = other.planes
+        else:
+            self.set_pixels(other.get_pixel_array())
+
+    def get_canvas_array(self):
+        return [[self._get_pixel(x, y) for y in range(self.height)] for x in range(self.width)]
+
+    # Not a copy, anything written to the returned array appears on the canvas
+    def get_pixel_array(self):
+        return self._plane_view()
+
+
+class SupersampledCanvas(ArrayFloorCanvas):
+    """
+    An off-screen canvas with factor x factor pixels for every cell of the
+    floor, which is drawn on with the usual canvas methods and then
+    filtered down onto the real canvas with resolve(). Anything drawn at a
+    sub-cell position ends up smoothly spread over the cells it covers,
+    without any antialiasing code of its own.
+
+    The drawing methods work in supersampled pixels, scale_point() and
+    scale_length() convert from floor cells.
+    """
+
+    def __init__(self, width=0, height=0, factor=4, colour=FloorCanvas.BLACK):
+        self.factor = factor
+        self.floor_width = width
+        self.floor_height = height
+        ArrayFloorCanvas.__init__(self, width * factor, height * factor, colour)
+
+    def get_factor(self):
+        return self.factor
+
+    def get_floor_size(self):
+        return (self.floor_width, self.floor_height)
+
+    # Where the centre of a floor cell (or any point between them) is in
+    #  supersampled pixels
+    def scale_point(self, x, y):
+        return ((x + 0.5) * self.factor - 0.5, (y + 0.5) * self.factor - 0.5)
+
+    def scale_length(self, length):
+        return length * self.factor
+
+    # Filter the supersampled pixels down to a (floor width, floor height, 3)
+    #  array of floats in [0, 1], with either a box or tent filter
+    def downsample(self, filter="box"):
+        if filter not in DOWNSAMPLE_FILTERS:
+            raise ValueError("Unknown downsampling filter '%s', expected one of %s" %
+                             (filter, sorted(DOWNSAMPLE_FILTERS.keys())))
+        return DOWNSAMPLE_FILTERS[filter](self.pixels, self.factor) / 255.0
+
+    # Downsample onto another canvas, with the top left at (x_pos, y_pos)
+    def resolve(self, canvas, filter="box", x_pos=0, y_pos=0):
+        canvas.set_pixels(self.downsample(filter), x_pos, y_pos)
+        return canvas
+
+
+# The available ways of storing the canvas, as selected by the
+#  'canvas_storage' option in the system config
+CANVAS_STORAGE = {
+    "list": FloorCanvas,
+    "numpy": ArrayFloorCanvas,
+    "packed": PackedFloorCanvas,
+    "rgb565": Rgb565FloorCanvas,
+    "planar": PlanarFloorCanvas,
+    "palette": PaletteFloorCanvas,
+}
+
+
+def create_canvas(width, height, storage=None):
+    """
+    Create a canvas of the given size using the named storage, falling back
+    to the plain list canvas if the storage is unknown or unavailable
+    """
+    logger = logging.getLogger(__name__)
+    if storage is None:
+        storage = "list"
+    if storage not in CANVAS_STORAGE:
+        logger.warn("Unknown canvas storage '%s', using a list canvas instead" % storage)
+        storage = "list"
+    if CANVAS_STORAGE[storage].requires_numpy and numpy is None:
+        logger.warn("numpy is not available for '%s' canvas storage, using a list canvas instead" % storage)
+        storage = "list"
+    return CANVAS_STORAGE[storage](width, height)
+
+
+# Convert between a (..., 3) uint8 array of (r,g,b) and an array of packed
+#  0xRRGGBB ints, without looping over the pixels in python
+def pack_pixel_array(pixels):
+    pixels = pixels.astype(numpy.uint32)
+    return (pixels[..., 0] << 16) | (pixels[..., 1] << 8) | pixels[..., 2]
+
+
+# Turn an array of colours into the uint8 (..., 3) form the canvas stores.
+# Floats are taken to be in [0, 1] and are scaled up, everything is clamped
+#  into range rather than being allowed to wrap
+def to_pixel_array(pixels):
+    pixels = numpy.asarray(pixels)
+    if pixels.dtype == numpy.uint8:
+        return pixels
+    if pixels.dtype.kind == 'f':
+        pixels = numpy.rint(pixels * 255.0)
+    return numpy.clip(pixels, 0, 255).astype(numpy.uint8)
+
+
+def unpack_pixel_array(packed):
+    packed = numpy.asarray(packed)
+    pixels = numpy.empty(packed.shape + (3,), dtype=numpy.uint8)
+    pixels[..., 0] = (packed >> 16) & 0xFF
+    pixels[..., 1] = (packed >> 8) & 0xFF
+    pixels[..., 2] = packed & 0xFF
+    return pixels
+
+
+# A single colour as an (r, g, b) tuple of 0-255 ints, from either of the ways
+#  colours are given to the canvas, a packed 0xRRGGBB int or a tuple. This
+#  one doesn't need numpy
+def unpack_colour(colour):
+    if type(colour) is not tuple:
+        colour = ((colour >> 16) & 0xFF, (colour >> 8) & 0xFF, colour & 0xFF)
+    return (int(colour[0]), int(colour[1]), int(colour[2]))
+
+
+# Reduce a (width * factor, height * factor, ...) array to (width, height,
+#  ...) by averaging each factor x factor block
+def downsample_box(pixels, factor):
+    pixels = numpy.asarray(pixels)
+    width = pixels.shape[0] // factor
+    height = pixels.shape[1] // factor
+    blocks = pixels[:width * factor, :height * factor].reshape((width, factor, height, factor) + pixels.shape[2:])
+    return blocks.mean(axis=(1, 3))
+
+
+# The weights of a tent filter two cells wide, centred on each cell, as a
+#  (size, size * factor) array with each row adding up to 1
+def _tent_weights(size, factor):
+    centres = (numpy.arange(size) + 0.5) * factor
+    samples = numpy.arange(size * factor) + 0.5
+    weights = numpy.maximum(0.0, 1.0 - abs(samples[numpy.newaxis, :] - centres[:, numpy.newaxis]) / factor)
+    return weights / weights.sum(axis=1)[:, numpy.newaxis]
+
+
+# Like downsample_box(), but each cell also takes some of its neighbours'
+#  samples, tailing off with distance, which gives smoother motion
+def downsample_tent(pixels, factor):
+    pixels = numpy.asarray(pixels, dtype=float)
+    width = pixels.shape[0] // factor
+    height = pixels.shape[1] // factor
+    pixels = pixels[:width * factor, :height * factor]
+    columns = numpy.tensordot(_tent_weights(width, factor), pixels, axes=(1, 0))
+    return numpy.moveaxis(numpy.tensordot(_tent_weights(height, factor), columns, axes=(1, 1)), 0, 1)
+
+
+DOWNSAMPLE_FILTERS = {
+    "box": downsample_box,
+    "tent": downsample_tent,
+}
+
+
+# Array versions of the colorsys conversions. They take and return
+#  (..., 3) arrays of floats in the range [0, 1], and give the same answers
+#  as colorsys does for each pixel, without calling it once per pixel
+
+# The hue calculation is the same for HSV and HLS
+def _hue_array(red, green, blue, maxc, rangec):
+    # Avoid dividing by zero for the greys, their hue is 0 anyway
+    rangec = numpy.where(rangec == 0, 1.0, rangec)
+    rc = (maxc - red) / rangec
+    gc = (maxc - green) / rangec
+    bc = (maxc - blue) / rangec
+    hue = numpy.where(red == maxc, bc - gc,
+                      numpy.where(green == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+    return (hue / 6.0) % 1.0
+
+
+def rgb_to_hsv_array(rgb):
+    rgb = numpy.asarray(rgb, dtype=float)
+    (red, green, blue) = (rgb[..., 0], rgb[..., 1], rgb[..., 2])
+    maxc = rgb.max(axis=-1)
+    minc = rgb.min(axis=-1)
+    rangec = maxc - minc
+    grey = rangec == 0
+    hsv = numpy.empty(rgb.shape)
+    hsv[..., 0] = numpy.where(grey, 0.0, _hue_array(red, green, blue, maxc, rangec))
+    hsv[..., 1] = numpy.where(grey, 0.0, rangec / numpy.where(maxc == 0, 1.0, maxc))
+    hsv[..., 2] = maxc
+    return hsv
+
+
+def hsv_to_rgb_array(hsv):
+    hsv = numpy.asarray(hsv, dtype=float)
+    (hue, saturation, value) = (hsv[..., 0], hsv[..., 1], hsv[..., 2])
+    # int() in colorsys truncates towards zero, so do the same
+    i = numpy.trunc(hue * 6.0)
+    f = hue * 6.0 - i
+    p = value * (1.0 - saturation)
+    q = value * (1.0 - saturation * f)
+    t = value * (1.0 - saturation * (1.0 - f))
+    i = i.astype(int) % 6
+    rgb = numpy.empty(hsv.shape)
+    rgb[..., 0] = numpy.choose(i, [value, q, p, p, t, value])
+    rgb[..., 1] = numpy.choose(i, [t, value, value, q, p, p])
+    rgb[..., 2] = numpy.choose(i, [p, p, t, value, value, q])
+    # With no saturation it is just grey
+    grey = saturation == 0.0
+    rgb[grey] = value[grey][..., numpy.newaxis]
+    return rgb
+
+
+def rgb_to_hls_array(rgb):
+    rgb = numpy.asarray(rgb, dtype=float)
+    (red, green, blue) = (rgb[..., 0], rgb[..., 1], rgb[..., 2])
+    maxc = rgb.max(axis=-1)
+    minc = rgb.min(axis=-1)
+    sumc = maxc + minc
+    rangec = maxc - minc
+    lightness = sumc / 2.0
+    grey = rangec == 0
+    divisor = numpy.where(lightness <= 0.5, sumc, 2.0 - sumc)
+    hls = numpy.empty(rgb.shape)
+    hls[..., 0] = numpy.where(grey, 0.0, _hue_array(red, green, blue, maxc, rangec))
+    hls[..., 1] = lightness
+    hls[..., 2] = numpy.where(grey, 0.0, rangec / numpy.where(divisor == 0, 1.0, divisor))
+    return hls
+
+
+def _hls_value_array(m1, m2, hue):
+    hue = hue % 1.0
+    return numpy.where(hue < 1.0 / 6.0, m1 + (m2 - m1) * hue * 6.0,
+                       numpy.where(hue < 0.5, m2,
+                                   numpy.where(hue < 2.0 / 3.0, m1 + (m2 - m1) * (2.0 / 3.0 - hue) * 6.0, m1)))
+
 
+def hls_to_rgb_array(hls):
+    hls = numpy.asarray(hls, dtype=float)
+    (hue, lightness, saturation) = (hls[..., 0], hls[..., 1], hls[..., 2])
+    m2 = numpy.where(lightness <= 0.5, lightness * (1.0 + saturation), lightness + saturation - lightness * saturation)
+    m1 = 2.0 * lightness - m2
+    rgb = numpy.empty(hls.shape)
+    rgb[..., 0] = _hls_value_array(m1, m2, hue + 1.0 / 3.0)
+    rgb[..., 1] = _hls_value_array(m1, m2, hue)
+    rgb[..., 2] = _hls_value_array(m1, m2, hue - 1.0 / 3.0)
+    # With no saturation it is just grey
+    grey = saturation == 0.0
+    rgb[grey] = lightness[grey][..., numpy.newaxis]
+    return rgb
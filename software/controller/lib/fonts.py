@@ -0,0 +1,257 @@
+__authors__ = ['Andrew Taylor']
+
+import logging
+import os
+from array import array
+
+from lib.cache import LRUCache
+
+# numpy is only used to turn the rendered text into a mask that can be
+#  drawn in one go, without it the text is drawn a pixel at a time
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    unichr
+except NameError:
+    unichr = chr
+
+# Where fonts asked for by name, rather than by path, are found
+FONT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fonts")
+
+
+class BitmapFont(object):
+    """
+    A bitmap font, loaded from a BDF file, that can be any height and have
+    characters of different widths.
+
+    All the glyphs are kept in one array of packed columns, each column
+    being bytes_per_column bytes with the bits the rows from the top down
+    (like TextWriter's 5x7 font, but not limited to 8 rows), so drawing a
+    string is a matter of OR-ing the columns of its glyphs together.
+
+    BDF has no kerning, so as an extension "KERNPAIR left right dx" lines
+    (the encodings of the two characters, and how far to move the right
+    hand one) are read from outside the glyph definitions.
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, name, height, ascent):
+        self.name = name
+        self.height = height
+        self.ascent = ascent
+        self.bytes_per_column = (height + 7) // 8
+        self.columns = array('B')
+        # character -> (first column, number of columns, x offset, advance)
+        self.glyphs = {}
+        self.kerning = {}
+        self.default_character = None
+        # Strings that have already been put together, each entry is
+        #  [columns, width, mask] with the mask only made when first needed
+        self.rendered_text = LRUCache(128)
+
+    def add_glyph(self, character, columns, x_offset, advance):
+        # columns is a list of ints, one per column, bit 0 the top row
+        first = len(self.columns) // self.bytes_per_column
+        for column in columns:
+            for byte in range(self.bytes_per_column):
+                self.columns.append((column >> (8 * byte)) & 0xFF)
+        self.glyphs[character] = (first, len(columns), x_offset, advance)
+
+    def has_glyph(self, character):
+        return character in self.glyphs
+
+    def get_glyph(self, character):
+        if character in self.glyphs:
+            return self.glyphs[character]
+        if self.default_character is not None:
+            return self.glyphs[self.default_character]
+        raise KeyError(character)
+
+    def get_kerning(self, left, right):
+        return self.kerning.get((left, right), 0)
+
+    def _layout(self, text):
+        # Where each glyph goes, as (glyph, x), and the width of the lot,
+        #  which is where the next character would go, or the right of the
+        #  last glyph if it sticks out further than that
+        placed = []
+        x = 0
+        right = 0
+        previous = None
+        for character in text:
+            glyph = self.get_glyph(character)
+            if previous is not None:
+                x += self.get_kerning(previous, character)
+            placed.append((glyph, x + glyph[2]))
+            right = max(right, x + glyph[2] + glyph[1])
+            x += glyph[3]
+            previous = character
+        # Glyphs that start to the left of the pen (a negative x offset on
+        #  the first character) are moved right so none of them is cut off
+        left = min([0] + [position for (glyph, position) in placed])
+        placed = [(glyph, position - left) for (glyph, position) in placed]
+        return (placed, max(x, right) - left)
+
+    def get_text_size(self, text):
+        """
+        The (width, height) that the text would take up when drawn
+        """
+        if len(text) == 0:
+            return (0, 0)
+        return (self._render(text)[1], self.height)
+
+    def _render(self, text):
+        rendered = self.rendered_text.get(text)
+        if rendered is None:
+            (placed, width) = self._layout(text)
+            bytes_per_column = self.bytes_per_column
+            columns = array('B', [0]) * (width * bytes_per_column)
+            for ((first, count, x_offset, advance), position) in placed:
+                source = first * bytes_per_column
+                target = position * bytes_per_column
+                for i in range(count * bytes_per_column):
+                    columns[target + i] |= self.columns[source + i]
+            rendered = self.rendered_text.put(text, [columns, width, None])
+        return rendered
+
+    def get_text_mask(self, text):
+        """
+        A (width, height) boolean numpy array which is True for the pixels to
+        draw to make the text. It is shared, so don't change it
+        """
+        rendered = self._render(text)
+        if rendered[2] is None:
+            columns = numpy.frombuffer(rendered[0], dtype=numpy.uint8).reshape(rendered[1], self.bytes_per_column)
+            bits = (columns[:, :, numpy.newaxis] >> numpy.arange(8)) & 0x01
+            mask = bits.reshape(rendered[1], self.bytes_per_column * 8)[:, :self.height].astype(bool)
+            mask.flags.writeable = False
+            rendered[2] = mask
+        return rendered[2]
+
+    def draw_text(self, surface, text, colour, x_pos, y_pos):
+        """
+        Draws text in the specified place, in the appropriate colour, and
+        returns its (width, height)
+        """
+        (width, height) = self.get_text_size(text)
+        if width > 0:
+            if numpy is not None:
+                surface.fill_mask(self.get_text_mask(text), colour, x_pos, y_pos)
+            else:
+                columns = self._render(text)[0]
+                for x in range(0, width):
+                    for y in range(0, height):
+                        if (columns[x * self.bytes_per_column + y // 8] >> (y % 8)) & 0x01:
+                            if type(colour) == tuple:
+                                surface.set_pixel_tuple(x + x_pos, y + y_pos, colour)
+                            else:
+                                surface.set_pixel(x + x_pos, y + y_pos, colour)
+        return (width, height)
+
+
+def read_bdf(path):
+    """
+    Load a BDF font file into a BitmapFont
+    """
+    with open(path) as bdf:
+        lines = [line.split() for line in bdf]
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    font = None
+    ascent = None
+    descent = None
+    bounding_box = None
+    default_encoding = None
+    kerning = []
+    i = 0
+    while i < len(lines):
+        words = lines[i]
+        i += 1
+        if len(words) == 0:
+            continue
+        keyword = words[0]
+        if keyword == "FONTBOUNDINGBOX":
+            bounding_box = [int(word) for word in words[1:5]]
+        elif keyword == "FONT_ASCENT":
+            ascent = int(words[1])
+        elif keyword == "FONT_DESCENT":
+            descent = int(words[1])
+        elif keyword == "DEFAULT_CHAR":
+            default_encoding = int(words[1])
+        elif keyword == "KERNPAIR":
+            kerning.append((int(words[1]), int(words[2]), int(words[3])))
+        elif keyword == "STARTCHAR":
+            if font is None:
+                if ascent is None or descent is None:
+                    # Without the properties, go by the bounding box
+                    (ascent, descent) = (bounding_box[1] + bounding_box[3], -bounding_box[3])
+                font = BitmapFont(name, ascent + descent, ascent)
+            i = _read_glyph(font, lines, i)
+
+    if font is None:
+        raise ValueError("No glyphs found in font file %s" % path)
+    for (left, right, dx) in kerning:
+        font.kerning[(unichr(left), unichr(right))] = dx
+    if default_encoding is not None and font.has_glyph(unichr(default_encoding)):
+        font.default_character = unichr(default_encoding)
+    return font
+
+
+def _read_glyph(font, lines, i):
+    # Read one STARTCHAR ... ENDCHAR block, starting from the line after
+    #  STARTCHAR, and return the index of the line after it
+    encoding = -1
+    advance = 0
+    (width, height, x_offset, y_offset) = (0, 0, 0, 0)
+    while lines[i][0] != "BITMAP":
+        words = lines[i]
+        if words[0] == "ENCODING":
+            encoding = int(words[1])
+        elif words[0] == "DWIDTH":
+            advance = int(words[1])
+        elif words[0] == "BBX":
+            (width, height, x_offset, y_offset) = [int(word) for word in words[1:5]]
+        i += 1
+    rows = [int(lines[i + 1 + row][0], 16) for row in range(height)]
+    i += 1 + height
+    while lines[i][0] != "ENDCHAR":
+        i += 1
+
+    # Encodings of -1 are glyphs that aren't mapped to a character
+    if encoding >= 0:
+        # Each row is padded to a whole number of bytes, with the leftmost
+        #  pixel in the top bit. Turn them into columns, with the top of
+        #  the bounding box moved to where it is relative to the ascent
+        row_bits = ((width + 7) // 8) * 8
+        top = font.ascent - (y_offset + height)
+        columns = []
+        for x in range(width):
+            column = 0
+            for (y, row) in enumerate(rows):
+                if (row >> (row_bits - 1 - x)) & 0x01 and 0 <= top + y < font.height:
+                    column |= 1 << (top + y)
+            columns.append(column)
+        font.add_glyph(unichr(encoding), columns, x_offset, advance)
+    return i + 1
+
+
+# Fonts that have been loaded, by path, shared between all the plugins
+loaded_fonts = {}
+
+
+def load_font(name):
+    """
+    Get a font, by the name of a file in the fonts directory (without the
+    .bdf) or the path to a BDF file. Each font is only read once
+    """
+    path = name
+    if not os.path.exists(path):
+        path = os.path.join(FONT_DIR, "%s.bdf" % name)
+    path = os.path.abspath(path)
+    if path not in loaded_fonts:
+        loaded_fonts[path] = read_bdf(path)
+        BitmapFont.logger.info("Loaded font %s, %d glyphs" % (path, len(loaded_fonts[path].glyphs)))
+    return loaded_fonts[path]
@@ -0,0 +1,115 @@
+__authors__ = ['Andrew Taylor']
+
+import logging
+
+from lib.floorcanvas import create_canvas
+
+
+class FrameBufferPool(object):
+    # A fixed set of canvases, all allocated up front, that are handed out
+    #  and given back rather than being created for every frame.
+    # Each buffer is reference counted, so a frame can be passed on to
+    #  something else (e.g. an output that is still sending it) which
+    #  retains it, and the buffer only goes back in the pool once everyone
+    #  has released it.
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, width, height, storage=None, size=3):
+        self.width = width
+        self.height = height
+        self.storage = storage
+        self.buffers = []
+        self.free = []
+        self.references = {}
+        for i in range(size):
+            self.free.append(self._new_buffer())
+
+    def _new_buffer(self):
+        buffer = create_canvas(self.width, self.height, self.storage)
+        self.buffers.append(buffer)
+        return buffer
+
+    def get_size(self):
+        return (self.width, self.height)
+
+    def __len__(self):
+        return len(self.buffers)
+
+    # How many buffers are available to be acquired right now
+    def available(self):
+        return len(self.free)
+
+    # Take a buffer out of the pool, with one reference held by the caller.
+    # Its contents are whatever was last drawn on it.
+    # If the pool has run dry then another buffer is allocated, which
+    #  shouldn't happen unless something is holding on to frames
+    def acquire(self):
+        if len(self.free) > 0:
+            buffer = self.free.pop()
+        else:
+            self.logger.warn("Frame buffer pool exhausted, allocating buffer %d" % (len(self.buffers) + 1))
+            buffer = self._new_buffer()
+        self.references[id(buffer)] = 1
+        return buffer
+
+    # Hold another reference to a buffer that has already been acquired
+    def retain(self, buffer):
+        if id(buffer) not in self.references:
+            raise ValueError("Buffer is not in use, it can't be retained")
+        self.references[id(buffer)] += 1
+        return buffer
+
+    # Give up a reference to a buffer, returning it to the pool if that was
+    #  the last one
+    def release(self, buffer):
+        if id(buffer) not in self.references:
+            raise ValueError("Buffer is not in use, it can't be released")
+        self.references[id(buffer)] -= 1
+        if self.references[id(buffer)] == 0:
+            del self.references[id(buffer)]
+            self.free.append(buffer)
+
+
+class DoubleBuffer(object):
+    # A front and back pair of buffers from a pool.
+    # The plugins draw on the back buffer, and once the frame is finished
+    #  swap() makes it the front buffer, which is what the outputs send,
+    #  while the plugins carry on with the next frame on a fresh back buffer.
+    # No pixels are copied by the swap itself. Most plugins expect the canvas
+    #  to still have the last frame on it, so get_back() gives the back buffer
+    #  a copy of the front one the first time it is asked for after a swap,
+    #  unless it is told not to preserve it (or preserve is False), which is
+    #  for plugins that redraw the whole frame anyway.
+
+    def __init__(self, pool, preserve=True):
+        self.pool = pool
+        self.preserve = preserve
+        self.front = None
+        self.back = pool.acquire()
+        # Whether the back buffer has the last frame on it yet (there is no
+        #  last frame to begin with)
+        self.preserved = True
+
+    # The buffer to draw the next frame on
+    def get_back(self, preserve=None):
+        if preserve is None:
+            preserve = self.preserve
+        if preserve and not self.preserved:
+            self.back.copy_from(self.front)
+            self.preserved = True
+        return self.back
+
+    # The last complete frame, or None before the first swap
+    def get_front(self):
+        return self.front
+
+    def swap(self):
+        if self.front is not None:
+            self.pool.release(self.front)
+        self.front = self.back
+        self.back = self.pool.acquire()
+        self.preserved = False
+        # Damage is worked out against the previous frame, whichever buffer
+        #  it was drawn on, so all the buffers share the one copy of it
+        self.back.previous_frame = self.front.previous_frame
+        return self.front
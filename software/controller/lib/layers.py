@@ -0,0 +1,149 @@
+__authors__ = ['Andrew Taylor']
+
+import logging
+
+import numpy
+
+from lib.floorcanvas import unpack_colour
+
+
+class CanvasLayer(object):
+    # A layer is a float RGBA array, rgba[x][y] = (r, g, b, a) with
+    #  everything in the range [0, 1], that is drawn over whatever is
+    #  underneath it using its blend mode when the stack is composited.
+    # Plugins write straight into the rgba array (or use the helpers
+    #  below), nothing touches the canvas until composite() is called
+
+    BLEND_MODES = ["normal", "add", "max", "multiply", "screen"]
+
+    def __init__(self, width, height, blend="normal", opacity=1.0):
+        if blend not in self.BLEND_MODES:
+            raise ValueError("Unknown blend mode '%s', expected one of %s" % (blend, self.BLEND_MODES))
+        self.width = width
+        self.height = height
+        self.blend = blend
+        self.opacity = opacity
+        self.visible = True
+        self.rgba = numpy.zeros((width, height, 4), dtype=float)
+
+    # Make the layer completely transparent again
+    def clear(self):
+        self.rgba[...] = 0.0
+
+    # Give the whole layer (or just the masked part of it) the same colour
+    def fill(self, colour, alpha=1.0, mask=None):
+        value = list(_float_colour(colour)) + [alpha]
+        if mask is None:
+            self.rgba[...] = value
+        else:
+            self.rgba[numpy.asarray(mask, dtype=bool)] = value
+
+    # Set the colour and alpha of a whole (width, height, 3) block, with its top
+    #  left at (x_pos, y_pos). The alpha can be a single value or a (width,
+    #  height) array, and anything off the edge of the layer is clipped
+    def set_pixels(self, rgb, alpha=1.0, x_pos=0, y_pos=0):
+        # Like the canvas, floats are [0, 1] and anything else is 0-255
+        rgb = numpy.asarray(rgb)
+        if rgb.dtype.kind != 'f':
+            rgb = rgb / 255.0
+        (block_width, block_height) = rgb.shape[:2]
+        x0 = max(x_pos, 0)
+        y0 = max(y_pos, 0)
+        x1 = min(x_pos + block_width, self.width)
+        y1 = min(y_pos + block_height, self.height)
+        if x0 >= x1 or y0 >= y1:
+            return None
+        region = self.rgba[x0:x1, y0:y1]
+        region[..., :3] = rgb[x0 - x_pos:x1 - x_pos, y0 - y_pos:y1 - y_pos]
+        alpha = numpy.asarray(alpha, dtype=float)
+        if alpha.ndim == 2:
+            alpha = alpha[x0 - x_pos:x1 - x_pos, y0 - y_pos:y1 - y_pos]
+        region[..., 3] = alpha
+
+    # Set a single pixel, mostly for small details that aren't worth building
+    #  an array for
+    def set_pixel(self, x, y, colour, alpha=1.0):
+        x = int(round(x, 0))
+        y = int(round(y, 0))
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.rgba[x, y] = list(_float_colour(colour)) + [alpha]
+
+
+class LayerStack(object):
+    # An ordered collection of layers, bottom first, which are combined
+    #  onto a canvas in a single pass of array operations per layer, rather
+    #  than blending every pixel of every layer with set_pixel(alpha=...)
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.layers = []
+
+    def get_size(self):
+        return (self.width, self.height)
+
+    def __len__(self):
+        return len(self.layers)
+
+    # Add a new layer on top of the existing ones and return it
+    def add_layer(self, blend="normal", opacity=1.0):
+        layer = CanvasLayer(self.width, self.height, blend, opacity)
+        self.layers.append(layer)
+        return layer
+
+    def remove_layer(self, layer):
+        self.layers.remove(layer)
+
+    def clear(self):
+        for layer in self.layers:
+            layer.clear()
+
+    def composite(self, canvas=None, background=None):
+        """
+        Combine all the visible layers, bottom first, over the background and
+        return the result as a (width, height, 3) float array. If no
+        background is given the current contents of the canvas are used
+        (or black if there is no canvas). If a canvas is given, the result
+        is also written onto it.
+        """
+        if background is not None:
+            result = numpy.empty((self.width, self.height, 3), dtype=float)
+            result[...] = _float_colour(background)
+        elif canvas is not None:
+            result = canvas.get_pixel_array().astype(float) / 255.0
+        else:
+            result = numpy.zeros((self.width, self.height, 3), dtype=float)
+
+        for layer in self.layers:
+            if not layer.visible or layer.opacity <= 0.0:
+                continue
+            source = layer.rgba[..., :3]
+            alpha = numpy.clip(layer.rgba[..., 3:] * layer.opacity, 0.0, 1.0)
+            blended = _blend(layer.blend, result, source)
+            # Mix the blended colour back in according to the alpha, in place
+            result += (blended - result) * alpha
+
+        if canvas is not None:
+            canvas.set_pixels(result)
+        return result
+
+
+def _blend(mode, below, above):
+    if mode == "normal":
+        return above
+    elif mode == "add":
+        return numpy.minimum(below + above, 1.0)
+    elif mode == "max":
+        return numpy.maximum(below, above)
+    elif mode == "multiply":
+        return below * above
+    elif mode == "screen":
+        return 1.0 - (1.0 - below) * (1.0 - above)
+    raise ValueError("Unknown blend mode '%s'" % mode)
+
+
+# Colours can be given the usual canvas ways, a packed 0xRRGGBB int or an
+#  (r, g, b) tuple of 0-255 values, and are scaled into [0, 1]
+def _float_colour(colour):
+    return numpy.array(unpack_colour(colour), dtype=float) / 255.0
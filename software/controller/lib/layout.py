@@ -63,13 +63,22 @@ class DisplayLayout(object):
     """
     Return an ordered list of (x,y) coordinates
     Outputing data in this order will be correct for the defined dance floor
+    If a list of modules is given, only the cells on those modules are
+     included, in the order they come in, for a chain of just those modules
     """
 
-    def get_converter(self):
+    def get_converter(self, modules=None):
+        positions = None
+        if modules is not None:
+            positions = [(first, last) for (module, first, last) in self.module_positions if module in modules]
         order = dict()
         for y in range(0, self.size_y):
             for x in range(0, self.size_x):
-                order[self.layout_mapping[x][y]] = (x, y)
+                position = self.layout_mapping[x][y]
+                if positions is not None:
+                    if position is None or not any(first <= position < last for (first, last) in positions):
+                        continue
+                order[position] = (x, y)
 
         ordered_list = []
         for pixel in sorted(order):
@@ -77,6 +86,23 @@ class DisplayLayout(object):
 
         return ordered_list
 
+    """
+    Return an [x][y] array of which module (by its name in the config) each
+     cell is on, or None for cells that aren't on any module
+    """
+
+    def get_module_map(self):
+        module_map = [[None for y in range(0, self.size_y)] for x in range(0, self.size_x)]
+        for x in range(0, self.size_x):
+            for y in range(0, self.size_y):
+                position = self.layout_mapping[x][y]
+                if position is None:
+                    continue
+                for (module, first, last) in self.module_positions:
+                    if first <= position < last:
+                        module_map[x][y] = module
+        return module_map
+
     def get_position(self, x, y):
         if x < 0 or y < 0 or x >= self.size_x or y >= self.size_y:
             return None
@@ -127,9 +153,13 @@ class DisplayLayout(object):
         # the serial location if present
         self.layout_mapping = [[None for y in range(0, self.size_y)] for x in range(0, self.size_x)]
         self.pixel_count = 0
+        # The range of serial positions each module takes up, as
+        #  (module, first, last + 1), in the order they are sent
+        self.module_positions = []
 
         for module in sorted(self.module_config.keys()):
             module_data = self.module_config[module]
+            first_position = self.pixel_count
             module_orientation = module_data["orientation"]
             module_height = module_data["height"]
             module_width = module_data["width"]
@@ -156,6 +186,7 @@ class DisplayLayout(object):
                               module_data["y_position"])
             else:
                 self.logger.error("The orientation of a tile in the config was not recognised")
+            self.module_positions.append((module, first_position, self.pixel_count))
 
 
     def calculate_floor_size(self):
@@ -0,0 +1,106 @@
+__authors__ = ['Andrew Taylor']
+
+# An emulation of how the module firmware (driver_boards/firmware/DanceFloor.ino)
+#  reads the serial data, so that what the controller sends can be checked
+#  without a floor attached, e.g.
+#
+#    chain = ModuleChain(9)
+#    chain.receive(serial_output_bytes)
+#    chain.get_module_data(0)
+#
+#  It only covers the UART receive interrupt, not the random colours the
+#  modules cycle through when they haven't heard anything for a while
+
+# The sync byte that ends each frame (CMD_NEW_DATA)
+CMD_NEW_DATA = 0x01
+# Sent in place of a module's data when the module hasn't changed (CMD_REPEAT)
+CMD_REPEAT = 0xFF
+# The bytes each module keeps (BUFFER_SIZE), 6x8 cells of red, green and blue
+MODULE_BUFFER_SIZE = 6 * 8 * 3
+
+
+class ModuleEmulator(object):
+    """
+    A single module, following ISR(USART_RX_vect): after a sync byte the
+    module keeps the next BUFFER_SIZE bytes as what it shows, and relays
+    everything else, including the sync byte, to the next module. A
+    CMD_REPEAT in place of the first of its bytes leaves what it shows as it
+    is, unless it is emulating firmware from before CMD_REPEAT was added
+    """
+
+    def __init__(self, buffer_size=MODULE_BUFFER_SIZE, repeat=True):
+        self.buffer_size = buffer_size
+        self.repeat = repeat
+        self.display_buffer = bytearray(buffer_size)
+        # Like the firmware, everything is relayed until the first sync byte
+        self.pos = 0
+        self.ptr = 0
+        self.frames = 0
+        self.repeats = 0
+
+    def receive_byte(self, b):
+        """
+        Handle one byte, and return the byte relayed to the next module, or
+        None if the module kept it
+        """
+        if b == CMD_NEW_DATA:
+            self.pos = self.buffer_size
+            self.ptr = 0
+            self.frames += 1
+            return b
+        if self.pos == 0:
+            return b
+        if self.repeat and self.pos == self.buffer_size and b == CMD_REPEAT:
+            self.pos = 0
+            self.repeats += 1
+            return None
+        self.display_buffer[self.ptr] = b
+        self.ptr += 1
+        self.pos -= 1
+        return None
+
+    def receive(self, data):
+        """
+        Handle a string of bytes, and return the bytes relayed to the next
+        module
+        """
+        relayed = bytearray()
+        for b in bytearray(data):
+            b = self.receive_byte(b)
+            if b is not None:
+                relayed.append(b)
+        return relayed
+
+
+class ModuleChain(object):
+    """
+    A chain of modules on one serial port, each relaying to the next
+    """
+
+    def __init__(self, modules, buffer_size=MODULE_BUFFER_SIZE, repeat=True):
+        self.modules = [ModuleEmulator(buffer_size, repeat) for module in range(modules)]
+
+    def __len__(self):
+        return len(self.modules)
+
+    def receive(self, data):
+        """
+        Send the bytes down the chain, and return what comes out of the end
+        of it
+        """
+        for module in self.modules:
+            data = module.receive(data)
+        return data
+
+    def get_module_data(self, module):
+        """
+        The bytes module (counting from 0, nearest the controller) is showing
+        """
+        return bytes(self.modules[module].display_buffer)
+
+    def get_data(self):
+        """
+        The bytes every module on the chain is showing, one after another,
+        which is what was sent in the last full frame, without the sync byte
+        """
+        return b"".join([self.get_module_data(module) for module in range(len(self.modules))])
@@ -8,6 +8,16 @@ import pygame
 from itertools import count
 import os
 import logging
+import threading
+import time
+
+from lib.filters import FilterChain
+from lib.wiretime import PortModel, WriteTimer
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 class Output(object):
@@ -49,6 +59,11 @@ class GuiOutput(Output):
 
         self.pressed_buttons = dict()
 
+        # The floor cells are painted onto this surface, which is kept between
+        #  frames so that only the cells that have changed need repainting
+        self.floor_surface = None
+        self.floor_surface_size = None
+
     def handle_event(self, event):
         if event.type in [pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP]:
             joypad = event.joy
@@ -379,16 +394,28 @@ class GuiOutput(Output):
         #pygame.draw.line(drawable, (0xFF, 0xFF, 0xFF), (0, 0), (width, height), 1)
         #pygame.draw.line(drawable, (0xFF, 0xFF, 0xFF), (0, height), (width, 0), 1)
 
-        # Draw the pixels of the floor canvas onto the drawable object
+        # Only the cells that changed in the last frame need repainting, unless
+        #  the window or floor have changed size, or we don't know what changed
+        damage = canvas.get_damage_mask()
+        if self.floor_surface_size != (width, height, canvas_width, canvas_height):
+            self.floor_surface = pygame.Surface((width, height)).convert()
+            self.floor_surface_size = (width, height, canvas_width, canvas_height)
+            damage = None
+        if damage is None:
+            cells = [(x, y) for x in range(canvas_width) for y in range(canvas_height)]
+        else:
+            cells = zip(*damage.nonzero())
+
+        # Draw the pixels of the floor canvas onto the floor surface
         # The position is determined based on the size of each cell and the padding
         #  amounts calculated previously
-        for canvas_x in range(canvas_width):
-            for canvas_y in range(canvas_height):
-                rect_pos = (canvas_x * pixels_per_cell + x_padding, canvas_y * pixels_per_cell + y_padding)
-                pygame.draw.rect(drawable, canvas.get_pixel_tuple(canvas_x, canvas_y),
-                                 pygame.Rect(canvas_x * pixels_per_cell + x_padding // 2,
-                                             canvas_y * pixels_per_cell + y_padding // 2, pixels_per_cell,
-                                             pixels_per_cell), 0)
+        for (canvas_x, canvas_y) in cells:
+            pygame.draw.rect(self.floor_surface, canvas.get_pixel_tuple(canvas_x, canvas_y),
+                             pygame.Rect(canvas_x * pixels_per_cell + x_padding // 2,
+                                         canvas_y * pixels_per_cell + y_padding // 2, pixels_per_cell,
+                                         pixels_per_cell), 0)
+
+        drawable.blit(self.floor_surface, (0, 0))
 
         return None
 
@@ -396,13 +423,198 @@ class GuiOutput(Output):
         pass
 
 
+# The byte sent after every frame, which the modules sync on
+SYNC_BYTE = 0x01
+# Sent in place of a module's data when it hasn't changed since the last
+#  frame, which the translate table makes sure is never sent as data
+REPEAT_BYTE = 0xFF
+
+
+def build_translate_table():
+    # What to send for each colour value. Make sure we don't send a 0x01,
+    #  which is the sync signal we only send at the end.
+    # Also, send 254 instead of 255 to make sure that we don't get
+    #  interference that we've seen from really long sequences of 1 bits.
+    table = bytearray(range(256))
+    table[SYNC_BYTE] = SYNC_BYTE + 1
+    table[255] = 254
+    return table
+
+
+class FrameEncoder(object):
+    """
+    Turns a canvas into the bytes to send to the floor, for one layout.
+
+    Everything that depends on the layout is worked out once, when the
+    encoder is made: the index in the flattened canvas of each cell, in the
+    order the modules want them, and the buffer the frame is written into,
+    which already has the sync byte on the end. With numpy, encoding a
+    frame is then a gather of the cells and a lookup of every byte in the
+    translate table, straight into that buffer.
+
+    The encoder's own buffer is reused for every frame, so what encode()
+    returns is only good until it is next called, unless it is given a
+    buffer (from new_buffer()) of its own to encode into.
+    """
+
+    translate_table = build_translate_table()
+
+    def __init__(self, width, height, converter=None):
+        self.width = width
+        self.height = height
+        if converter is None:
+            # Assume that pixels need to be sent in the order they are,
+            #  (0,0), (0,1), (0,2) etc... It is highly likely this is not
+            #  what you want, unless your output is only a single module
+            converter = [(x, y) for x in range(0, width) for y in range(0, height)]
+        self.converter = list(converter)
+        # The canvas is stored in columns, so (x, y) is x * height + y along
+        self.indexes = [x * height + y for (x, y) in self.converter]
+        self.frame_length = 3 * len(self.indexes)
+        self.buffer = self.new_buffer()
+        if numpy is not None:
+            self.index_array = numpy.array(self.indexes, dtype=numpy.intp)
+            self.table_array = numpy.frombuffer(bytes(self.translate_table), dtype=numpy.uint8)
+            self.cells = numpy.empty((len(self.indexes), 3), dtype=numpy.uint8)
+
+    def get_size(self):
+        return (self.width, self.height)
+
+    # A buffer the right size for a frame, with the sync byte on the end
+    def new_buffer(self):
+        buffer = bytearray(self.frame_length + 1)
+        buffer[self.frame_length] = SYNC_BYTE
+        return buffer
+
+    def encode(self, pixels, buffer=None):
+        """
+        Encode a (width, height, 3) uint8 numpy array of the canvas, and
+        return the buffer with the frame and the sync byte in it
+        """
+        if buffer is None:
+            buffer = self.buffer
+        frame_array = numpy.frombuffer(buffer, dtype=numpy.uint8)[:self.frame_length].reshape(-1, 3)
+        numpy.take(pixels.reshape(-1, 3), self.index_array, axis=0, out=self.cells, mode='clip')
+        numpy.take(self.table_array, self.cells, out=frame_array, mode='clip')
+        return buffer
+
+    def encode_packed(self, canvas_array, buffer=None):
+        """
+        Encode an [x][y] array of packed RGB values, a pixel at a time, for
+        when there is no numpy
+        """
+        table = self.translate_table
+        if buffer is None:
+            buffer = self.buffer
+        i = 0
+        for (x, y) in self.converter:
+            rgb = canvas_array[x][y]
+            buffer[i] = table[(rgb >> 16) & 0xFF]
+            buffer[i + 1] = table[(rgb >> 8) & 0xFF]
+            buffer[i + 2] = table[rgb & 0xFF]
+            i += 3
+        return buffer
+
+
+class RepeatEncoder(object):
+    """
+    Shortens the frames sent to a chain of modules by sending a single
+    REPEAT_BYTE, in place of the data, for each module that hasn't changed
+    since the last frame sent to it. The modules that understand it keep
+    what they are showing and relay the rest of the frame on, so a frame
+    where only one module has changed is not much longer than that module's
+    data.
+
+    It has to be used where the frames are written, as it works from the
+    last frame that actually went out, rather than any frames that were
+    dropped before getting there. The whole frame is sent anyway when
+    keyframe_period seconds have passed since the last time, in case a
+    module missed something, or has been showing random colours since it
+    last heard from the controller. This goes by the time rather than
+    counting frames, as frames that haven't changed aren't always sent.
+    """
+
+    def __init__(self, module_lengths, keyframe_period=1.0):
+        # module_lengths is the number of bytes of each module on the chain,
+        #  in the order they are sent
+        self.slots = []
+        start = 0
+        for length in module_lengths:
+            self.slots.append((start, start + length))
+            start += length
+        self.frame_length = start
+        self.keyframe_period = keyframe_period
+        self.previous = None
+        self.last_keyframe = None
+        self.modules_sent = 0
+        self.modules_repeated = 0
+
+    def encode(self, buffer):
+        """
+        Return the bytes to send for a whole frame (ending in the sync byte),
+        and remember it for the next one
+        """
+        now = time.time()
+        if self.previous is None or now - self.last_keyframe >= self.keyframe_period:
+            self.last_keyframe = now
+            self.modules_sent += len(self.slots)
+            self.previous = bytearray(buffer)
+            return buffer
+
+        data = bytearray()
+        for (start, end) in self.slots:
+            if buffer[start:end] == self.previous[start:end]:
+                data.append(REPEAT_BYTE)
+                self.modules_repeated += 1
+            else:
+                data += buffer[start:end]
+                self.modules_sent += 1
+        data += buffer[self.frame_length:]
+        self.previous[:] = buffer
+        return data
+
+    # Forget the last frame, so the next one is sent in full, e.g. after
+    #  a write went wrong
+    def reset(self):
+        self.previous = None
+
+
 class FormattedByteOutput(Output):
     logger = logging.getLogger(__name__)
 
     def __init__(self):
+        super(FormattedByteOutput, self).__init__()
         self.logger.info("__init__ for FormattedByteOutput")
         self.converter = None
+        self.encoder = None
         self.filters = []
+        # The filters, put together to be applied in as few passes as possible
+        self.filter_chain = FilterChain(self.filters)
+        self.calibration = None
+        self.power_limiter = None
+        # Frames that haven't changed aren't sent again, but the modules go
+        #  back to cycling random colours if they don't hear anything for a
+        #  couple of seconds, so resend at least every refresh_interval frames
+        self.refresh_interval = 25
+        self.frames_since_sent = None
+
+    def set_refresh_interval(self, config):
+        if "refresh_interval" in config:
+            self.refresh_interval = int(config["refresh_interval"])
+
+    """
+    Return True if this canvas needs sending, i.e. it has changed since the
+     last frame, the power limiter is still bringing the brightness back up,
+     or it's been a while since anything was sent
+    """
+    def needs_sending(self, canvas):
+        if self.frames_since_sent is not None:
+            self.frames_since_sent += 1
+            ramping = self.power_limiter is not None and self.power_limiter.is_ramping()
+            if not canvas.is_damaged() and not ramping and self.frames_since_sent < self.refresh_interval:
+                return False
+        self.frames_since_sent = 0
+        return True
 
     def set_output_converter(self, converter):
         # The converter will be used to pick the
@@ -414,51 +626,101 @@ class FormattedByteOutput(Output):
         #  which, when iterated through, puts all the
         #  appropriate cells in the correct order
         self.converter = converter
-        pass
+        self.encoder = None
+
+    # The encoder for the current layout and canvas size, made the first time
+    #  it is needed, and again if either changes
+    def get_encoder(self, canvas):
+        if self.encoder is None or self.encoder.get_size() != canvas.get_size():
+            self.encoder = FrameEncoder(canvas.get_width(), canvas.get_height(), self.converter)
+        return self.encoder
 
-    def format_data(self, canvas):
-        # First we need to convert the canvas into a buffer
-        # containing the bytes in the right order
+    """
+    Return the bytes to send for this canvas, ending in the sync byte. Unless
+     a buffer to encode into is given, this is the encoder's buffer, which is
+     reused for the next frame
+    """
+    def encode_frame(self, canvas, buffer=None):
+        encoder = self.get_encoder(canvas)
+        if numpy is not None:
+            return encoder.encode(self.filter_pixels(canvas), buffer)
+        return encoder.encode_packed(self.filter_canvas(canvas), buffer)
+
+    # The encoders to send each frame with, one for each part of the floor
+    #  that is sent separately. By default the whole floor goes together
+    def get_encoders(self, canvas):
+        return [self.get_encoder(canvas)]
 
-        # Create one long string of all the bytes to send
-        output_string = ""
+    """
+    Return a list of the bytes to send for this canvas, one for each of the
+     encoders, with the canvas filtered just once for all of them
+    """
+    def encode_frames(self, canvas, buffers=None):
+        encoders = self.get_encoders(canvas)
+        if buffers is None:
+            buffers = [None] * len(encoders)
+        if numpy is not None:
+            pixels = self.filter_pixels(canvas)
+            return [encoder.encode(pixels, buffer) for (encoder, buffer) in zip(encoders, buffers)]
+        canvas_array = self.filter_canvas(canvas)
+        return [encoder.encode_packed(canvas_array, buffer) for (encoder, buffer) in zip(encoders, buffers)]
+
+    """
+    The canvas as a (width, height, 3) uint8 numpy array, with the filters,
+     the calibration and then the power limit applied to the whole of it
+    """
+    def filter_pixels(self, canvas):
+        pixels = canvas.get_pixel_array()
+        if len(self.filter_chain) > 0:
+            pixels = self.filter_chain.modify_array(pixels)
+        if self.calibration is not None:
+            pixels = self.calibration.modify_array(pixels)
+        if self.power_limiter is not None:
+            pixels = self.power_limiter.modify_array(pixels)
+        return pixels
+
+    """
+    The [x][y] array of packed RGB values with the filters and calibration
+     applied, a pixel at a time, for when there is no numpy
+    """
+    def filter_canvas(self, canvas):
         canvas_array = canvas.get_canvas_array()
-        if self.converter == None:
-            # Assume that pixels need to be sent in
-            #  the order they are, (0,0), (1,0), (2,0)
-            #  etc...
-            # It is highly likely this is not what you
-            #  want, unless your output is only a single
-            #  module
-            for x in range(0, canvas.width):
-                for y in range(0, canvas.height):
-                    rgb = canvas_array[x][y]
-                    output_string += self.form_pixel_data(rgb)
-            pass
-        else:
-            # Iterate over the converter, picking up the right
-            #  pixels in the right order
-            for x_y in self.converter:
-                (x, y) = x_y
-                rgb = canvas_array[x][y]
-                for filter in self.filters:
-                    rgb = filter.modify(rgb)
-                output_string += self.form_pixel_data(rgb)
+        if len(self.filter_chain) > 0:
+            canvas_array = [[self.filter_chain.modify(rgb) for rgb in column] for column in canvas_array]
+        if self.calibration is not None:
+            canvas_array = [[self.calibration.modify(x, y, rgb) for (y, rgb) in enumerate(column)]
+                            for (x, column) in enumerate(canvas_array)]
+        return canvas_array
 
-        return output_string
+    """
+    Set the colour calibration of the modules (a FloorCalibration), which is
+     applied after the filters, or None for none
+    """
+    def set_calibration(self, calibration):
+        self.calibration = calibration
+
+    """
+    Set the PowerLimiter that keeps what is sent under the current limits,
+     which is applied last, or None for no limit (it needs numpy)
+    """
+    def set_power_limiter(self, power_limiter):
+        self.power_limiter = power_limiter
 
     """
     Append filter and return self so that you can chain additions
     """
     def append_filter(self, filter):
         self.filters.append(filter)
+        self.filter_chain = FilterChain(self.filters)
         return self
 
     """
     Pop filter from the list and return it
     """
     def pop_filter(self):
-        return self.filters.pop()
+        filter = self.filters.pop()
+        self.filter_chain = FilterChain(self.filters)
+        return filter
 
     """
     Clear all filters and return the list of previously set filters
@@ -466,76 +728,393 @@ class FormattedByteOutput(Output):
     def clear_filters(self):
         filters = self.filters
         self.filters = []
+        self.filter_chain = FilterChain(self.filters)
         return filters
 
-    def form_pixel_data(self, rgb):
-
-        output_string = ""
-
-        # extract the components
-        red = (rgb >> 16) & 0xFF
-        green = (rgb >> 8) & 0xFF
-        blue = rgb & 0xFF
-        # Make sure we don't send a 0x01, which is the
-        # sync signal we only send at the end
-        # Also, send 254 instead of 255 to make sure that
-        #  we don't get interference that we've seen from
-        #  really long sequences of 1 bits.
-        if red == 1:
-            red = 2
-        elif red > 254:
-            red = 254
 
-        if green == 1:
-            green = 2
-        elif green > 254:
-            green = 254
-
-        if blue == 1:
-            blue = 2
-        elif blue > 254:
-            blue = 254
+class FrameBarrier(object):
+    """
+    Holds each of a number of threads back until all of them have got to
+    it, and then lets them all go together (threading.Barrier isn't in
+    python 2). wait() returns True in the last thread to get there, so that
+    one of them can do something on behalf of the rest
+    """
 
-        output_string += chr(red)
-        output_string += chr(green)
-        output_string += chr(blue)
+    def __init__(self, parties):
+        self.parties = parties
+        self.condition = threading.Condition()
+        self.waiting = 0
+        self.generation = 0
+
+    def wait(self):
+        with self.condition:
+            generation = self.generation
+            self.waiting += 1
+            if self.waiting == self.parties:
+                self.waiting = 0
+                self.generation += 1
+                self.condition.notify_all()
+                return True
+            while generation == self.generation:
+                self.condition.wait()
+            return False
+
+
+class FrameWriter(object):
+    """
+    Writes frames to one or more ports, each from a thread of its own, so
+    that the render loop can get on with the next frame while the last one
+    is on the wire, and so that a floor split over several ports has all of
+    them being written at once.
+
+    A frame is a list of bytearrays, one for each port. There is a single
+    slot for the next frame to write. The render loop posts each frame into
+    it, and the writers always take whatever is in the slot when they are
+    ready for another, so if frames are coming faster than they can be sent,
+    the ones that are overtaken by a newer frame are dropped (and counted)
+    rather than queueing up and falling behind.
+
+    The writers share a barrier, so they all start on a frame together, and
+    none of them starts on the next one until they have all finished, which
+    keeps every part of the floor showing the same frame.
+
+    The buffers go round between the render loop, the slot and the writers,
+    so at most three frames are ever in use. get_buffers() hands out one
+    that isn't in the slot or being written.
+
+    How long each write takes is recorded in the port's WriteTimer, if it
+    is given a list of them, and if it is given a list of RepeatEncoders
+    (or None for the ports that send whole frames), the unchanged modules
+    are left out of what is written.
+    """
+    logger = logging.getLogger(__name__)
 
-        return output_string
+    def __init__(self, ports, name="FrameWriter", timers=None, repeat_encoders=None):
+        if type(ports) not in (list, tuple):
+            ports = [ports]
+        self.ports = list(ports)
+        self.timers = timers
+        self.repeat_encoders = repeat_encoders
+        self.condition = threading.Condition()
+        self.barrier = FrameBarrier(len(self.ports))
+        self.pending = None
+        self.current = None
+        self.free_buffers = []
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.running = True
+        self.threads = []
+        for (index, port) in enumerate(self.ports):
+            thread = threading.Thread(target=self.run, args=(index,), name="%s-%d" % (name, index))
+            thread.daemon = True
+            self.threads.append(thread)
+        for thread in self.threads:
+            thread.start()
+
+    # Buffers to encode the next frame into, one for each of the encoders,
+    #  reusing a frame that has finished being written if possible
+    def get_buffers(self, encoders):
+        lengths = [len(encoder.buffer) for encoder in encoders]
+        with self.condition:
+            while len(self.free_buffers) > 0:
+                buffers = self.free_buffers.pop()
+                if [len(buffer) for buffer in buffers] == lengths:
+                    return buffers
+        return [encoder.new_buffer() for encoder in encoders]
+
+    # Put a frame in the slot to be written next, replacing any frame that
+    #  was still waiting there
+    def post(self, buffers):
+        with self.condition:
+            if self.pending is not None:
+                self.free_buffers.append(self.pending)
+                self.frames_dropped += 1
+            self.pending = buffers
+            self.condition.notify()
+
+    def run(self, index):
+        while True:
+            # Once every port has finished the last frame, the last of them
+            #  to do so takes the next frame from the slot for all of them
+            if self.barrier.wait():
+                with self.condition:
+                    if self.current is not None:
+                        self.free_buffers.append(self.current)
+                        self.frames_written += 1
+                    while self.pending is None and self.running:
+                        self.condition.wait()
+                    # Once stopped, a frame still in the slot is written
+                    #  before the threads finish
+                    self.current = self.pending
+                    self.pending = None
+            self.barrier.wait()
+
+            buffers = self.current
+            if buffers is None:
+                return
+            repeat_encoder = None
+            if self.repeat_encoders is not None:
+                repeat_encoder = self.repeat_encoders[index]
+            try:
+                buffer = buffers[index]
+                if repeat_encoder is not None:
+                    buffer = repeat_encoder.encode(buffer)
+                start = time.time()
+                self.ports[index].write(buffer)
+                if self.timers is not None:
+                    self.timers[index].record(time.time() - start)
+            except Exception as e:
+                self.logger.error("Unable to write frame: %s" % e)
+                if repeat_encoder is not None:
+                    repeat_encoder.reset()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+
+    def get_metrics(self):
+        with self.condition:
+            return {"frames_written": self.frames_written, "frames_dropped": self.frames_dropped}
 
 
 class SerialOutput(FormattedByteOutput):
+    # The floor can be split over several serial ports, each driving its own
+    #  chain of modules, with a "ports" section in place of the tty, e.g.
+    #
+    #    ports:
+    #      1:
+    #        tty: /dev/ttyUSB0
+    #        modules: [1, 2, 3, 4]
+    #      2:
+    #        tty: /dev/ttyUSB1
+    #        modules: [5, 6, 7, 8, 9]
+    #
+    #  Each port is sent just the cells of its own modules, in the order they
+    #  are numbered, and they are all written at once
+    #
+    #  How long the writes take is checked every check_interval frames against
+    #  how long the frames should take on the wire, see lib/wiretime.py, and
+    #  the estimated current is logged then too if there is a power limit
+    #
+    #  With "repeat: True", modules that haven't changed are sent a single
+    #  repeat byte instead of their data, with the whole frame sent every
+    #  keyframe_period seconds. The module firmware has to understand the
+    #  repeat byte, see CMD_REPEAT in DanceFloor.ino and lib/moduleemulator.py
+
+    # How much longer than the model the writes can take before it's worth
+    #  a warning, as there's some overhead in getting them out over USB
+    write_time_margin = 1.5
+
     def __init__(self, config):
         logger = logging.getLogger(__name__)
         super(SerialOutput, self).__init__()
         # Open specified serial port with the correct
         # parameters
-        self.open_serial_port(config)
-
-    def open_serial_port(self, config):
-        self.tty = None
+        self.open_serial_ports(config)
+        self.set_refresh_interval(config)
+        # Which cells go to each port, set by set_layout() when the floor
+        #  is split over more than one, and the encoders for them
+        self.port_converters = None
+        self.port_encoders = None
+        # How long each port's frames should take, and have been taking
+        self.port_models = None
+        self.write_timers = [WriteTimer() for serial_port in self.serial_ports]
+        self.check_interval = int(config.get("check_interval", 250))
+        self.frames_until_check = self.check_interval
+        self.slow_ports = set()
+        # The RepeatEncoder of each port, if unchanged modules are left out,
+        #  which are set up with the layout (and filled into this list, as
+        #  the writer has it too)
+        self.repeat = bool(config.get("repeat", False))
+        self.keyframe_period = float(config.get("keyframe_period", 1.0))
+        self.repeat_encoders = [None for serial_port in self.serial_ports]
+        # Frames are written from a thread for each port, unless the config
+        #  says otherwise, in which case send_data() waits for each write
+        self.writer = None
+        if config.get("threaded", True):
+            self.writer = FrameWriter(self.serial_ports, "%s-writer" % self.name, self.write_timers,
+                                      self.repeat_encoders)
+
+    def open_serial_ports(self, config):
         self.baud = None
         self.timeout = 1
-        if ("tty" in config):
-            self.tty = config["tty"]
         if ("baud" in config):
             self.baud = config["baud"]
         if ("timeout" in config):
             self.timeout = config["timeout"]
-        self.logger.info("Creating serial port with tty=%s, baud=%s, timeout=%s" % (self.tty, self.baud, self.timeout))
-        self.serial_port = serial.Serial(self.tty, self.baud, timeout=self.timeout)
+
+        ports = config.get("ports")
+        if ports is None:
+            # A single port, for all of the modules
+            ports = {1: {"tty": config.get("tty")}}
+
+        self.serial_ports = []
+        self.port_ttys = []
+        self.port_modules = []
+        for (port_number, port_config) in sorted(ports.items()):
+            tty = port_config.get("tty")
+            self.port_ttys.append(tty)
+            modules = port_config.get("modules")
+            self.logger.info("Creating serial port with tty=%s, baud=%s, timeout=%s, modules=%s" %
+                             (tty, self.baud, self.timeout, modules if modules is not None else "all"))
+            self.serial_ports.append(serial.Serial(tty, self.baud, timeout=self.timeout))
+            self.port_modules.append(modules)
+        self.serial_port = self.serial_ports[0]
+
+    """
+    Set up which cells are sent to each port, and in what order, from the
+     layout of the floor
+    """
+    def set_layout(self, layout):
+        self.set_output_converter(layout.get_converter())
+        self.port_encoders = None
+        modules = [module for (module, first, last) in layout.module_positions]
+        if len(self.serial_ports) == 1 and self.port_modules[0] is None:
+            self.port_converters = None
+            self.set_port_models([modules], [self.converter])
+            self.set_repeat_encoders(layout, [modules])
+            return
+
+        port_modules = [port_modules if port_modules is not None else modules
+                        for port_modules in self.port_modules]
+        for (port_number, port_modules_list) in enumerate(port_modules):
+            for module in port_modules_list:
+                if module not in modules:
+                    self.logger.warn("Module %s on port %d isn't in the layout" % (module, port_number + 1))
+        for module in modules:
+            ports = [port_number for (port_number, port_modules_list) in enumerate(port_modules)
+                     if module in port_modules_list]
+            if len(ports) == 0:
+                self.logger.warn("Module %s isn't on any of the serial ports, it won't be sent anything" % module)
+            elif len(ports) > 1:
+                self.logger.warn("Module %s is on more than one serial port" % module)
+        self.port_converters = [layout.get_converter(port_modules_list) for port_modules_list in port_modules]
+        self.set_port_models(port_modules, self.port_converters)
+        self.set_repeat_encoders(layout, port_modules)
+
+    def set_repeat_encoders(self, layout, port_modules):
+        if not self.repeat:
+            return
+        for (index, port_modules_list) in enumerate(port_modules):
+            module_lengths = [3 * (last - first) for (module, first, last) in layout.module_positions
+                              if module in port_modules_list]
+            self.repeat_encoders[index] = RepeatEncoder(module_lengths, self.keyframe_period)
+
+    def set_port_models(self, port_modules, port_converters):
+        if self.baud is None:
+            self.port_models = None
+            return
+        self.port_models = [PortModel(tty, modules, len(converter), int(self.baud))
+                            for (tty, modules, converter) in zip(self.port_ttys, port_modules, port_converters)]
+        for port_model in self.port_models:
+            self.logger.info("%s" % port_model)
+
+    """
+    Compare how long the writes to each port have been taking with how long
+     the frames should take on the wire, and warn about any that are slower
+    """
+    def check_write_times(self):
+        if self.port_models is None:
+            return
+        for (port_model, timer) in zip(self.port_models, self.write_timers):
+            mean = timer.get_mean()
+            if mean is None or port_model.tty in self.slow_ports:
+                continue
+            if mean > port_model.wire_time * self.write_time_margin:
+                self.slow_ports.add(port_model.tty)
+                self.logger.warn("Writes to %s are taking %.2fms, the link should send a frame in %.2fms" %
+                                 (port_model.tty, mean * 1000.0, port_model.wire_time * 1000.0))
+
+    """
+    Log the estimated current of the last frame sent, and the headroom it
+     leaves under the power limits
+    """
+    def log_power(self):
+        if self.power_limiter is None:
+            return
+        metrics = self.power_limiter.get_metrics()
+        headroom = ["%s %.0fmA" % (limit, metrics[limit + "_headroom"]) for limit in ["total", "module"]
+                    if limit + "_headroom" in metrics]
+        self.logger.info("Estimated current %.0fmA, headroom %s%s" %
+                         (metrics["total_current"], ", ".join(headroom),
+                          ", limiting brightness" if metrics["limiting"] else ""))
+
+    """
+    The modelled and measured timings of each port, how many frames have
+     been written and dropped, and the estimated current if there is a power
+     limit
+    """
+    def get_metrics(self):
+        ports = []
+        for (index, timer) in enumerate(self.write_timers):
+            port = {"tty": self.port_ttys[index], "writes": timer.count, "write_time": timer.get_mean(),
+                    "longest_write_time": timer.longest}
+            if self.port_models is not None:
+                port_model = self.port_models[index]
+                port.update({"frame_bytes": port_model.frame_bytes, "wire_time": port_model.wire_time,
+                             "max_fps": port_model.max_fps})
+            repeat_encoder = self.repeat_encoders[index]
+            if repeat_encoder is not None:
+                port.update({"modules_sent": repeat_encoder.modules_sent,
+                             "modules_repeated": repeat_encoder.modules_repeated})
+            ports.append(port)
+        metrics = {"ports": ports}
+        if self.writer is not None:
+            metrics.update(self.writer.get_metrics())
+        if self.power_limiter is not None:
+            metrics["power"] = self.power_limiter.get_metrics()
+        return metrics
+
+    # An encoder for each port, made the first time they are needed, and
+    #  again if the layout or canvas size changes
+    def get_encoders(self, canvas):
+        if self.port_converters is None:
+            return [self.get_encoder(canvas)]
+        if self.port_encoders is None or self.port_encoders[0].get_size() != canvas.get_size():
+            self.port_encoders = [FrameEncoder(canvas.get_width(), canvas.get_height(), converter)
+                                  for converter in self.port_converters]
+        return self.port_encoders
 
     def send_data(self, canvas):
 
-        formatted_data = self.format_data(canvas)
+        # Don't bother sending the same frame again
+        if not self.needs_sending(canvas):
+            return
 
-        # Add the sync pulse
-        formatted_data += chr(1)
-        # Send all the data
-        self.serial_port.write(formatted_data)
+        if self.writer is None:
+            # Each port's frame, with the sync pulse already on the end, is
+            #  written straight from its encoder's buffer
+            for (serial_port, timer, repeat_encoder, buffer) in zip(self.serial_ports, self.write_timers,
+                                                                    self.repeat_encoders,
+                                                                    self.encode_frames(canvas)):
+                if repeat_encoder is not None:
+                    buffer = repeat_encoder.encode(buffer)
+                start = time.time()
+                serial_port.write(buffer)
+                timer.record(time.time() - start)
+        else:
+            buffers = self.writer.get_buffers(self.get_encoders(canvas))
+            self.writer.post(self.encode_frames(canvas, buffers))
+
+        self.frames_until_check -= 1
+        if self.frames_until_check <= 0:
+            self.frames_until_check = self.check_interval
+            self.check_write_times()
+            self.log_power()
 
     def clear(self):
         pass
 
+    def close(self):
+        if self.writer is not None:
+            self.writer.stop()
+            self.writer = None
+        for serial_port in self.serial_ports:
+            serial_port.close()
+
 
 class PipeOutput(FormattedByteOutput):
     # This is similar, if not identical to the SerialOutput
@@ -553,18 +1132,18 @@ class PipeOutput(FormattedByteOutput):
                 self.pipe = open(pipe_name, 'w')
             else:
                 self.logger.error("Output pipe not available - %s" % pipe_name)
+        self.set_refresh_interval(config)
 
     def send_data(self, canvas):
-        formatted_data = self.format_data(canvas)
+        # Don't bother sending the same frame again
+        if not self.needs_sending(canvas):
+            return
+
         if self.pipe is not None:
-            s = ""
-            # Take every character in the string and convert it to a hex value
-            for i in formatted_data:
-                v = hex(ord(i))[2:]
-                if len(v) < 2:
-                    s += "'\\x0%s'" % v
-                else:
-                    s += "'\\x%s'" % v
+            # The frame without the sync byte, with every byte written out as
+            #  its hex value
+            formatted_data = self.encode_frame(canvas)[:-1]
+            s = "".join(["'\\x%02x'" % v for v in formatted_data])
             self.pipe.write("%s\n" % s)
         else:
             self.logger.warn("Pipe not available, unable to send data")
@@ -0,0 +1,169 @@
+__authors__ = ['Andrew Taylor']
+
+import logging
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def firmware_duty_table():
+    """
+    The fraction of the time an LED is on for each value sent, following the
+    exponential brightness curve in the module firmware (exp_table_red and
+    friends), which goes from 15/4095 at 1 up to 4095/4095 at 255. This is
+    within a few percent of the firmware's table, which is close enough to
+    estimate the current from
+    """
+    rate = math.log(4095.0 / 15.0) / 254.0
+    return [0.0] + [15.0 * math.exp(rate * (value - 1)) / 4095.0 for value in range(1, 256)]
+
+
+class PowerLimiter(object):
+    """
+    Keeps the estimated current drawn by the floor under the limits of the
+    power supply, per module and in total, by dimming frames that would draw
+    too much.
+
+    The current of every cell is worked out from what is being sent (the
+    firmware drives red, green and blue one at a time, so each is on for a
+    third of the time at most), and summed per module in one pass. If a
+    module, or the whole floor, is over its limit then its cells are dimmed
+    just enough to bring it back under. The idle current each module draws
+    whatever it shows can't be dimmed, so it comes off the limits and only
+    the LEDs are scaled to fit in what is left. Dimming happens straight away, but
+    the brightness comes back up gradually, release of the way each frame,
+    so the floor doesn't flicker as frames go over and under the limit.
+
+    The estimates of the last frame are kept for reporting, see get_metrics()
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, module_map, total_limit=None, module_limit=None, channel_current=20.0,
+                 idle_current=0.0, release=0.05):
+        # module_map is an [x][y] array of which module each cell is on (or
+        #  None), the limits and currents are in mA
+        self.total_limit = total_limit
+        self.module_limit = module_limit
+        self.idle_current = idle_current
+        self.release = release
+
+        self.modules = sorted(set(module for column in module_map for module in column if module is not None))
+        index_of_module = dict((module, index + 1) for (index, module) in enumerate(self.modules))
+        # Index 0 is for cells that aren't on a module, which don't draw anything
+        self.module_indexes = numpy.array([[index_of_module.get(module, 0) for module in column]
+                                           for column in module_map], dtype=numpy.intp)
+
+        if type(channel_current) not in (list, tuple):
+            channel_current = [channel_current] * 3
+        duty = numpy.array(firmware_duty_table())
+        self.duty_table = duty
+        # The current drawn by each value sent on each channel of one cell
+        self.current_table = numpy.array([duty * (float(current) / 3.0) for current in channel_current])
+        self.channels = numpy.arange(3)
+
+        self.scales = numpy.ones(len(self.modules) + 1)
+        self.targets = numpy.ones(len(self.modules) + 1)
+        self.module_currents = numpy.zeros(len(self.modules))
+        self.total_current = 0.0
+        self.limiting = False
+
+    def _estimate(self, pixels):
+        # The current of the LEDs on each module, from a single weighted
+        #  count of the cells by module, without the idle current
+        cell_currents = self.current_table[self.channels, pixels].sum(axis=-1)
+        return numpy.bincount(self.module_indexes.ravel(), weights=cell_currents.ravel(),
+                              minlength=len(self.modules) + 1)[1:]
+
+    def modify_array(self, pixels):
+        """
+        Dim a whole (width, height, 3) uint8 array of the floor, as it is
+        about to be sent, if it would draw too much current
+        """
+        led_currents = self._estimate(pixels)
+        total_idle_current = self.idle_current * len(self.modules)
+
+        # How much the LEDs of each module need to be dimmed by to stay under
+        #  the limits, once the idle current has been taken off them
+        targets = numpy.ones(len(self.modules) + 1)
+        if self.module_limit is not None:
+            available = max(self.module_limit - self.idle_current, 0.0)
+            targets[1:] = numpy.minimum(1.0, available / numpy.maximum(led_currents, 1e-9))
+        total_current = led_currents.sum() + total_idle_current
+        if self.total_limit is not None and total_current > self.total_limit:
+            available = max(self.total_limit - total_idle_current, 0.0)
+            targets[1:] = numpy.minimum(targets[1:], available / max(led_currents.sum(), 1e-9))
+
+        # Dim straight away, brighten up again slowly
+        self.scales = numpy.minimum(targets, self.scales + self.release)
+        self.targets = targets
+
+        limiting = bool((self.scales[1:] < 1.0).any())
+        if limiting != self.limiting:
+            self.limiting = limiting
+            if limiting:
+                self.logger.info("Limiting brightness, estimated current %.0fmA" % total_current)
+            else:
+                self.logger.info("No longer limiting brightness")
+
+        if limiting:
+            # Find the brightest value that draws no more than the scaled
+            #  current, so the dimmed frame is never over the limit
+            scales = self.scales[self.module_indexes][..., numpy.newaxis]
+            target_duty = self.duty_table[pixels] * scales
+            pixels = (numpy.searchsorted(self.duty_table, target_duty, side='right') - 1).astype(numpy.uint8)
+            led_currents = self._estimate(pixels)
+
+        self.module_currents = led_currents + self.idle_current
+        self.total_current = float(self.module_currents.sum())
+        return pixels
+
+    # Is the brightness still coming back up, so the same frame would be
+    #  sent brighter next time
+    def is_ramping(self):
+        return bool((self.scales < self.targets).any())
+
+    def get_metrics(self):
+        """
+        The estimated current of the last frame sent, after any dimming, how
+        much headroom that leaves under the limits, and how far each module
+        has been dimmed
+        """
+        metrics = {
+            "total_current": self.total_current,
+            "module_currents": dict(zip(self.modules, self.module_currents.tolist())),
+            "module_scales": dict(zip(self.modules, self.scales[1:].tolist())),
+            "limiting": self.limiting,
+        }
+        if self.total_limit is not None:
+            metrics["total_headroom"] = self.total_limit - self.total_current
+        if self.module_limit is not None:
+            metrics["module_headroom"] = self.module_limit - float(self.module_currents.max())
+        return metrics
+
+    @staticmethod
+    def from_config(config, layout):
+        """
+        Build the limiter from the power_limit section of the system config,
+        or return None if there isn't one
+        """
+        try:
+            settings = config["system"]["power_limit"]
+        except (KeyError, TypeError):
+            return None
+        if settings is None:
+            return None
+        if numpy is None:
+            PowerLimiter.logger.warn("numpy is required for the power limit, the floor won't be limited")
+            return None
+
+        total_limit = settings.get("total")
+        module_limit = settings.get("module")
+        return PowerLimiter(layout.get_module_map(),
+                            total_limit=float(total_limit) if total_limit is not None else None,
+                            module_limit=float(module_limit) if module_limit is not None else None,
+                            channel_current=settings.get("channel_current", 20.0),
+                            idle_current=float(settings.get("idle_current", 0.0)),
+                            release=float(settings.get("release", 0.05)))
@@ -0,0 +1,179 @@
+__authors__ = ['Andrew Taylor']
+
+# Without numpy the sprites are kept as lists, and blitted a pixel at a time
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from lib.floorcanvas import unpack_colour
+
+
+class Sprite(object):
+    """
+    A small piece of artwork, held as a (width, height) boolean mask of
+    which pixels are drawn and, optionally, a (width, height, 3) array of
+    their colours. A sprite without colours of its own is drawn in a single
+    colour given when it is blitted.
+
+    The rotated and flipped versions of a sprite are only worked out once,
+    the first time they are asked for (or all together by
+    precompute_variants()), so blitting any of them is a single array copy.
+    Sprites are shared, so their arrays are read only. Without numpy the
+    mask is a list of columns of bools, and the colours columns of (r, g, b)
+    tuples, which shouldn't be changed either.
+    """
+
+    def __init__(self, mask, pixels=None):
+        self.pixels = None
+        if numpy is not None:
+            self.mask = numpy.array(mask, dtype=bool)
+            self.mask.flags.writeable = False
+            (self.width, self.height) = self.mask.shape
+            # Without any transparent pixels the mask doesn't need to be applied
+            self.opaque = bool(self.mask.all())
+            if pixels is not None:
+                self.pixels = numpy.array(pixels, dtype=numpy.uint8)
+                self.pixels.flags.writeable = False
+        else:
+            self.mask = [[bool(value) for value in column] for column in mask]
+            self.width = len(self.mask)
+            self.height = len(self.mask[0]) if self.width > 0 else 0
+            self.opaque = all([all(column) for column in self.mask])
+            if pixels is not None:
+                self.pixels = [[unpack_colour(tuple(colour)) for colour in column] for column in pixels]
+        self.variants = {(0, False, False): self}
+        self.planes = {}
+
+    def get_size(self):
+        return (self.width, self.height)
+
+    @staticmethod
+    def from_columns(columns, height):
+        """
+        A single colour sprite from a list of packed columns, the bits of
+        each being the rows from the top down, like the text glyphs
+        """
+        return Sprite([[(column >> y) & 0x01 for y in range(height)] for column in columns])
+
+    @staticmethod
+    def from_points(points):
+        """
+        A single colour sprite from a list of (x, y) positions, relative to
+        the top left of the sprite, which is at (0, 0)
+        """
+        width = max([x for (x, y) in points]) + 1
+        height = max([y for (x, y) in points]) + 1
+        mask = [[False] * height for x in range(width)]
+        for (x, y) in points:
+            mask[x][y] = True
+        return Sprite(mask)
+
+    @staticmethod
+    def from_strings(rows, palette=None):
+        """
+        A sprite drawn as a list of strings, one per row from the top, with
+        a space or '.' for a transparent pixel. Without a palette every other
+        character is drawn in the colour given when the sprite is blitted,
+        otherwise the palette maps characters to their colours, as (r, g, b)
+        tuples or packed ints
+        """
+        width = max([len(row) for row in rows])
+        height = len(rows)
+        mask = [[False] * height for x in range(width)]
+        pixels = None
+        if palette is not None:
+            pixels = [[(0, 0, 0)] * height for x in range(width)]
+        for (y, row) in enumerate(rows):
+            for (x, character) in enumerate(row):
+                if character in " .":
+                    continue
+                mask[x][y] = True
+                if palette is not None:
+                    pixels[x][y] = unpack_colour(palette[character])
+        return Sprite(mask, pixels)
+
+    def get_variant(self, rotation=0, flip_x=False, flip_y=False):
+        """
+        The sprite flipped left to right and/or top to bottom, and then turned
+        clockwise by rotation quarter turns
+        """
+        key = (rotation % 4, bool(flip_x), bool(flip_y))
+        if key not in self.variants:
+            self.variants[key] = self._transform(*key)
+        return self.variants[key]
+
+    def precompute_variants(self):
+        for rotation in range(4):
+            for flip_x in (False, True):
+                for flip_y in (False, True):
+                    self.get_variant(rotation, flip_x, flip_y)
+        return self
+
+    def _transform(self, rotation, flip_x, flip_y):
+        arrays = [self.mask]
+        if self.pixels is not None:
+            arrays.append(self.pixels)
+        transformed = []
+        for array in arrays:
+            if numpy is not None:
+                if flip_x:
+                    array = array[::-1]
+                if flip_y:
+                    array = array[:, ::-1]
+                # The arrays are [x][y] and y is down the floor, so numpy's
+                #  anticlockwise rotation of the axes is clockwise on the floor
+                array = numpy.rot90(array, rotation, axes=(0, 1))
+            else:
+                if flip_x:
+                    array = array[::-1]
+                if flip_y:
+                    array = [column[::-1] for column in array]
+                # Each quarter turn, what was the bottom row becomes the
+                #  first column, the same as numpy.rot90() above
+                for turn in range(rotation):
+                    height = len(array[0])
+                    array = [[column[height - 1 - x] for column in array] for x in range(height)]
+            transformed.append(array)
+        if self.pixels is None:
+            return Sprite(transformed[0])
+        return Sprite(transformed[0], transformed[1])
+
+    def get_plane(self, colour):
+        """
+        The sprite's shape filled with a single colour, which is kept, as
+        sprites tend to be drawn in the same few colours over and over
+        (only with numpy, otherwise the colour is drawn as it is)
+        """
+        colour = unpack_colour(colour)
+        if colour not in self.planes:
+            plane = numpy.empty((self.width, self.height, 3), dtype=numpy.uint8)
+            plane[...] = colour
+            plane.flags.writeable = False
+            self.planes[colour] = plane
+        return self.planes[colour]
+
+
+class SpriteSheet(object):
+    # A named set of sprites, with all their rotations and flips worked out
+    #  as they are added, so a plugin can load its artwork once and then
+    #  just look it up when drawing
+
+    def __init__(self, sprites=None):
+        self.sprites = {}
+        if sprites is not None:
+            for (name, sprite) in sprites.items():
+                self.add(name, sprite)
+
+    def __len__(self):
+        return len(self.sprites)
+
+    def __contains__(self, name):
+        return name in self.sprites
+
+    def add(self, name, sprite):
+        self.sprites[name] = sprite.precompute_variants()
+        return sprite
+
+    def get(self, name, rotation=0, flip_x=False, flip_y=False):
+        return self.sprites[name].get_variant(rotation, flip_x, flip_y)
@@ -1,7 +1,24 @@
 __authors__ = ['Andrew Taylor']
 
+from array import array
+
+from lib.cache import LRUCache
+
+# numpy is only used to turn the rendered text into a mask that can be
+#  drawn in one go, without it the text is drawn a pixel at a time
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class TextWriter():
+    # Each character is 5 columns of 7 pixels, the bits of each column value
+    #  being the rows from the top down, with a blank column after it
+    pixel_height = 7
+    pixel_width = 5
+    space_padding = 1
+
     font_5x7 = {
     " ": (0x00, 0x00, 0x00, 0x00, 0x00),
     "\"": (0x00, 0x07, 0x00, 0x07, 0x00),  # "
@@ -98,28 +115,111 @@ class TextWriter():
     "}": (0x00, 0x41, 0x36, 0x08, 0x00),  # }
     }
 
+    # All of font_5x7 as one array of packed columns, one glyph after
+    #  another, with glyph_offsets giving the index of each character's first
+    #  column. Built once, below the class
+    glyph_atlas = None
+    glyph_offsets = None
+
+    # Strings that have already been put together, so that text drawn every
+    #  frame is only rendered once. Each entry is [columns, mask], where the
+    #  mask is only made when it is first needed
+    rendered_text = LRUCache(128)
+
+    @staticmethod
+    def build_glyph_atlas(font):
+        atlas = array('B')
+        offsets = {}
+        for character in sorted(font.keys()):
+            offsets[character] = len(atlas)
+            atlas.extend(font[character])
+        return (atlas, offsets)
+
+    @staticmethod
+    def get_glyph(character, custom_text=None):
+        """
+        Return the packed columns for a character, from custom_text if it has
+        one for it, otherwise from the font
+        """
+        if custom_text is not None and character in custom_text:
+            return custom_text[character]
+        offset = TextWriter.glyph_offsets[character]
+        return TextWriter.glyph_atlas[offset:offset + TextWriter.pixel_width]
+
+    @staticmethod
+    def get_advance(glyph):
+        """
+        How far across the next character starts after this one. Custom
+        glyphs can be wider than the font, and take up as much room as they
+        need
+        """
+        return max(len(glyph), TextWriter.pixel_width + TextWriter.space_padding)
+
+    @staticmethod
+    def get_text_size(text, custom_text=None):
+        """
+        The (width, height) that the text would take up when drawn, found
+        without rendering it
+        """
+        if len(text) == 0:
+            return (0, 0)
+        # Every character needs a glyph, as drawing it would
+        width = sum([TextWriter.get_advance(TextWriter.get_glyph(character, custom_text)) for character in text])
+        return (width, TextWriter.pixel_height)
+
+    @staticmethod
+    def _render(text, custom_text=None):
+        key = text
+        if custom_text is not None:
+            key = (text, tuple(sorted((character, tuple(columns)) for (character, columns) in custom_text.items())))
+        rendered = TextWriter.rendered_text.get(key)
+        if rendered is None:
+            # One packed column per pixel across, the glyphs separated by
+            #  blank columns
+            glyphs = [TextWriter.get_glyph(character, custom_text) for character in text]
+            columns = array('B', [0]) * sum([TextWriter.get_advance(glyph) for glyph in glyphs])
+            start = 0
+            for glyph in glyphs:
+                columns[start:start + len(glyph)] = array('B', glyph)
+                start += TextWriter.get_advance(glyph)
+            rendered = TextWriter.rendered_text.put(key, [columns, None])
+        return rendered
+
+    @staticmethod
+    def get_text_mask(text, custom_text=None):
+        """
+        A (width, height) boolean numpy array which is True for the pixels to
+        draw to make the text. It is shared, so don't change it
+        """
+        rendered = TextWriter._render(text, custom_text)
+        if rendered[1] is None:
+            columns = numpy.frombuffer(rendered[0], dtype=numpy.uint8)
+            mask = ((columns[:, numpy.newaxis] >> numpy.arange(TextWriter.pixel_height)) & 0x01).astype(bool)
+            mask.flags.writeable = False
+            rendered[1] = mask
+        return rendered[1]
+
     @staticmethod
     def draw_text(surface, text, colour, x_pos, y_pos, custom_text=None):
         """
         Draws text in the specified place, in the appropriate colour
         """
-        text_buffer = TextWriter.make_text(text, custom_text)
-
-        width = len(text_buffer)
-        height = 0
-        if (width > 0):
-            height = len(text_buffer[0])
+        (width, height) = TextWriter.get_text_size(text, custom_text)
 
         # If surface is None, then we just return the size of the text, and
         # not actually draw it
-        if (surface != None):
-            for x in range(0, len(text_buffer)):
-                for y in range(0, len(text_buffer[x])):
-                    if (text_buffer[x][y] == 1):
-                        if type(colour) == tuple:
-                            surface.set_pixel_tuple(x + x_pos, y + y_pos, colour)
-                        else:
-                            surface.set_pixel(x + x_pos, y + y_pos, colour)
+        if surface is not None and width > 0:
+            if numpy is not None:
+                surface.fill_mask(TextWriter.get_text_mask(text, custom_text), colour, x_pos, y_pos)
+            else:
+                columns = TextWriter._render(text, custom_text)[0]
+                for x in range(0, width):
+                    for y in range(0, height):
+                        if (columns[x] >> y) & 0x01:
+                            if type(colour) == tuple:
+                                surface.set_pixel_tuple(x + x_pos, y + y_pos, colour)
+                            else:
+                                surface.set_pixel(x + x_pos, y + y_pos, colour)
 
         return (width, height)
 
@@ -128,36 +228,8 @@ class TextWriter():
         """
         Construct a buffer that contains which pixels to draw (=1) to make text
         """
-        pixel_height = 7
-        pixel_width = 5
-
-        font_characters = []
-
-        # Gap between each character
-        space_padding = 1
-
-        output_buffer = [[0 for y in range(0, pixel_height)] for x in
-                         range(0, (pixel_width + space_padding) * len(string))]
-
-        # if (len(output_buffer) > 0):
-        #	print "Output buffer size is %d x %d" % (len(output_buffer), len(output_buffer[0]))
-
-        # For each character in the string, grab the array of pixels from the
-        #  5x7 font collection, and then insert the data into the output array
-        character_number = 0
-        for character in string:
-            character_definition = None
-            if custom_text is not None:
-                if character in custom_text:
-                    character_definition = custom_text[character]
-            if character_definition is None:
-                character_definition = TextWriter.font_5x7[character]
-            font_characters.append(character_definition)
-            if (character_definition != None):
-                for x in range(0, len(character_definition)):
-                    for y in range(0, pixel_height):
-                        pixel_value = (character_definition[x] >> y) & 0x01
-                        output_buffer[character_number * (pixel_width + space_padding) + x][y] = pixel_value
-            character_number += 1
-
-        return output_buffer
+        columns = TextWriter._render(string, custom_text)[0]
+        return [[(column >> y) & 0x01 for y in range(0, TextWriter.pixel_height)] for column in columns]
+
+
+(TextWriter.glyph_atlas, TextWriter.glyph_offsets) = TextWriter.build_glyph_atlas(TextWriter.font_5x7)
@@ -0,0 +1,168 @@
+__authors__ = ['Andrew Taylor']
+
+# How long frames take to go down the serial links to the floor, and so how
+#  fast the floor can be updated, worked out from the config, e.g.
+#
+#    python -m lib.wiretime --config config.yaml --frame_rate 25
+#
+#  which prints the bytes each chain of modules is sent per frame, how long
+#  that takes on the wire and the most frames per second it can manage
+
+import argparse
+import logging
+import sys
+
+import yaml
+
+# Each byte on the wire is a start bit, the 8 data bits and a stop bit
+BITS_PER_BYTE = 10
+# The frame rate DDRPi runs at unless the config says otherwise
+DEFAULT_FRAME_RATE = 25
+
+
+def wire_time(frame_bytes, baud):
+    """
+    The time, in seconds, to send frame_bytes bytes at the baud rate
+    """
+    return frame_bytes * BITS_PER_BYTE / float(baud)
+
+
+class PortModel(object):
+    """
+    The model of a single serial port driving a chain of modules: every cell
+    on the chain is sent as three bytes, then the sync byte
+    """
+
+    def __init__(self, tty, modules, cells, baud):
+        self.tty = tty
+        self.modules = modules
+        self.cells = cells
+        self.baud = baud
+        self.frame_bytes = 3 * cells + 1
+        self.wire_time = wire_time(self.frame_bytes, baud)
+        self.max_fps = 1.0 / self.wire_time
+
+    def __str__(self):
+        return ("%s: %d modules, %d bytes per frame, %.2fms on the wire at %d baud, up to %.1ffps" %
+                (self.tty, len(self.modules), self.frame_bytes, self.wire_time * 1000.0, self.baud, self.max_fps))
+
+
+class WriteTimer(object):
+    # How long the writes to a port have been taking. This is the time
+    #  write() blocks for, which is short while the operating system's
+    #  buffer has room, and the time the link takes to send a frame once
+    #  frames are coming faster than that
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.longest = 0.0
+
+    def record(self, duration):
+        self.count += 1
+        self.total += duration
+        self.longest = max(self.longest, duration)
+
+    def get_mean(self):
+        if self.count == 0:
+            return None
+        return self.total / self.count
+
+
+def get_frame_rate(config):
+    try:
+        return float(config["system"]["frame_rate"])
+    except (KeyError, TypeError):
+        return DEFAULT_FRAME_RATE
+
+
+def model_serial_outputs(config):
+    """
+    Return a list of (output number, [PortModel, ...]) for each enabled
+    serial output in the config, with the ports split up the way the output
+    will send to them
+    """
+    cells = {}
+    for (module, module_config) in config.get("modules", {}).items():
+        cells[module] = int(module_config["width"]) * int(module_config["height"])
+
+    models = []
+    for (output_number, details) in sorted(config.get("outputs", {}).items()):
+        if details.get("type") != "serial" or details.get("enabled") is False:
+            continue
+        baud = details.get("baud")
+        if baud is None:
+            logging.getLogger(__name__).warn("No baud rate for output %s, can't work out its timing" % output_number)
+            continue
+        ports = details.get("ports")
+        if ports is None:
+            ports = {1: {"tty": details.get("tty")}}
+        port_models = []
+        for (port_number, port_config) in sorted(ports.items()):
+            modules = port_config.get("modules")
+            if modules is None:
+                modules = sorted(cells.keys())
+            port_models.append(PortModel(port_config.get("tty"), modules,
+                                         sum([cells.get(module, 0) for module in modules]), int(baud)))
+        models.append((output_number, port_models))
+    return models
+
+
+def check_frame_rate(config, frame_rate=None, logger=None, report=None):
+    """
+    Check every serial port against the frame rate (the one in the config
+    if not given), and return how many can't keep up. Each port is passed to
+    report(output_number, port_model, too_slow), which by default logs it,
+    with a warning for the ports that are too slow
+    """
+    if frame_rate is None:
+        frame_rate = get_frame_rate(config)
+    if logger is None:
+        logger = logging.getLogger(__name__)
+    if report is None:
+        def report(output_number, port_model, too_slow):
+            logger.info("Output %s, %s" % (output_number, port_model))
+            if too_slow:
+                logger.warn("Output %s can't send %.1ffps to %s, it can manage %.1ffps at most" %
+                            (output_number, frame_rate, port_model.tty, port_model.max_fps))
+    too_slow = 0
+    for (output_number, port_models) in model_serial_outputs(config):
+        for port_model in port_models:
+            port_too_slow = port_model.max_fps < frame_rate
+            report(output_number, port_model, port_too_slow)
+            if port_too_slow:
+                too_slow += 1
+    return too_slow
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Work out how fast frames can be sent to the floor')
+    parser.add_argument('--config', required=False, dest='config', default='config.yaml',
+                        help='The location of the configuration file')
+    parser.add_argument('--frame_rate', required=False, dest='frame_rate', type=float, default=None,
+                        help='The frame rate to check, instead of the one in the config')
+    args = parser.parse_args(args)
+
+    with open(args.config) as config_file:
+        config = yaml.safe_load(config_file)
+    frame_rate = args.frame_rate
+    if frame_rate is None:
+        frame_rate = get_frame_rate(config)
+
+    print("Frame rate: %.1ffps (%.2fms per frame)" % (frame_rate, 1000.0 / frame_rate))
+    # The ports come grouped by output, so a heading goes before the first
+    #  port of each one
+    last_output = [None]
+
+    def report(output_number, port_model, too_slow):
+        if output_number != last_output[0]:
+            print("Output %s:" % output_number)
+            last_output[0] = output_number
+        print("  %s%s" % (port_model, "  ** too slow **" if too_slow else ""))
+
+    too_slow = check_frame_rate(config, frame_rate, report=report)
+    return 1 if too_slow > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
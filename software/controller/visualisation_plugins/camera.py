@@ -78,11 +78,13 @@ class CameraVisualisationPlugin(VisualisationPlugin):
             image = self.webcam.get_image()
             resized_image = pygame.transform.scale(image, (surface.get_width(), surface.get_height()))
 
+            # The surface array is already indexed [x][y], the same as the
+            #  canvas, so it can be written in one go
             pixel_array = pygame.surfarray.pixels3d(resized_image)
             #self.logger.info(pixel_array)
-            for row, row_data in enumerate(pixel_array):
-                for column, pixel_data in enumerate(row_data):
-                    surface.set_pixel(row, column, (pixel_data[0], pixel_data[1], pixel_data[2]))
+            surface.set_pixels(pixel_array)
+            # pixels3d() locks the image until the array is released
+            del pixel_array
 
 
         # Limit the frame rate.
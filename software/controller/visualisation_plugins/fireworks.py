@@ -2,11 +2,13 @@ from VisualisationPlugin import VisualisationPlugin
 
 import pygame
 import logging
-import colorsys
 import math
 import random
+import numpy
 
 from DDRPi import FloorCanvas
+from lib.layers import LayerStack
+from lib.fields import field_cache
 from lib.controllers import ControllerInput
 
 
@@ -21,6 +23,7 @@ class FireworksVisualisationPlugin(VisualisationPlugin):
         self.mode = self.modes[self.mode_index]
 
         self.fireworks = None
+        self.layer_stack = None
 
     # Nothing specific to be done before this starts, although we could
     # set self.clock here. Stash any config so we can use it later
@@ -192,13 +195,30 @@ class FireworksVisualisationPlugin(VisualisationPlugin):
                int(round(colour[2] * 255)) % 256
 
 
+    # Each firework gets two layers, one for its tail and one for its
+    #  explosion, so that they overlap in the same order they always have.
+    #  The layers are kept between frames rather than re-created each time
+    def get_layer_stack(self, canvas, quantity):
+        size = (canvas.get_width(), canvas.get_height())
+        if self.layer_stack is None or self.layer_stack.get_size() != size or len(self.layer_stack) != 2 * quantity:
+            self.layer_stack = LayerStack(*size)
+            for i in range(2 * quantity):
+                self.layer_stack.add_layer("normal")
+        return self.layer_stack
+
     # We've split the method that does the drawing out, so that draw_splash()
     #  can call it with a fixed timer
     def draw_surface(self, canvas, fireworks, t):
         canvas.set_colour(FloorCanvas.BLACK)
 
+        layer_stack = self.get_layer_stack(canvas, len(fireworks))
+        layer_stack.clear()
+
         for idx, firework in enumerate(fireworks):
 
+            tail_layer = layer_stack.layers[2 * idx]
+            explosion_layer = layer_stack.layers[2 * idx + 1]
+
             # See if the delay, if set, has elapsed.
             if "delay" in firework:
                 # If it has elapsed, or not set, nothing to do
@@ -224,7 +244,9 @@ class FireworksVisualisationPlugin(VisualisationPlugin):
             else:
                 current_height = firework["target_height"]
 
-            (h, s, v) = colorsys.rgb_to_hsv(*self.normalize(firework["colour"]))
+            # Scaling the value of an HSV colour just scales the RGB
+            #  components, so there's no need to go through HSV at all
+            colour = self.normalize(firework["colour"])
 
             if self.mode == "FIREWORKS":
                 # Draw the launching tail, which is an antialiased line, with
@@ -233,25 +255,19 @@ class FireworksVisualisationPlugin(VisualisationPlugin):
                 (x_quot, x_rem) = divmod(firework["x"], 1.0)
                 (y_quot, y_rem) = divmod(current_height, 1.0)
                 #self.logger.info("y quot:%f, mod:%f" % (y_quot, y_rem))
-                # Draw the tail
-                for y in range(int(y_quot)):
-                    # If it is a few blocks away, then tail the value off
+                # Draw the tail, tailing the value off over the last few blocks
+                tail_start = theoretical_height - 1 - firework["tail"]
+                for y in range(max(0, int(math.ceil(tail_start))), int(y_quot)):
                     if y < (theoretical_height - 1):
-                        if y < theoretical_height - 1 - firework["tail"]:
-                            pass
-                        else:
-                            tail_prop = (y - (theoretical_height - 1 - firework["tail"])) / float(firework["tail"])
-                            #self.logger.info("hsv input: %f,%f,%f" % (h,s,v))
-                            canvas.set_pixel(x_quot, y, (h, s, tail_prop * v), format="HSV")
+                        tail_prop = (y - tail_start) / float(firework["tail"])
+                        tail_layer.set_pixel(x_quot, y, self.reformat([c * tail_prop for c in colour]))
                 # If there is an extra bit left over
                 if y_rem > 0.01:
-                    v_partial = v * y_rem
-                    #self.logger.info("Remainder: %f, v_partial: %f" % (y_rem, v_partial))
-                    canvas.set_pixel(x_quot, y_quot, (h, s, v_partial), format="HSV")
+                    tail_layer.set_pixel(x_quot, y_quot, self.reformat([c * y_rem for c in colour]))
 
                 if firework["mode"] == "LAUNCH":
                     # Always Draw the brightest firework point
-                    canvas.set_pixel(x_quot, y_quot, (h, s, v), format="HSV")
+                    tail_layer.set_pixel(x_quot, y_quot, firework["colour"])
             if firework["mode"] == "EXPLODE":
                 # Draw an increasing disc of light
 
@@ -274,26 +290,24 @@ class FireworksVisualisationPlugin(VisualisationPlugin):
                 if decay_ratio < 0.01:
                     firework["mode"] = "DEAD"
 
-                for x in range(canvas.get_width()):
-                    for y in range(canvas.get_height()):
-                        # Calculate how far away from the centre of the blob the centre of this pixel is
-                        x_d = x - explode_x
-                        y_d = y - explode_y
-                        distance_away = math.sqrt(x_d * x_d + y_d * y_d)
+                # How far away from the centre of the blob the centre of every pixel is,
+                #  which doesn't change as the explosion goes on
+                distance_away = field_cache.distance(canvas.get_width(), canvas.get_height(), explode_x, explode_y)
 
-                        distance_decay_factor = 1.0
-                        if explosion_radius >= 1:
-                            distance_decay_factor = 1.0 * (distance_away / explosion_radius)
+                distance_decay_factor = 1.0
+                if explosion_radius >= 1:
+                    distance_decay_factor = distance_away / explosion_radius
 
-                        # As the firework decays, the alpha channel is set so that you can see through it
-                        #  to other fireworks behind, or it just fades to black
-                        if distance_away < explosion_radius:
-                            canvas.set_pixel(x, y, (h, s, v), "HSV", decay_ratio * distance_decay_factor)
-                        elif distance_away < explosion_radius + 1:
-                            (d_quot, d_rem) = divmod(distance_away - explosion_radius, 1.0)
-                            canvas.set_pixel(x, y, (h, s, v), "HSV", (1 - d_rem) * decay_ratio * distance_decay_factor)
+                # As the firework decays, the alpha channel is set so that you can see through it
+                #  to other fireworks behind, or it just fades to black. The edge of the disc
+                #  fades out over the pixel beyond the radius
+                (d_quot, d_rem) = numpy.divmod(distance_away - explosion_radius, 1.0)
+                edge = numpy.where(distance_away < explosion_radius, 1.0,
+                                   numpy.where(distance_away < explosion_radius + 1, 1 - d_rem, 0.0))
+                explosion_layer.rgba[..., :3] = colour
+                explosion_layer.rgba[..., 3] = edge * decay_ratio * distance_decay_factor
 
+        layer_stack.composite(canvas)
 
         # Return the canvas
         return canvas
-
@@ -1,53 +1,27 @@
-from VisualisationPlugin import VisualisationPlugin
-
-import pygame
-# For colour conversion functions
-from colorsys import hls_to_rgb
-
-from DDRPi import FloorCanvas
-
-
-class HlsTestVisualisationPlugin(VisualisationPlugin):
-    def __init__(self):
-        self.clock = pygame.time.Clock()
-
-    def draw_frame(self, surface):
-
-        # Limit the frame rate.
-        # This sleeps so that at least 25ms has passed since tick()
-        # was last called. It is a no-op if the loop is running slow
-        self.clock.tick(25)
-        # Draw whatever this plugin does.
-        # We need to return our decorated surface
-        return self.draw_surface(surface, pygame.time.get_ticks())
-
-    def draw_splash(self, canvas):
-        return self.draw_surface(canvas, 0)
-
-    def draw_surface(self, canvas):
-        return self.draw_surface(0)
-
-    def draw_surface(self, canvas, ticks):
-        canvas.set_colour(FloorCanvas.WHITE)
-
-        for x in range(0, canvas.get_width()):
-            for y in range(0, canvas.get_height()):
-                h = float(x) / canvas.get_width()
-                # A saturation of 1.0 gives pure colour
-                # 0 = grey
-                s = 1.0
-                # a lightness of 0.5 gives pure colour,
-                #  0 = black, 1 = white
-                l = float(y) / canvas.get_height()
-
-                # Convert the hls colourspace to RGB so we
-                #  can assign it to a pixel
-                rgb = hls_to_rgb(h, l, s)
-                canvas.set_float_pixel_tuple(x, y, rgb)
-
-
-        # Return the canvas
-        return canvas
+from ShaderVisualisationPlugin import ShaderVisualisationPlugin
+from lib.floorcanvas import hls_to_rgb_array
+
+import numpy
+
+
+class HlsTestVisualisationPlugin(ShaderVisualisationPlugin):
+    # The colours are worked out in HLS, and converted to RGB here, so they
+    #  can be truncated to 0-255 the way set_float_pixel_tuple() does
+    colour_format = "RGB"
+
+    def shade(self, x, y, t):
+        (width, height) = self.size
+        hls = numpy.empty((width, height, 3))
+        hls[..., 0] = x / width
+        # a lightness of 0.5 gives pure colour,
+        #  0 = black, 1 = white
+        hls[..., 1] = y / height
+        # A saturation of 1.0 gives pure colour
+        # 0 = grey
+        hls[..., 2] = 1.0
+
+        # Return the colours
+        return numpy.trunc(hls_to_rgb_array(hls) * 255).astype(numpy.uint8)
 
 
 
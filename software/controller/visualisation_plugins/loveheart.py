@@ -4,13 +4,20 @@ import pygame
 import logging
 
 from DDRPi import FloorCanvas
+from lib.fonts import load_font
+from lib.sprites import Sprite
 
 
 class LoveHeartVisualisationPlugin(VisualisationPlugin):
     logger = logging.getLogger(__name__)
 
+    # The heart is 7 columns of 6 pixels, drawn in whatever colour it is pulsing
+    heart_outline = Sprite.from_columns((0x06, 0x09, 0x11, 0x22, 0x11, 0x09, 0x06), 6)
+    heart_filled = Sprite.from_columns((0x06, 0x0F, 0x1F, 0x3E, 0x1F, 0x0F, 0x06), 6)
+
     def __init__(self):
         self.clock = pygame.time.Clock()
+        self.font = load_font("5x7-narrow")
 
     # Nothing specific to be done before this starts, although we could
     # set self.clock here. Stash any config so we can use it later
@@ -118,57 +125,19 @@ class LoveHeartVisualisationPlugin(VisualisationPlugin):
 
     def draw_heart(self, canvas, colour, x_pos, y_pos, fill):
 
-        heart = (0x06, 0x09, 0x11, 0x22, 0x11, 0x09, 0x06);
+        heart = LoveHeartVisualisationPlugin.heart_outline
         if (fill > 0):
-            heart = (0x06, 0x0F, 0x1F, 0x3E, 0x1F, 0x0F, 0x06);
-        heart_height = 6
-        heart_width = len(heart)
-
-        for x in range(0, heart_width):
-            for y in range(0, heart_height):
-                pixel_value = (heart[x] >> y) & 0x01
-                if (pixel_value == 1):
-                    canvas.set_pixel(x + x_pos, y + y_pos, colour)
-
-    def draw_text(self, canvas, text, x, y):
-
-        if text == "Phil":
-            self.draw_phil(canvas, x, y)
-        elif text == "Naomi":
-            self.draw_naomi(canvas, x, y)
-        else:
-            canvas.draw_text(text, (0xFF, 0xFF, 0xFF), x, y)
+            heart = LoveHeartVisualisationPlugin.heart_filled
 
+        canvas.blit_sprite(heart, x_pos, y_pos, colour)
         return canvas
 
+    # The names are drawn in the narrow font, so that most of them fit
+    #  across the floor, in the middle if there is room
+    def draw_text(self, canvas, text, x, y):
 
-    def draw_phil(self, canvas, x, y):
-
-        # To make it central
-        offset = 4
-
-        canvas.draw_text("P", (0xFF, 0xFF, 0xFF), x + offset, y)
-
-        # Use the narrow i that we have to use for Naomi, and a h
-        custom_text = {"h": (0x7F, 0x08, 0x04, 0x78, 0), "i": (0x7D, 0, 0, 0, 0), "l": (0x7F, 0, 0, 0, 0), }
-        canvas.draw_text("h", (0xFF, 0xFF, 0xFF), x + offset + 6, y, custom_text)
-        canvas.draw_text("i", (0xFF, 0xFF, 0xFF), x + offset + 11, y, custom_text)
-        canvas.draw_text("l", (0xFF, 0xFF, 0xFF), x + offset + 13, y, custom_text)
-
-        return canvas
-
-    def draw_naomi(self, canvas, x, y):
-
-        offset = 0
-        canvas.draw_text("N", (0xFF, 0xFF, 0xFF), x + offset, y)
-
-        # Hand craft a narrower a & o
-        custom_text = {"o": (0x38, 0x44, 0x44, 0x38, 0x00), "a": (0x20, 0x54, 0x54, 0x78, 0x00),
-                       "i": (0x7D, 0, 0, 0, 0)}
-        canvas.draw_text("a", (0xFF, 0xFF, 0xFF), x + offset + 6, y, custom_text)
-        canvas.draw_text("o", (0xFF, 0xFF, 0xFF), x + offset + 11, y, custom_text)
-        canvas.draw_text("m", (0xFF, 0xFF, 0xFF), x + offset + 16, y)
-        canvas.draw_text("i", (0xFF, 0xFF, 0xFF), x + offset + 22, y, custom_text)
+        (text_width, text_height) = canvas.get_text_size(text, self.font)
+        offset = max(0, (canvas.get_width() - text_width) // 2)
+        canvas.draw_text(text, (0xFF, 0xFF, 0xFF), x + offset, y, font=self.font)
 
         return canvas
-
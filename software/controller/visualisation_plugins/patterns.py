@@ -3,11 +3,12 @@ __authors__ = ['Stew Francis']
 import csv
 import time
 import math
-import colorsys
 import pygame
 import os
+import numpy
 
 from DDRPi import FloorCanvas
+from lib.floorcanvas import PaletteFloorCanvas, rgb_to_hls_array, hls_to_rgb_array
 
 from VisualisationPlugin import VisualisationPlugin
 
@@ -18,9 +19,17 @@ import logging
 
 
 class Filter(object):
+    # Filters that only change the colours, and not where they are, can be
+    #  done as an edit to the palette of a palette canvas instead of to
+    #  every cell of the frame
+    paletteFilter = False
+
     def process(self, frame):
         raise NotImplementedError
 
+    def processPalette(self, canvas):
+        raise NotImplementedError
+
 
 class Pattern(object):
     logger = logging.getLogger(__name__)
@@ -39,7 +48,9 @@ class Pattern(object):
                 #convert to float representation
                 rows.append([hexToFloatTuple(colour) for colour in row])
 
-        self.frames = [rows[i * height: (i + 1) * height] for i in range(0, len(rows) // height)]
+        # Each frame is a (height, width, 3) array of floats, frame[y][x]
+        self.frames = [numpy.array(rows[i * height: (i + 1) * height], dtype=float)
+                       for i in range(0, len(rows) // height)]
         self.beatsPerFrame = 1 / float(framesPerBeat)
 
 
@@ -109,35 +120,40 @@ class MotionBlurFilter(Filter):
         return self.__currentFrame
 
     def __decay(self, frame):
-        if self.__currentFrame == None: return None
-        return [[MotionBlurFilter.__applyDecay(self.__decayFactor, rgb) for rgb in row] for row in frame]
+        if self.__currentFrame is None: return None
+        return MotionBlurFilter.__applyDecay(self.__decayFactor, frame)
 
     def __overlay(self, topFrame, bottomFrame):
-        if bottomFrame == None: return topFrame
-        frameOfPairedRows = zip(topFrame, bottomFrame)
-        return [[self.__blend(pair[0], pair[1]) for pair in zip(rowPairs[0], rowPairs[1])] for rowPairs in
-                frameOfPairedRows]
+        if bottomFrame is None: return topFrame
+        return self.__blend(topFrame, bottomFrame)
 
     @staticmethod
     def __blend(rgb1, rgb2):
-        return (max(rgb1[0], rgb2[0]), max(rgb1[1], rgb2[1]), max(rgb1[2], rgb2[2]))
+        return numpy.maximum(rgb1, rgb2)
 
     @staticmethod
     def __applyDecay(decayFactor, rgb):
-        (r, g, b) = rgb
-        (h, l, s) = colorsys.rgb_to_hls(r, g, b);
-        l *= decayFactor
-        return colorsys.hls_to_rgb(h, l, s)
+        hls = rgb_to_hls_array(rgb)
+        hls[..., 1] *= decayFactor
+        return hls_to_rgb_array(hls)
 
 
 class HueScroller(Filter):
+    paletteFilter = True
+
     def __init__(self):
         self.__lastAdjustment = 0.0
 
 
     def process(self, frame):
+        return BeatHueAdjustmentFilter.adjustHue(self.__nextAdjustment(), frame)
+
+    def processPalette(self, canvas):
+        canvas.shift_palette_hue(self.__nextAdjustment())
+
+    def __nextAdjustment(self):
         self.__lastAdjustment = (self.__lastAdjustment + 0.01) % 1 + 1 % 1
-        return [[BeatHueAdjustmentFilter.adjustHue(self.__lastAdjustment, rgb) for rgb in row] for row in frame]
+        return self.__lastAdjustment
 
 
 class ColourFilter(Filter):
@@ -146,7 +162,7 @@ class ColourFilter(Filter):
 
     def process(self, frame):
         #for each cell, apply the rgb filter
-        return [[(self.rgb[0] * rgb[0], self.rgb[1] * rgb[1], self.rgb[2] * rgb[2]) for rgb in row] for row in frame]
+        return frame * numpy.asarray(self.rgb, dtype=float)
 
 
 class BeatLightnessAdjustment(Filter):
@@ -164,23 +180,32 @@ class BeatLightnessAdjustment(Filter):
         #calculate how much we need to add to the hue, based on beat position
         frameAdjustment = self.__lightnessAdjustment / (math.e ** ((5 * x) ** 2))
         #for each cell, apply the hue adjustment
-        return [[BeatLightnessAdjustment.adjustLightness(frameAdjustment, rgb) for rgb in row] for row in frame]
+        return BeatLightnessAdjustment.adjustLightness(frameAdjustment, frame)
 
     @staticmethod
     def adjustLightness(adjustment, rgb):
-        (r, g, b) = rgb
-        (h, l, s) = colorsys.rgb_to_hls(r, g, b);
+        # Works on a single (r,g,b) or a whole frame of them at once
+        hls = rgb_to_hls_array(rgb)
         # inc and wrap h
-        l = ((l + adjustment) % 1 + 1 % 1)
-        return colorsys.hls_to_rgb(h, l, s)
+        hls[..., 1] = ((hls[..., 1] + adjustment) % 1 + 1 % 1)
+        return hls_to_rgb_array(hls)
 
 
 class BeatHueAdjustmentFilter(Filter):
+    paletteFilter = True
+
     def __init__(self, beatService, hueAdjustment):
         self.__beatService = beatService
         self.hueAdjustment = hueAdjustment
 
     def process(self, frame):
+        #for each cell, apply the hue adjustment
+        return BeatHueAdjustmentFilter.adjustHue(self.__frameHueAdjustment(), frame)
+
+    def processPalette(self, canvas):
+        canvas.shift_palette_hue(self.__frameHueAdjustment())
+
+    def __frameHueAdjustment(self):
         # beat position 0 -> 1, adjust to vary from function varies from -1 ->
         # 0-0.5 -> 0-1
         # 0.5-1 -> -1-0
@@ -191,18 +216,15 @@ class BeatHueAdjustmentFilter(Filter):
             x = 2 * (x - 1)
 
         #calculate how much we need to add to the hue, based on beat position
-        frameHueAdjustment = self.hueAdjustment / (math.e ** ((5 * x) ** 2))
-
-        #for each cell, apply the hue adjustment
-        return [[BeatHueAdjustmentFilter.adjustHue(frameHueAdjustment, rgb) for rgb in row] for row in frame]
+        return self.hueAdjustment / (math.e ** ((5 * x) ** 2))
 
     @staticmethod
     def adjustHue(adjustment, rgb):
-        (r, g, b) = rgb
-        (h, l, s) = colorsys.rgb_to_hls(r, g, b);
+        # Works on a single (r,g,b) or a whole frame of them at once
+        hls = rgb_to_hls_array(rgb)
         # inc and wrap h
-        h = ((h + adjustment) % 1 + 1 % 1)
-        return colorsys.hls_to_rgb(h, l, s)
+        hls[..., 0] = ((hls[..., 0] + adjustment) % 1 + 1 % 1)
+        return hls_to_rgb_array(hls)
 
 
 # This just seems to be a way to keep track of time	
@@ -232,6 +254,9 @@ class BeatService(object):
 
 
 class PatternsVisualisationPlugin(VisualisationPlugin):
+    # Every frame of a pattern covers the whole floor
+    redraws_whole_frame = True
+
     def __init__(self):
         self.clock = pygame.time.Clock()
 
@@ -380,12 +405,30 @@ class PatternsVisualisationPlugin(VisualisationPlugin):
 
     def draw_frame(self, canvas):
         self.clock.tick(50)
-        frame = PatternsVisualisationPlugin.apply(self.__getActivePattern(), list())
-
-        for y in range(0, canvas.get_height()):
-            row = frame[y]
-            for x in range(0, canvas.get_width()):
-                canvas.set_float_pixel_tuple(x, y, row[x])
+        filters = self.__getActivePattern()
+
+        # On a palette canvas, any filters at the end that only change the
+        #  colours are done to the palette after the frame is drawn
+        paletteFilters = []
+        if isinstance(canvas, PaletteFloorCanvas):
+            split = len(filters)
+            while split > 0 and filters[split - 1].paletteFilter:
+                split -= 1
+            (filters, paletteFilters) = (filters[:split], filters[split:])
+            # The whole frame is redrawn, so start with an empty palette
+            canvas.reset_palette()
+            canvas.clear_palette_effects()
+
+        frame = PatternsVisualisationPlugin.apply(filters, list())
+
+        # Frames are stored as rows of (r,g,b) floats, frame[y][x], so swap
+        #  the first two axes to get the [x][y] order the canvas uses, and
+        #  truncate them to 0-255 the way set_float_pixel_tuple() does
+        pixels = numpy.trunc(numpy.asarray(frame, dtype=float).transpose((1, 0, 2)) * 255)
+        canvas.set_pixels(numpy.clip(pixels, 0, 255).astype(numpy.uint8))
+
+        for paletteFilter in paletteFilters:
+            paletteFilter.processPalette(canvas)
         return canvas
 
     # End of Interface Methods
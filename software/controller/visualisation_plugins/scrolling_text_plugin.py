@@ -1,5 +1,6 @@
 __authors__ = ['Andrew Taylor']
 
+import math
 import random
 import time
 import pygame
@@ -7,13 +8,21 @@ import pygame
 from VisualisationPlugin import VisualisationPlugin
 
 import logging
-from lib.floorcanvas import FloorCanvas
+import numpy
+
+from lib.floorcanvas import FloorCanvas, unpack_colour
+from lib.text import TextWriter
 
 
 class ScrollingTextVisualisationPlugin(VisualisationPlugin):
     logger = logging.getLogger(__name__)
 
+    # The background is filled in before the text is drawn
+    redraws_whole_frame = True
+
     start_tick = -1
+    config = None
+    strip = None
 
     def __init__(self):
         self.clock = pygame.time.Clock()
@@ -22,6 +31,58 @@ class ScrollingTextVisualisationPlugin(VisualisationPlugin):
         self.config = config
         self.logger.info("Config: %s" % config)
 
+        self.text = "Congratulations"
+        self.colour = FloorCanvas.RED
+        self.background_colour = FloorCanvas.BLACK
+        self.speed = 10.0
+        # Scroll by fractions of a cell, blending each column into the next
+        self.smooth = False
+
+        if self.config is not None:
+            try:
+                self.text = "%s" % self.config["text"]
+            except (ValueError, KeyError):
+                pass
+
+            # Get the colour
+            try:
+                self.colour = getattr(FloorCanvas, self.config["colour"].upper())
+            except (AttributeError, KeyError):
+                pass
+
+            # Get the background colour
+            try:
+                self.background_colour = getattr(FloorCanvas, self.config["background_colour"].upper())
+            except (AttributeError, KeyError):
+                pass
+
+            # Get the speed
+            try:
+                self.speed = float(self.config["speed"])
+            except (ValueError, KeyError):
+                pass
+
+            try:
+                self.smooth = bool(self.config["smooth"])
+            except KeyError:
+                pass
+
+        self.render_strip()
+
+    # Draw the whole message, once, into a strip of (text width, text height)
+    #  colours, so each frame only has to copy the part of it that is on the
+    #  floor, however long the message is
+    def render_strip(self):
+        mask = TextWriter.get_text_mask(self.text)
+        # The size comes from the mask, as an empty message has no height
+        #  according to get_text_size(), but its mask is still a full 7 high
+        (self.text_width, self.text_height) = mask.shape
+        # The strip has a column of background either side, so the edges of
+        #  the text blend into the background when scrolling smoothly
+        self.strip = numpy.empty((self.text_width + 2, self.text_height, 3), dtype=numpy.uint8)
+        self.strip[...] = unpack_colour(self.background_colour)
+        self.strip[1:-1][mask] = unpack_colour(self.colour)
+
     def start(self):
         """
         Start writing to the surface
@@ -43,58 +104,43 @@ class ScrollingTextVisualisationPlugin(VisualisationPlugin):
         w = canvas.get_width()
         h = canvas.get_height()
 
-        text = "Congratulations"
-        colour = FloorCanvas.RED
-        background_colour = FloorCanvas.BLACK
-        speed = 10.0
-
-        if self.config is not None:
-            try:
-                text = "%s" % self.config["text"]
-            except (ValueError, KeyError):
-                pass
-
-            # Get the colour
-            try:
-                colour = getattr(FloorCanvas, self.config["colour"].upper())
-            except (AttributeError, KeyError):
-                pass
-
-            # Get the background colour
-            try:
-                background_colour = getattr(FloorCanvas, self.config["background_colour"].upper())
-            except (AttributeError, KeyError):
-                pass
-
-
-            # Get the speed
-            try:
-                speed = float(self.config["speed"])
-            except (ValueError, KeyError):
-                pass
+        if self.strip is None:
+            self.configure(self.config)
 
         # Set the background colour
-        canvas.set_colour(background_colour)
-
-        scroll_speed = 1000.0 / speed
+        canvas.set_colour(self.background_colour)
 
-        text_size = canvas.get_text_size(text)
-        text_width = text_size[0]
-        text_height = text_size[1]
+        scroll_speed = 1000.0 / self.speed
 
         # Total time to traverse the screen =
         # (border right + border left + surface width + text width in pixels) * time per pixel
         offscreen_buffer = 5
-        time_on_screen = (offscreen_buffer * 2 + text_width + w) * scroll_speed
+        time_on_screen = (offscreen_buffer * 2 + self.text_width + w) * scroll_speed
 
         # Work out what fraction of the duration we are the way through this, based on when we started
         position_delta = t % time_on_screen
         # The text starts at $offscreen_buffer + w (off the right edge), and then scrolls left
-        x_position = int(w + offscreen_buffer - position_delta / scroll_speed)
-
-        y_position = int((h - text_height) / 2)
-
-        canvas.draw_text(text, colour, x_position, y_position)
+        x_position = w + offscreen_buffer - position_delta / scroll_speed
+
+        y_position = int((h - self.text_height) / 2)
+
+        if self.smooth:
+            # Cell x_cell + j is blended from strip columns j and j + 1 (which
+            #  are text columns j - 1 and j), in proportion to how far the
+            #  text is between cells. Only the columns that are on the floor
+            #  are worked out
+            x_cell = int(math.floor(x_position))
+            fraction = x_position - x_cell
+            first = max(0, -x_cell)
+            last = min(self.text_width + 1, w - x_cell)
+            if first < last:
+                window = self.strip[first:last] * fraction + self.strip[first + 1:last + 1] * (1.0 - fraction)
+                canvas.set_pixels(numpy.rint(window).astype(numpy.uint8), x_cell + first, y_position)
+        else:
+            # Only the visible window of the strip is written, set_pixels()
+            #  clips it to the edge of the canvas before touching anything
+            x_cell = int(x_position)
+            canvas.set_pixels(self.strip[1:-1], x_cell, y_position)
 
         # Limit the frame rate
         self.clock.tick(25)
@@ -115,4 +161,3 @@ class ScrollingTextVisualisationPlugin(VisualisationPlugin):
         canvas.draw_text(text, colour, x_position, y_position)
 
         return canvas
-
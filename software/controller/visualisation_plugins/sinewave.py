@@ -1,44 +1,32 @@
-from VisualisationPlugin import VisualisationPlugin
+from ShaderVisualisationPlugin import ShaderVisualisationPlugin
 
-import pygame
 import math
+import numpy
 
 import logging
 
 from DDRPi import FloorCanvas
+from lib.floorcanvas import unpack_pixel_array
 
 
-class SineWaveVisualisationPlugin(VisualisationPlugin):
+class SineWaveVisualisationPlugin(ShaderVisualisationPlugin):
     logger = logging.getLogger(__name__)
 
     def __init__(self):
-        self.clock = pygame.time.Clock()
+        ShaderVisualisationPlugin.__init__(self)
 
     def configure(self, config):
         self.config = config
         self.logger.info("Config: %s" % config)
 
-    def draw_frame(self, canvas):
+    def shade(self, x, y, ticks):
 
-        # Limit the frame rate.
-        # This sleeps so that at least 25ms has passed since tick()
-        # was last called. It is a no-op if the loop is running slow
-        self.clock.tick(25)
-        # Draw whatever this plugin does
-        return self.draw_surface(canvas, pygame.time.get_ticks())
-
-    def draw_splash(self, canvas):
-        return self.draw_surface(canvas, 0)
-
-    def draw_surface(self, canvas):
-        return self.draw_surface(canvas, 0)
-
-    def draw_surface(self, canvas, ticks):
+        (w, h) = self.size
 
         # Get the background colour
         background_colour = FloorCanvas.GREEN
         wave_colour = FloorCanvas.WHITE
-        amplitude = (canvas.get_height() / 2) -1
+        amplitude = (h / 2) -1
         period = 18.0
 
         if self.config is not None:
@@ -66,32 +54,31 @@ class SineWaveVisualisationPlugin(VisualisationPlugin):
                 pass
 
 
-        # Set the background colour
-        canvas.set_colour(background_colour)
-
         phase_offset = 0.0
         frequency = 1.0
 
         phase_offset = 2 * math.pi * frequency * ticks / 1000
         # phase_offset = 0
 
-        w = canvas.get_width();
-        h = canvas.get_height()
-        previous_x = None
-        previous_y = None
-        for x in range(w):
-            phase = math.pi * 2 * x / period
-            y = h / 2.0 + amplitude * math.sin(phase_offset + phase)
-
-            if previous_y != None and previous_x != None:
-                # Draw line between previous point at this one
-                #self.surface.draw_line(int(round(previous_x)), int(round(previous_y)), int(round(x)), int(round(y)), FloorCanvas.WHITE)
-                canvas.draw_line(int(previous_x), int(previous_y), int(x), int(y), wave_colour)
-            #self.surface.set_pixel(int(x),int(y),FloorCanvas.WHITE)
-            previous_x = x
-            previous_y = y
-
-        return canvas
+        # The height of the wave in each column
+        phase = math.pi * 2 * numpy.arange(w) / period
+        wave_y = numpy.trunc(h / 2.0 + amplitude * numpy.sin(phase_offset + phase))
+
+        # Join each point of the wave up to the next one, like a line drawn
+        #  between them would, with the rows in between shared out between
+        #  the two columns
+        step = wave_y[1:] - wave_y[:-1]
+        gap = numpy.maximum(abs(step) - 1, 0)
+        towards_next = numpy.zeros(w)
+        towards_next[:-1] = numpy.sign(step) * (gap // 2)
+        towards_previous = numpy.zeros(w)
+        towards_previous[1:] = -numpy.sign(step) * (gap - gap // 2)
+        top = wave_y + numpy.minimum(0, numpy.minimum(towards_previous, towards_next))
+        bottom = wave_y + numpy.maximum(0, numpy.maximum(towards_previous, towards_next))
+
+        # The columns are along the first axis, the same as x and y
+        on_wave = (y >= top[:, numpy.newaxis]) & (y <= bottom[:, numpy.newaxis])
+        return unpack_pixel_array(numpy.where(on_wave, wave_colour, background_colour))
 
     def get_valid_arguments(self):
         args = ["background_colour",  # The background colour of the wave
@@ -3,10 +3,11 @@ __authors__ = ['Andrew Taylor']
 import random
 import time
 import pygame
-# Python comes with some color conversion methods.
-import colorsys
 # For Math things, what else
 import math
+import numpy
+
+from lib.fields import field_cache
 
 from VisualisationPlugin import VisualisationPlugin
 
@@ -18,10 +19,17 @@ import logging
 class SpeedingBlobsVisualisationPlugin(VisualisationPlugin):
     logger = logging.getLogger(__name__)
 
+    # The whole height map is drawn each frame
+    redraws_whole_frame = True
+
     speed_blobs = None
 
     blob_speeds = [500]
 
+    # The height map is kept between frames rather than being created
+    #  again every time
+    sheet = None
+
     def configure(self, config):
         self.config = config
         self.logger.info("Config: %s" % config)
@@ -155,8 +163,12 @@ class SpeedingBlobsVisualisationPlugin(VisualisationPlugin):
         # Fraction of the way through
         background_hue = (float(t) / float(t_background_period)) % 1
 
-        # Create a blank "sheet"
-        sheet = [[0 for y in range(canvas.get_height())] for x in range(canvas.get_width())]
+        # Clear the "sheet", making a new one only if the canvas size changes
+        if self.sheet is None or self.sheet.shape != canvas.get_size():
+            self.sheet = numpy.zeros(canvas.get_size(), dtype=float)
+            self.hsv = numpy.ones(canvas.get_size() + (3,), dtype=float)
+        sheet = self.sheet
+        sheet[...] = 0.0
 
         # Draw all of the blobs
         for blob in blobs:
@@ -242,25 +254,19 @@ class SpeedingBlobsVisualisationPlugin(VisualisationPlugin):
             #  relativity rubber-sheet analogy, but the other way up) then it doesn't matter that numbers
             #  wrap, we just want to apply a height map colour, with the bottom varying
 
-            for x in range(canvas.get_width()):
-                for y in range(canvas.get_height()):
-                    # Calculate how far away from the centre of the blob the centre of this pixel is
-                    x_d = x - blob_x
-                    y_d = y - blob_y
-                    distance_away = math.sqrt(x_d * x_d + y_d * y_d)
-                    decay = blob["decay"]
-                    # Only draw pixels in the decay zone
-                    if (distance_away < decay):
-                        # Calculate the scaling factor
-                        decay_amount = (math.cos(math.pi * distance_away / decay) + 1.0) / 2.0
-                        # This compounds any blobs on top of each other automatically
-                        sheet[x][y] += (blob_height * decay_amount)
+            # Calculate how far away from the centre of the blob the centre of each pixel is
+            distance_away = field_cache.distance(canvas.get_width(), canvas.get_height(), blob_x, blob_y,
+                                                 moving=True)
+            decay = blob["decay"]
+            # Only draw pixels in the decay zone
+            in_zone = distance_away < decay
+            # Calculate the scaling factor
+            decay_amount = (numpy.cos(math.pi * distance_away[in_zone] / decay) + 1.0) / 2.0
+            # This compounds any blobs on top of each other automatically
+            sheet[in_zone] += (blob_height * decay_amount)
 
         # Now translate the sheet height into colours
-        for x in range(canvas.get_width()):
-            for y in range(canvas.get_height()):
-                hue = background_hue + sheet[x][y]
-                rgb_colour = self.reformat(colorsys.hsv_to_rgb(hue, 1.0, 1.0))
-                canvas.set_pixel(x, y, rgb_colour)
+        self.hsv[..., 0] = background_hue + sheet
+        canvas.set_pixels(self.hsv, format="HSV")
 
         return canvas
@@ -1,21 +1,23 @@
-from VisualisationPlugin import VisualisationPlugin
+from ShaderVisualisationPlugin import ShaderVisualisationPlugin
 
 import pygame
-import colorsys
-import math, cmath
+import math
+import numpy
 
 from DDRPi import FloorCanvas
 from lib.controllers import ControllerInput
 import logging
 
 
-class SpinningWheelVisualisationPlugin(VisualisationPlugin):
+class SpinningWheelVisualisationPlugin(ShaderVisualisationPlugin):
     logger = logging.getLogger(__name__)
     VALID_MODES = ["CENTER", "EDGE_ROTATE"]
     VALID_COLOURS = ["FULL_COLOUR", "BLACK_AND_WHITE"]
 
+    colour_format = "HSV"
+
     def __init__(self):
-        self.clock = pygame.time.Clock()
+        ShaderVisualisationPlugin.__init__(self)
         self.logger.info("Initialising SpinningWheelVisualisationPlugin")
 
         # Defaults
@@ -52,16 +54,6 @@ class SpinningWheelVisualisationPlugin(VisualisationPlugin):
             except (AttributeError, KeyError):
                 pass
 
-    def draw_frame(self, canvas):
-
-        canvas = self.draw_surface(canvas, pygame.time.get_ticks())
-        # Limit the frame rate.
-        # This sleeps so that at least 25ms has passed since tick()
-        # was last called. It is a no-op if the loop is running slow
-        self.clock.tick(25)
-        # Draw whatever this plugin does
-        return canvas
-
     def handle_event(self, event):
 
         try:
@@ -87,15 +79,8 @@ class SpinningWheelVisualisationPlugin(VisualisationPlugin):
             self.logger.error("SpinningWheelVisualisationPlugin: %s" % ex)
 
 
-    def draw_splash(self, canvas):
-        return self.draw_surface(canvas, 0)
-
-    def draw_surface(self, canvas):
-        return self.draw_surface(canvas, 0)
-
-    def draw_surface(self, canvas, t):
-        w = canvas.get_width()
-        h = canvas.get_height()
+    def shade(self, x, y, t):
+        (w, h) = self.size
 
         x_centre_pixel = (w - 1) / 2.0
         y_centre_pixel = (h - 1) / 2.0
@@ -113,34 +98,27 @@ class SpinningWheelVisualisationPlugin(VisualisationPlugin):
             x_centre_pixel = (w - 1) / 2.0 + radius * math.cos(edge_rotate_angle)
             y_centre_pixel = (h - 1) / 2.0 + radius * math.sin(edge_rotate_angle)
 
-        for x in range(w):
-            for y in range(h):
-
-                x_diff = x - x_centre_pixel
-                y_diff = y - y_centre_pixel
-
-                # Get angle in the range [0,2pi]
-                angle = cmath.phase(complex(-x_diff, y_diff)) + math.pi
+        # Get the angle of every cell around the centre, going round the
+        #  other way from the field's angle, and starting from the opposite
+        #  side (which is what the phase of (-x, y) plus pi is). The centre
+        #  only stays put in CENTER mode, so only then is it worth caching
+        angle = -self.angle_around(x_centre_pixel, y_centre_pixel, moving=(self.mode == "EDGE_ROTATE"))
 
-                # Add a bit according to the phase
-                angle += self.speed * t / (1000.0 * 2.0 * math.pi)
+        # Add a bit according to the phase
+        angle = angle + self.speed * t / (1000.0 * 2.0 * math.pi)
 
-                # Get it back in the range [0,2pi]
-                (angle_div, angle_mod) = divmod(angle, 2.0 * math.pi)
+        # Get it back in the range [0,2pi]
+        angle_mod = numpy.mod(angle, 2.0 * math.pi)
 
-                # Default, full colour
-                hue = angle_mod / (2.0 * math.pi)
-                saturation = 1.0
-                value = 1.0
-                if self.colours == "BLACK_AND_WHITE":
-                    hue = 0.0
-                    saturation = 0.0
-                    value = angle_mod / (1.0 * math.pi)
+        hsv_colour = numpy.ones((w, h, 3))
+        # Default, full colour
+        hsv_colour[..., 0] = angle_mod / (2.0 * math.pi)
+        if self.colours == "BLACK_AND_WHITE":
+            hsv_colour[..., 0] = 0.0
+            hsv_colour[..., 1] = 0.0
+            hsv_colour[..., 2] = angle_mod / (1.0 * math.pi)
 
-                rgb_colour = self.reformat(colorsys.hsv_to_rgb(*(hue, saturation, value)))
-                canvas.set_pixel_tuple(x, y, rgb_colour)
-        #exit(1)
-        return canvas
+        return hsv_colour
 
     # Example, and following two functions taken from http://www.pygame.org/wiki/RGBColorConversion
 
@@ -153,7 +153,7 @@ class SpotlightVisualisationPlugin(VisualisationPlugin):
                 (r, g, b) = (0xFF, 0xFF, 0xFF)
                 adjusted_brightness = (r * brightness / 10.0, g * brightness / 10.0, b * brightness / 10.0)
 
-                canvas.draw_circle(x, y, radius, adjusted_brightness, adjusted_brightness)
+                canvas.draw_circle(x, y, radius, adjusted_brightness, adjusted_brightness, antialias=True)
 
         else:
             x = (w - 1) / 2.0
@@ -164,6 +164,6 @@ class SpotlightVisualisationPlugin(VisualisationPlugin):
             (r, g, b) = (0xFF, 0xFF, 0xFF)
             adjusted_brightness = (r * brightness / 10.0, g * brightness / 10.0, b * brightness / 10.0)
 
-            canvas.draw_circle(x, y, radius, adjusted_brightness, adjusted_brightness)
+            canvas.draw_circle(x, y, radius, adjusted_brightness, adjusted_brightness, antialias=True)
 
         return canvas
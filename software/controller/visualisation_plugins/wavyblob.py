@@ -1,41 +1,26 @@
-from VisualisationPlugin import VisualisationPlugin
+from ShaderVisualisationPlugin import ShaderVisualisationPlugin
 
-import pygame
 import colorsys
 import math
+import numpy
 
-from DDRPi import FloorCanvas
 import logging
 
 
-class WavyBlobVisualisationPlugin(VisualisationPlugin):
+class WavyBlobVisualisationPlugin(ShaderVisualisationPlugin):
     logger = logging.getLogger(__name__)
+    colour_format = "HSV"
 
     def __init__(self):
-        self.clock = pygame.time.Clock()
+        ShaderVisualisationPlugin.__init__(self)
         self.logger.info("Initialising WavyBlobVisualisationPlugin")
 
     def configure(self, config):
         self.config = config
         self.logger.info("Config: %s" % config)
 
-    def draw_frame(self, canvas):
-        # Limit the frame rate.
-        # This sleeps so that at least 25ms has passed since tick()
-        # was last called. It is a no-op if the loop is running slow
-        self.clock.tick(25)
-        # Draw whatever this plugin does
-        return self.draw_surface(canvas, pygame.time.get_ticks())
-
-    def draw_splash(self, canvas):
-        return self.draw_surface(canvas, 0)
-
-    def draw_surface(self, canvas):
-        return self.draw_surface(canvas, 0)
-
-    def draw_surface(self, canvas, t):
-        w = canvas.get_width()
-        h = canvas.get_height()
+    def shade(self, x, y, t):
+        (w, h) = self.size
 
         x_centre_pixel = w / 2.0
         y_centre_pixel = h / 2.0
@@ -56,31 +41,19 @@ class WavyBlobVisualisationPlugin(VisualisationPlugin):
 
         max_distance_away = math.sqrt(w * w + h * h) / 4.0
 
-        for x in range(0, w):
-            for y in range(0, h):
-
-                hsv_colour = []
-                for i in range(0, 3):
-                    hsv_colour.append(0x00)
-                hsv_colour[1] = starting_colour_hsv[1]
-                hsv_colour[2] = starting_colour_hsv[2]
-
-                x_delta = math.fabs(x - x_this_centre_pixel)
-                y_delta = math.fabs(y - y_this_centre_pixel)
-
-                distance_away = math.sqrt(x_delta * x_delta + y_delta * y_delta)
-
-                t_period = 4000.0
-                t_adjustment = t * 2.0 * math.pi / t_period
-                multiplier = (math.sin(t_adjustment) + 1.0) / 2.0
+        # How far each cell is from the centre, which moves every frame
+        distance_away = self.distance_from(x_this_centre_pixel, y_this_centre_pixel, moving=True)
 
-                # We vary only the hue between 0.0 (red) and 1/3 (green)
-                hsv_colour[0] = 0.33 * ((math.sin(distance_away / 3.0 - t_adjustment) + 1.0) / 2.0)
+        t_period = 4000.0
+        t_adjustment = t * 2.0 * math.pi / t_period
 
-                rgb_colour = self.reformat(colorsys.hsv_to_rgb(*hsv_colour))
-                canvas.set_pixel_tuple(x, y, rgb_colour)
+        hsv_colour = numpy.empty((w, h, 3))
+        # We vary only the hue between 0.0 (red) and 1/3 (green)
+        hsv_colour[..., 0] = 0.33 * ((numpy.sin(distance_away / 3.0 - t_adjustment) + 1.0) / 2.0)
+        hsv_colour[..., 1] = starting_colour_hsv[1]
+        hsv_colour[..., 2] = starting_colour_hsv[2]
 
-        return canvas
+        return hsv_colour
 
     # Example, and following two functions taken from http://www.pygame.org/wiki/RGBColorConversion
 